@@ -10,17 +10,43 @@ USE_IMPROVED_AI_SCORING = True  # Using improved AI scoring (the working one)
 # AI Threshold Configuration  
 AI_RELEVANCE_THRESHOLD = 5  # Very low threshold to get results for testing
 
+# Cascade: the rule-based scorer pre-screens posts, only the best candidates go to OpenAI
+# Off by default: it caps the leads a search can return, turn it on once the audit numbers look right
+USE_CASCADE = False
+CASCADE_TOP_K = 60  # Candidates per filter call sent to OpenAI when no result count is given
+CASCADE_CANDIDATES_PER_RESULT = 3  # With a result count, send up to this many candidates per requested lead
+CASCADE_MIN_SCORE = 10  # Rule-based score a candidate needs (posts with no keyword/struggle hits score below this)
+CASCADE_AUDIT_SAMPLE = 5  # Screened-out posts sent anyway to measure what the pre-screen misses
+
+# Multi-core scoring (process pool) for large post batches
+USE_PROCESS_POOL_SCORING = True
+PROCESS_POOL_MIN_POSTS = 2000  # Smaller batches score faster in-process than pickled to workers
+PROCESS_POOL_WORKERS = None  # None = min(4, CPU count); never used on a single core
+
 def get_ai_config():
     """Get current AI configuration"""
     return {
         "use_openai": USE_OPENAI,
         "use_improved_scoring": USE_IMPROVED_AI_SCORING,
-        "threshold": AI_RELEVANCE_THRESHOLD
+        "threshold": AI_RELEVANCE_THRESHOLD,
+        "use_cascade": USE_CASCADE,
+        "cascade_top_k": CASCADE_TOP_K,
+        "cascade_candidates_per_result": CASCADE_CANDIDATES_PER_RESULT,
+        "cascade_min_score": CASCADE_MIN_SCORE,
+        "cascade_audit_sample": CASCADE_AUDIT_SAMPLE,
+        "use_process_pool": USE_PROCESS_POOL_SCORING,
+        "process_pool_min_posts": PROCESS_POOL_MIN_POSTS,
+        "process_pool_workers": PROCESS_POOL_WORKERS
     }
 
-def set_ai_config(use_openai: bool = None, use_improved: bool = None, threshold: int = None):
+def set_ai_config(use_openai: bool = None, use_improved: bool = None, threshold: int = None,
+                  use_process_pool: bool = None, process_pool_min_posts: int = None,
+                  use_cascade: bool = None, cascade_top_k: int = None, cascade_min_score: int = None,
+                  cascade_audit_sample: int = None, cascade_candidates_per_result: int = None):
     """Update AI configuration (for testing purposes)"""
     global USE_OPENAI, USE_IMPROVED_AI_SCORING, AI_RELEVANCE_THRESHOLD
+    global USE_PROCESS_POOL_SCORING, PROCESS_POOL_MIN_POSTS
+    global USE_CASCADE, CASCADE_TOP_K, CASCADE_MIN_SCORE, CASCADE_AUDIT_SAMPLE, CASCADE_CANDIDATES_PER_RESULT
     
     if use_openai is not None:
         USE_OPENAI = use_openai
@@ -28,5 +54,19 @@ def set_ai_config(use_openai: bool = None, use_improved: bool = None, threshold:
         USE_IMPROVED_AI_SCORING = use_improved
     if threshold is not None:
         AI_RELEVANCE_THRESHOLD = threshold
+    if use_process_pool is not None:
+        USE_PROCESS_POOL_SCORING = use_process_pool
+    if process_pool_min_posts is not None:
+        PROCESS_POOL_MIN_POSTS = process_pool_min_posts
+    if use_cascade is not None:
+        USE_CASCADE = use_cascade
+    if cascade_top_k is not None:
+        CASCADE_TOP_K = cascade_top_k
+    if cascade_min_score is not None:
+        CASCADE_MIN_SCORE = cascade_min_score
+    if cascade_audit_sample is not None:
+        CASCADE_AUDIT_SAMPLE = cascade_audit_sample
+    if cascade_candidates_per_result is not None:
+        CASCADE_CANDIDATES_PER_RESULT = cascade_candidates_per_result
     
     return get_ai_config()
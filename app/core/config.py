@@ -6,12 +6,66 @@ class Settings(BaseSettings):
     reddit_client_secret: str
     reddit_user_agent: str = "hope-mvp/0.1 by Horror-Subject-4980"
     
+    # Reddit rate limiting (shared token bucket per credential)
+    reddit_rate_limit_per_second: float = 5.0
+    reddit_rate_limit_burst: int = 10
+    reddit_rate_limit_backend: str = "memory"  # "memory" (per process) or "sqlite" (shared by all workers)
+    reddit_rate_limit_db_path: str = "./reddit_rate_limit.db"
+    reddit_http_max_connections: int = 10  # Connections of the shared async OAuth API client
+    reddit_http_retries: int = 3  # Retries of a page on 429/5xx, with exponential backoff (Retry-After wins)
+    reddit_http_backoff_factor: float = 0.5  # Seconds before the first retry, doubled after each one
+    
+    # Local post store (repeated searches read recent listings from disk)
+    post_store_enabled: bool = True
+    post_store_path: str = "./reddit_post_store.db"
+    post_store_max_age_days: int = 30  # Posts not re-fetched for this long are pruned
+    post_store_prune_interval_hours: float = 6.0
+    
+    # Background pre-warming of TIERED_SUBREDDIT_MAPPINGS listings into the post store
+    prewarm_enabled: bool = True
+    prewarm_interval_seconds: int = 600  # Tier 1 cadence; lower tiers are refreshed less often
+    prewarm_jitter: float = 0.2  # +/- fraction of the interval
+    prewarm_listing_depth: int = 500  # Posts kept warm per listing
+    prewarm_min_free_tokens: float = 5.0  # Leave this much rate budget for live searches
+    prewarm_lease_seconds: int = 120  # Only the worker holding this lease (in the post store) pre-warms
+    
+    # Search pipeline (blocking stages run off the event loop)
+    search_executor_workers: int = 32  # Threads shared by all blocking search stages
+    search_db_concurrency: int = 8  # Concurrent limits/plan/record stages
+    search_fetch_concurrency: int = 16  # Searches fetching from Reddit at once
+    search_filter_concurrency: int = 4  # Searches scoring posts at once (CPU-bound)
+    search_job_workers: int = 4  # Background search jobs running at once per process
+    search_job_retention_hours: int = 24  # Finished jobs are purged after this long
+    search_job_heartbeat_seconds: int = 60  # Workers touch their active jobs this often
+    search_job_stale_seconds: int = 300  # Active jobs without a heartbeat this long are marked failed
+    
+    # Search result cache (filtered lead lists per normalized search)
+    result_cache_enabled: bool = True
+    result_cache_ttl_hours: float = 24.0  # Hard TTL: older results are never served
+    result_cache_soft_ttl_hours: float = 6.0  # Older results are served stale and refreshed in the background
+    result_cache_max_entries: int = 500
+    result_cache_max_bytes: int = 64 * 1024 * 1024  # Byte budget (pickled size of the cached leads)
+    result_cache_backend: str = "sqlite"  # "sqlite" (shared by workers, survives restarts) or "memory"
+    result_cache_path: str = "./reddit_result_cache.db"
+    result_cache_eviction_interval_seconds: int = 300
+    
     # OpenAI Configuration
     openai_api_key: Optional[str] = None
     openai_model: str = "gpt-3.5-turbo"
     openai_temperature: float = 0.3
     openai_max_tokens: int = 1000
-    
+    openai_batch_concurrency: int = 8  # Post-analysis batches in flight at once
+    openai_batch_max_posts: int = 40
+    openai_batch_prompt_tokens: int = 6000  # Target estimated input tokens per batch request
+    openai_batch_post_tokens: int = 300  # Longer post bodies are cut around the problem's keywords
+    openai_batch_output_tokens: int = 3500  # Answer budget per request (caps posts per batch)
+    llm_cache_enabled: bool = True  # Reuse OpenAI analyses/summaries of the same post for the same problem
+    llm_cache_path: str = "./reddit_llm_cache.db"
+    llm_cache_ttl_hours: float = 7 * 24.0
+    llm_cache_max_entries: int = 200000
+    llm_cache_max_bytes: int = 256 * 1024 * 1024
+    llm_cache_eviction_interval_seconds: int = 300
+
     class Config:
         env_file = ".env"
 
@@ -0,0 +1,90 @@
+"""
+Application service container
+Long-lived service instances built once in the startup event and injected into
+routes through FastAPI dependencies, instead of constructing a RedditService (PRAW
+client, rate limiter, ingestor) and a FastLeadFilter (AIEnhancer, SummaryService
+with its OpenAI client) on every search. The instances keep no per-request state,
+so one of each serves all concurrent searches.
+"""
+
+import asyncio
+import threading
+import time
+import logging
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceContainer:
+    """Application-scoped services, created by start() (or lazily on first use outside the app)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reddit_service = None
+        self._lead_filter = None
+        self.started_at: Optional[float] = None
+        self.startup_ms = 0.0
+        self.warmed_up = False
+
+    def start(self):
+        """Build every service once (idempotent)"""
+        with self._lock:
+            if self.started_at is not None:
+                return
+            started = time.perf_counter()
+            from app.services.reddit_service import RedditService
+            from app.services.fast_lead_filter import FastLeadFilter
+            import app.services.scoring_profiles  # noqa: F401 (profiles are compiled at import)
+
+            self._reddit_service = RedditService()
+            self._lead_filter = FastLeadFilter()
+            self.startup_ms = (time.perf_counter() - started) * 1000
+            self.started_at = time.time()
+            logger.info(f"📦 SERVICE CONTAINER: services ready in {self.startup_ms:.0f}ms")
+
+    async def warm_up(self, timeout: float = 5.0):
+        """Open the shared Reddit HTTP client and fetch the OAuth token before the first search"""
+        from app.services.reddit_ingestion import get_async_client, _get_access_token
+        get_async_client()
+        try:
+            await asyncio.wait_for(_get_access_token(), timeout=timeout)
+            self.warmed_up = True
+            logger.info("🔥 SERVICE CONTAINER: Reddit client warmed up")
+        except Exception as e:
+            # Not fatal: the first search fetches the token instead
+            logger.warning(f"⚠️ SERVICE CONTAINER: Warm-up failed ({e}), continuing cold")
+
+    @property
+    def reddit_service(self):
+        if self._reddit_service is None:
+            self.start()
+        return self._reddit_service
+
+    @property
+    def lead_filter(self):
+        if self._lead_filter is None:
+            self.start()
+        return self._lead_filter
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "started": self.started_at is not None,
+            "started_at": self.started_at,
+            "startup_ms": round(self.startup_ms, 1),
+            "warmed_up": self.warmed_up
+        }
+
+
+# Global container shared by the whole application
+container = ServiceContainer()
+
+
+def get_reddit_service():
+    """FastAPI dependency: the shared RedditService"""
+    return container.reddit_service
+
+
+def get_lead_filter():
+    """FastAPI dependency: the shared FastLeadFilter"""
+    return container.lead_filter
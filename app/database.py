@@ -72,11 +72,36 @@ class SearchMetrics(Base):
     cost = Column(Float, default=0.0)
     model_used = Column(String, nullable=True)
     search_duration_ms = Column(Integer, nullable=True)
+    llm_cache_hits = Column(Integer, default=0)  # Post analyses/summaries served from the LLM response cache
+    tokens_saved = Column(Integer, default=0)
+    cost_saved = Column(Float, default=0.0)
     created_at = Column(DateTime, default=datetime.utcnow)
-    
+
     # Relationships
     user = relationship("User", backref="search_metrics")
 
+class SearchJob(Base):
+    __tablename__ = "search_jobs"
+    
+    id = Column(String, primary_key=True, index=True)  # uuid4 hex
+    user_id = Column(String, nullable=True, index=True)  # User id or anonymous session id
+    status = Column(String, nullable=False, default="queued")  # queued, running, completed, failed, cancelled
+    request_json = Column(Text, nullable=False)  # The LeadSearchRequest
+    tier_info_json = Column(Text, nullable=True)
+    leads_json = Column(Text, nullable=True)  # Leads found so far (final ranking once completed)
+    result_json = Column(Text, nullable=True)  # Final "complete" payload (metrics, remaining quota)
+    error = Column(Text, nullable=True)
+    subreddits_done = Column(Integer, default=0)
+    subreddits_total = Column(Integer, default=0)
+    posts_scanned = Column(Integer, default=0)
+    leads_found = Column(Integer, default=0)
+    cancel_requested = Column(Boolean, default=False)  # Set by DELETE; the running worker polls it
+    worker_id = Column(String, nullable=True)  # host:pid of the worker running the job
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 # Create tables
 def create_tables():
     Base.metadata.create_all(bind=engine)
@@ -99,7 +124,16 @@ def migrate_database():
             print("✅ MIGRATION: Successfully added 'last_search_time' column")
         else:
             print("✅ MIGRATION: Column 'last_search_time' already exists")
-            
+
+        # LLM response cache savings on search_metrics
+        metrics_columns = [col['name'] for col in inspector.get_columns('search_metrics')]
+        for column, ddl in (("llm_cache_hits", "INTEGER DEFAULT 0"), ("tokens_saved", "INTEGER DEFAULT 0"), ("cost_saved", "REAL DEFAULT 0.0")):
+            if column not in metrics_columns:
+                print(f"🔄 MIGRATION: Adding missing column '{column}' to search_metrics table...")
+                db.execute(text(f"ALTER TABLE search_metrics ADD COLUMN {column} {ddl}"))
+                db.commit()
+                print(f"✅ MIGRATION: Successfully added '{column}' column")
+
     except Exception as e:
         print(f"⚠️ MIGRATION WARNING: {e}")
         db.rollback()
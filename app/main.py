@@ -3,6 +3,15 @@ from fastapi.middleware.cors import CORSMiddleware
 import logging
 from app.routers import leads, auth, admin
 from app.database import init_database
+from app.core.container import container
+from app.services.reddit_ingestion import close_async_client
+from app.services.prewarm_scheduler import prewarm_scheduler
+from app.services.scoring_pool import shutdown_scoring_pool
+from app.services.search_pipeline import search_pipeline
+from app.services.search_jobs import search_job_manager
+from app.services.result_cache import result_cache
+from app.services.post_store import start_background_prune, stop_background_prune
+from app.services.llm_cache import llm_cache
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -33,6 +42,25 @@ app.include_router(admin.router, prefix="/api/admin", tags=["admin"])
 async def startup_event():
     init_database()
     logger.info("Database initialized successfully")
+    container.start()
+    await container.warm_up()
+    prewarm_scheduler.start()
+    result_cache.start_background_eviction()
+    start_background_prune()
+    llm_cache.start_background_eviction()
+    search_job_manager.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await search_job_manager.stop()
+    await prewarm_scheduler.stop()
+    await result_cache.stop_background_eviction()
+    await stop_background_prune()
+    await llm_cache.stop_background_eviction()
+    await close_async_client()
+    logger.info("Reddit HTTP client closed")
+    search_pipeline.shutdown()
+    shutdown_scoring_pool()
 
 @app.get("/")
 async def root():
@@ -1,7 +1,8 @@
 from fastapi import APIRouter, HTTPException, Depends
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
+import json
 import logging
 import time
 from sqlalchemy.orm import Session
@@ -9,9 +10,12 @@ from app.services.reddit_service import RedditService
 from app.services.fast_lead_filter import FastLeadFilter
 from app.services.business_mapping_hyperfocus import get_business_options as get_business_mapping_options, get_industry_options as get_industry_mapping_options         
 from app.services.tiered_subreddit_mapping import get_tiered_subreddits, get_tier_info
+from app.core.container import get_reddit_service, get_lead_filter
+from app.services.search_pipeline import search_pipeline, load_user_limits, plan_search, record_search
+from app.services.search_jobs import search_job_manager, get_job, cancel_or_delete_job
 from app.models.lead import Lead
-from app.database import get_db, User, SearchMetrics
-from app.utils.cost_calculator import get_posts_to_scrape, validate_user_limits, get_user_usage_summary
+from app.database import get_db, User
+from app.utils.cost_calculator import get_posts_to_scrape, get_user_usage_summary
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -69,11 +73,8 @@ async def debug_test():
             "traceback": traceback.format_exc()
         }
 
-@router.post("/search", response_model=LeadSearchResponse)
-async def search_leads(request: LeadSearchRequest, db: Session = Depends(get_db)):
-    """Search for leads based on business/industry selection and problem description"""
-    logger.info(f"Received lead search request: business='{request.business}', industry='{request.industry}', problem='{request.problem_description}', result_count={request.result_count}")
-    
+def validate_search_request(request: LeadSearchRequest):
+    """Shared request validation for the search endpoints"""
     # Validate that either business or industry is selected (but not both)
     if not request.business and not request.industry:
         raise HTTPException(status_code=400, detail="Either business or industry must be selected")
@@ -87,125 +88,57 @@ async def search_leads(request: LeadSearchRequest, db: Session = Depends(get_db)
     # Validate result count
     if request.result_count < 1 or request.result_count > 150:
         raise HTTPException(status_code=400, detail="Result count must be between 1 and 150")
+
+@router.post("/search", response_model=LeadSearchResponse)
+async def search_leads(request: LeadSearchRequest,
+                       reddit_service: RedditService = Depends(get_reddit_service),
+                       lead_filter: FastLeadFilter = Depends(get_lead_filter)):
+    """Search for leads based on business/industry selection and problem description"""
+    logger.info(f"Received lead search request: business='{request.business}', industry='{request.industry}', problem='{request.problem_description}', result_count={request.result_count}")
+    validate_search_request(request)
     
-    # Check user usage if user_id is provided
-    results_remaining = 150  # Default for anonymous users
-    posts_remaining = 2250  # Default for anonymous users
+    # Calculate posts needed using cost calculator (15:1 ratio)
     posts_needed = get_posts_to_scrape(request.result_count)
     
-    if request.user_id:
-        try:
-            user = db.query(User).filter(User.id == int(request.user_id)).first()
-            if user:
-                # Validate user limits using cost calculator
-                is_valid, error_msg, _, remaining_results, remaining_posts = validate_user_limits(
-                    user.results_used, user.posts_analyzed, request.result_count
-                )
-                
-                if not is_valid:
-                    raise HTTPException(status_code=400, detail=error_msg)
-                
-                results_remaining = remaining_results
-                posts_remaining = remaining_posts
-        except (ValueError, TypeError):
-            # Invalid user_id format, continue as anonymous user
-            pass
+    # Stage "limits": check user usage if user_id is provided
+    limit_error, results_remaining, posts_remaining = await search_pipeline.run_blocking(
+        "limits", load_user_limits, request.user_id, request.result_count
+    )
+    if limit_error:
+        raise HTTPException(status_code=400, detail=limit_error)
     
     try:
-        # Initialize services
-        reddit_service = RedditService()
-        lead_filter = FastLeadFilter()
-        
-        # Get tiered subreddits for the business type based on request tracking
         business_type = request.business or request.industry
         
-        # Increment user request count for tier switching (business-specific counter)
-        from app.services.tiered_subreddit_mapping import increment_user_request_count
-        user_id = request.user_id or "anonymous"
-        tier_key = f"{user_id}_{business_type}"  # Business-specific counter
-        request_number = increment_user_request_count(tier_key)
-        
-        print(f"🚀 TIERED ROUTER DEBUG: Request #{request_number} for '{business_type}' (key: {tier_key})")
-        
-        # Get tier information for response (tier switching enabled)
-        tier_info = get_tier_info(business_type, request_number)
-        subreddits = tier_info["subreddits"]
-        
-        print(f"🚀 TIERED ROUTER DEBUG: Got subreddits: {subreddits}")
-        logger.info(f"Tiered Search: Searching in {len(subreddits)} subreddits: {subreddits} (Tier {tier_info['tier']})")
+        # Stage "plan": tier switching and subreddits (services come from the app container)
+        plan = await search_pipeline.run_blocking(
+            "plan", plan_search, business_type, request.user_id, posts_needed, reddit_service, lead_filter
+        )
+        tier_info = plan.tier_info
         
         # Tier quality notice
         quality_notice = f" ({tier_info['quality_note']})"
         
-        # Always fetch fresh results (no cache)
-        posts_per_sub = max(1, posts_needed // len(subreddits))  # Distribute posts across subreddits
-        logger.info(f"🔄 Fetching fresh results from Reddit: {posts_needed} total posts ({posts_per_sub} per sub)")
-        posts = reddit_service.fetch_posts_from_multiple_subreddits(
-            subreddits, 
-            query=request.problem_description,
-            limit_per_sub=posts_per_sub,  # Dynamic limit based on 15:1 ratio
-            time_range="all_time"  # Fixed time range for beta
-        )
-        
-        logger.info(f"Fetched {len(posts)} total posts from Reddit")
-        
-        # Filter posts using fast lead filter
-        leads, filter_metrics = lead_filter.filter_posts(posts, request.problem_description, business_type, request_number=request_number)
+        # Stages "fetch" + "filter": result cache, else shared with identical in-flight searches
+        search = await search_pipeline.fetch_and_filter(plan, request.problem_description, request.result_count)
+        leads, filter_metrics = search.leads, search.filter_metrics
+        if search.cached:
+            logger.info(f"⚡ Served {len(leads)} {'stale ' if search.stale else ''}cached leads ({search.age_hours:.2f} hours old)")
+        elif search.reused_posts:
+            logger.info(f"♻️ Reused {search.reused_posts} already scored posts from a shallower cached search")
+        elif search.shared:
+            logger.info(f"🤝 Joined an identical in-flight search ({len(leads)} leads)")
         if filter_metrics:
             logger.info(f"📊 Filter metrics: {filter_metrics}")
         
         # Target custom result count (AI will return best available)
         target_leads = leads[:request.result_count]
+        final_results_count = len(target_leads)
         
-        result_age_hours = 0.0  # Always fresh (no cache)
-        
-        # Update user usage tracking - deduct exactly what was requested
-        final_results_count = len(target_leads if 'target_leads' in locals() else leads)
+        result_age_hours = search.age_hours if search.cached or search.reused_posts else 0.0  # True age of cached results
         
         # Track detailed metrics for this search
         search_start_time = time.time()
-        total_tokens_used = 0
-        total_cost = 0.0
-        
-        # Try to extract OpenAI metrics from the lead filter
-        try:
-            # Get metrics from OpenAI service if available
-            if hasattr(lead_filter, 'openai_service') and lead_filter.openai_service:
-                # This would need to be implemented in the OpenAI service to return cumulative metrics
-                pass
-        except Exception as e:
-            logger.warning(f"Could not extract OpenAI metrics: {e}")
-        
-        if request.user_id:
-            try:
-                # Try to find user in database first (for authenticated users)
-                user = db.query(User).filter(User.id == int(request.user_id)).first()
-                if user:
-                    # Update both results and posts analyzed - deduct what was REQUESTED, not what was returned
-                    user.results_used += request.result_count  # Deduct what user requested
-                    user.posts_analyzed += posts_needed  # Track actual posts analyzed
-                    user.total_tokens_used += total_tokens_used
-                    user.total_cost += total_cost
-                    db.commit()
-                    
-                    # Recalculate remaining after update
-                    results_remaining = 150 - user.results_used
-                    posts_remaining = 2250 - user.posts_analyzed
-                    
-                    logger.info(f"Updated authenticated user {user.id} usage: {user.results_used}/150 results, {user.posts_analyzed}/2250 posts analyzed (deducted {request.result_count} requested results)")
-                else:
-                    # Anonymous user - return default usage data (frontend will handle tracking)
-                    logger.info(f"Anonymous user {request.user_id} - usage tracking handled by frontend")
-                    results_remaining = 150  # Default for anonymous users
-                    posts_remaining = 2250   # Default for anonymous users
-            except (ValueError, TypeError):
-                # Invalid user ID format - treat as anonymous
-                logger.info(f"Invalid user ID format {request.user_id} - treating as anonymous")
-                results_remaining = 150
-                posts_remaining = 2250
-        
-        # Create detailed search metrics record
-        search_duration_ms = int((time.time() - search_start_time) * 1000)
         
         # Use filter metrics if available, otherwise fallback to default values
         if filter_metrics:
@@ -219,37 +152,33 @@ async def search_leads(request: LeadSearchRequest, db: Session = Depends(get_db)
             model_used = "unknown"
             posts_analyzed = posts_needed
         
-        try:
-            search_metrics = SearchMetrics(
-                user_id=int(request.user_id) if request.user_id and request.user_id.isdigit() else None,
-                user_session_id=request.user_id if not (request.user_id and request.user_id.isdigit()) else None,
-                problem_description=request.problem_description,
-                business_type=business_type,
-                result_count_requested=request.result_count,
-                result_count_returned=final_results_count,
-                posts_scraped=len(posts) if 'posts' in locals() else 0,
-                posts_analyzed=posts_analyzed,
-                tokens_used=tokens_used,
-                cost=cost,
-                model_used=model_used,
-                search_duration_ms=search_duration_ms
-            )
-            db.add(search_metrics)
-            db.commit()
-            logger.info(f"📊 Search metrics recorded: {final_results_count} results, {posts_analyzed} posts, {tokens_used} tokens, ${cost:.4f}")
-        except Exception as e:
-            logger.error(f"Failed to record search metrics: {e}")
-            # Don't fail the search if metrics recording fails
-        
-        # Add timestamp information
-        current_timestamp = time.time()
+        # Stage "record": usage deduction + search metrics row
+        search_metrics = {
+            "problem_description": request.problem_description,
+            "business_type": business_type,
+            "result_count_requested": request.result_count,
+            "result_count_returned": final_results_count,
+            "posts_scraped": search.posts_scraped,
+            "posts_analyzed": posts_analyzed,
+            "tokens_used": tokens_used,
+            "cost": cost,
+            "model_used": model_used,
+            "search_duration_ms": int((time.time() - search_start_time) * 1000),
+            "llm_cache_hits": (filter_metrics or {}).get("llm_cache_hits", 0),
+            "tokens_saved": (filter_metrics or {}).get("tokens_saved", 0),
+            "cost_saved": (filter_metrics or {}).get("cost_saved", 0.0)
+        }
+        results_remaining, posts_remaining = await search_pipeline.run_blocking(
+            "record", record_search, request.user_id, request.result_count, posts_needed,
+            results_remaining, posts_remaining, search_metrics
+        )
         
         selection_type = request.business or request.industry
         return LeadSearchResponse(
-            leads=target_leads if 'target_leads' in locals() else leads,
+            leads=target_leads,
             total_found=final_results_count,
             message=f"Found {final_results_count} high-quality leads for '{selection_type}' with problem: '{request.problem_description}'{quality_notice}",
-            timestamp=current_timestamp,
+            timestamp=search.fetched_at,  # When the results were fetched (earlier for cached results)
             result_age_hours=result_age_hours,
             tier_info=tier_info,
             results_remaining=results_remaining,
@@ -259,9 +188,14 @@ async def search_leads(request: LeadSearchRequest, db: Session = Depends(get_db)
                 "tokens_used": tokens_used,
                 "cost": round(cost, 4),
                 "model_used": model_used,
-                "search_duration_ms": search_duration_ms,
-                "posts_scraped": len(posts) if 'posts' in locals() else 0,
-                "posts_analyzed": posts_analyzed
+                "search_duration_ms": search_metrics["search_duration_ms"],
+                "posts_scraped": search.posts_scraped,
+                "posts_analyzed": posts_analyzed,
+                "cached": search.cached,
+                "stale": search.stale,
+                "reused_posts": search.reused_posts,
+                "llm_cache_hits": search_metrics["llm_cache_hits"],
+                "tokens_saved": search_metrics["tokens_saved"]
             }
         )
         
@@ -269,6 +203,79 @@ async def search_leads(request: LeadSearchRequest, db: Session = Depends(get_db)
         logger.error(f"Error in lead search: {e}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+def format_search_event(event: str, data: dict, stream_format: str = "ndjson") -> str:
+    """One streaming event as an NDJSON line or a Server-Sent Event"""
+    payload = json.dumps({"event": event, **data})
+    if stream_format == "sse":
+        return f"event: {event}\ndata: {payload}\n\n"
+    return payload + "\n"
+
+@router.post("/search/stream")
+async def search_leads_stream(request: LeadSearchRequest,
+                              stream_format: str = "ndjson",
+                              reddit_service: RedditService = Depends(get_reddit_service),
+                              lead_filter: FastLeadFilter = Depends(get_lead_filter)):
+    """
+    Streaming variant of /search: leads are sent as soon as each subreddit's batch is scored.
+    Events: started, leads, subreddit_done (progress), then complete (final ranking + metrics) or error.
+    stream_format: "ndjson" (default) or "sse" (Server-Sent Events).
+    """
+    logger.info(f"Received streaming lead search request: business='{request.business}', industry='{request.industry}', problem='{request.problem_description}', result_count={request.result_count}")
+    validate_search_request(request)
+    if stream_format not in ("ndjson", "sse"):
+        raise HTTPException(status_code=400, detail="stream_format must be 'ndjson' or 'sse'")
+    
+    posts_needed = get_posts_to_scrape(request.result_count)
+    limit_error, results_remaining, posts_remaining = await search_pipeline.run_blocking(
+        "limits", load_user_limits, request.user_id, request.result_count
+    )
+    if limit_error:
+        raise HTTPException(status_code=400, detail=limit_error)
+    
+    business_type = request.business or request.industry
+    plan = await search_pipeline.run_blocking(
+        "plan", plan_search, business_type, request.user_id, posts_needed, reddit_service, lead_filter
+    )
+    
+    async def events():
+        async for event, data in search_pipeline.stream_search(
+            plan, request.problem_description, request.result_count, request.user_id,
+            posts_needed, results_remaining, posts_remaining
+        ):
+            yield format_search_event(event, data, stream_format)
+    
+    media_type = "text/event-stream" if stream_format == "sse" else "application/x-ndjson"
+    return StreamingResponse(events(), media_type=media_type, headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@router.post("/search-jobs", status_code=202)
+async def create_search_job(request: LeadSearchRequest,
+                            reddit_service: RedditService = Depends(get_reddit_service),
+                            lead_filter: FastLeadFilter = Depends(get_lead_filter)):
+    """Start a search in the background and return its job id at once (poll GET /search-jobs/{job_id})"""
+    logger.info(f"Received search job request: business='{request.business}', industry='{request.industry}', problem='{request.problem_description}', result_count={request.result_count}")
+    validate_search_request(request)
+    job_id = await search_job_manager.submit(request.model_dump(), reddit_service, lead_filter)
+    return {"job_id": job_id, "status": "queued", "poll_url": f"/api/leads/search-jobs/{job_id}"}
+
+@router.get("/search-jobs/{job_id}")
+async def get_search_job(job_id: str, include_leads: bool = True):
+    """Status, progress, partial (or final) leads and metrics of a search job"""
+    job = await search_pipeline.run_blocking("jobs", get_job, job_id, include_leads)
+    if not job:
+        raise HTTPException(status_code=404, detail="Search job not found")
+    return job
+
+@router.delete("/search-jobs/{job_id}")
+async def delete_search_job(job_id: str):
+    """Cancel a queued/running search job (stops the scrape), or delete a finished one"""
+    job = await search_pipeline.run_blocking("jobs", cancel_or_delete_job, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Search job not found")
+    if not job.get("deleted"):
+        job["cancelled_here"] = search_job_manager.cancel_local(job_id)
+        job["status"] = "cancelling"
+    return job
+
 @router.get("/business-options")
 async def get_business_options():
     """Get available business options"""
@@ -399,10 +406,13 @@ async def debug_tiered_system():
 async def debug_cache_stats():
     """Debug endpoint to check cache statistics"""
     try:
+        from app.services.result_cache import result_cache
+        from app.services.llm_cache import llm_cache
         stats = result_cache.get_cache_stats()
         return {
             "status": "success",
             "cache_stats": stats,
+            "llm_cache_stats": llm_cache.get_stats(),
             "message": "Cache statistics retrieved"
         }
     except Exception as e:
@@ -412,6 +422,38 @@ async def debug_cache_stats():
             "message": "Cache stats error"
         }
 
+@router.get("/debug/prewarm-stats")
+async def debug_prewarm_stats():
+    """Debug endpoint to check the background subreddit pre-warming"""
+    from app.services.prewarm_scheduler import prewarm_scheduler
+    from app.services.post_store import get_post_store
+    post_store = get_post_store()
+    return {
+        "status": "success",
+        "prewarm_stats": prewarm_scheduler.get_stats(),
+        "post_store_stats": post_store.get_stats() if post_store else None
+    }
+
+@router.get("/debug/pipeline-stats")
+async def debug_pipeline_stats():
+    """Debug endpoint to check per-stage load of the search pipeline"""
+    from app.core.container import container
+    return {
+        "status": "success",
+        "pipeline_stats": search_pipeline.get_stats(),
+        "container_stats": container.get_stats(),
+        "job_stats": search_job_manager.get_stats()
+    }
+
+@router.get("/debug/reddit-http-stats")
+async def debug_reddit_http_stats():
+    """Debug endpoint to check the Reddit OAuth API client (connection pool, retries, bytes)"""
+    from app.services.reddit_ingestion import get_http_stats
+    return {
+        "status": "success",
+        "http_stats": get_http_stats()
+    }
+
 @router.get("/api/debug/ai-config")
 async def debug_ai_config():
     """Debug endpoint to check current AI configuration"""
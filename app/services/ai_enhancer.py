@@ -2,10 +2,16 @@ import logging
 from typing import List, Dict, Any, Optional
 from dataclasses import dataclass
 import re
-from app.services.business_keywords import get_keywords_for_selection, calculate_business_relevance_score, BUSINESS_KEYWORDS, INDUSTRY_KEYWORDS
+from app.services.business_keywords import calculate_business_relevance_score
+from app.services.scoring_profiles import get_scoring_profile
+from app.services.batch_scorer import BatchScorer, percentage_scores
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
+# Revenue numbers (e.g. "$10k") usually mean a success story
+REVENUE_PATTERN = re.compile(r'\$\d+[k|m]?')
+
 @dataclass
 class EnhancedQuery:
     original_problem: str
@@ -178,6 +184,83 @@ class AIEnhancer:
                 urgency_level="Low"
             )
 
+    def analyze_posts_relevance(self, posts: List[Dict[str, Any]], keywords: List[str], business_type: str = None, industry_type: str = None) -> List[RelevanceScore]:
+        """
+        Batch version of analyze_post_relevance: the same scores for every post, computed
+        as matrix-vector products over one post x term hit matrix.
+        """
+        try:
+            texts = [f"{post.get('title', '')} {post.get('text', '')}".lower() for post in posts]
+            profile = get_scoring_profile(business=business_type, industry=industry_type)
+            
+            groups = {
+                "keywords": keywords,
+                "active": [pattern for patterns in self.active_struggle_patterns.values() for pattern in patterns],
+                "high": self.struggle_indicators["high_urgency"],
+                "medium": self.struggle_indicators["medium_urgency"],
+                "generic_business": self.struggle_indicators["business_keywords"],
+                "success": [pattern for patterns in self.success_story_patterns.values() for pattern in patterns],
+                "question": ["?"],
+                "no_promote": ["i will not promote"],
+                "relevance": profile.relevance_keywords
+            }
+            for i, other_keywords in enumerate(profile.conflict_keywords):
+                groups[f"conflict_{i}"] = other_keywords
+            
+            # Keywords are matched as listed, like `keyword in post_text`
+            scorer = BatchScorer(groups, lowercase=False)
+            hits = scorer.hits(texts)
+            
+            keyword_scores = percentage_scores(scorer.counts(hits, "keywords"), len(keywords))
+            high_counts = scorer.counts(hits, "high")
+            medium_counts = scorer.counts(hits, "medium")
+            
+            if self.use_improved_scoring:
+                struggle_scores = scorer.weighted(hits, {"active": 25, "high": 15, "medium": 8, "question": 20, "success": -30, "no_promote": -15})
+                struggle_scores -= 25 * hits.regex_mask(REVENUE_PATTERN)
+                struggle_scores = np.clip(struggle_scores, 0, 100)
+                
+                if (business_type or industry_type) and profile.relevance_keywords:
+                    matches = scorer.counts(hits, "relevance")
+                    match_percentage = (matches / len(profile.relevance_keywords)) * 100
+                    match_percentage = match_percentage + np.where(matches >= 3, 20, np.where(matches >= 2, 10, 0))
+                    business_relevance = np.minimum(100, match_percentage.astype(np.int64))
+                    conflict_penalty = sum(
+                        15 * (scorer.counts(hits, f"conflict_{i}") >= 2) for i in range(len(profile.conflict_keywords))
+                    )
+                    business_scores = np.minimum(100, np.maximum(0, business_relevance - conflict_penalty))
+                else:
+                    business_scores = np.zeros(len(posts))
+                
+                overall_scores = (keyword_scores * 0.3) + (struggle_scores * 0.6) + (business_scores * 0.1)
+            else:
+                struggle_scores = np.minimum(100, scorer.weighted(hits, {"high": 20, "medium": 10, "question": 15}))
+                business_scores = np.minimum(100, scorer.weighted(hits, {"generic_business": 5}))
+                overall_scores = (keyword_scores * 0.4) + (struggle_scores * 0.4) + (business_scores * 0.2)
+            
+            urgency_levels = np.where(
+                high_counts >= 2, "High",
+                np.where((high_counts >= 1) | (medium_counts >= 2), "Medium", "Low")
+            )
+            
+            return [
+                RelevanceScore(
+                    overall_score=int(overall),
+                    keyword_match=int(keyword),
+                    struggle_detection=int(struggle),
+                    business_relevance=int(business),
+                    urgency_level=str(urgency)
+                )
+                for overall, keyword, struggle, business, urgency in zip(
+                    overall_scores.astype(np.int64).tolist(), keyword_scores.tolist(),
+                    struggle_scores.tolist(), business_scores.tolist(), urgency_levels.tolist()
+                )
+            ]
+            
+        except Exception as e:
+            logger.error(f"Batch relevance analysis failed, scoring posts one by one: {e}")
+            return [self.analyze_post_relevance(post, keywords, business_type, industry_type) for post in posts]
+
     def extract_business_context(self, post_text: str) -> BusinessContext:
         """
         Extract business context from a post to understand what type of business
@@ -318,7 +401,7 @@ class AIEnhancer:
                     score -= 30
         
         # PENALIZE: Revenue numbers in title (-25 points)
-        if re.search(r'\$\d+[k|m]?', post_text):
+        if REVENUE_PATTERN.search(post_text):
             score -= 25
         
         # PENALIZE: "I will not promote" (often success stories)
@@ -341,8 +424,8 @@ class AIEnhancer:
         if not business_type and not industry_type:
             return 0  # No business context, no business relevance
         
-        # Get business-specific keywords
-        target_keywords = get_keywords_for_selection(business=business_type, industry=industry_type)
+        # Get business-specific keywords (precompiled profile)
+        target_keywords = get_scoring_profile(business=business_type, industry=industry_type).relevance_keywords
         
         if not target_keywords:
             return 0  # No keywords defined for this business/industry
@@ -360,21 +443,15 @@ class AIEnhancer:
         """Calculate penalty for posts that clearly belong to different business types."""
         penalty = 0
         
-        # Get all other business keywords (excluding the target one)
-        all_businesses = list(BUSINESS_KEYWORDS.keys()) if business_type else list(INDUSTRY_KEYWORDS.keys())
-        target = business_type or industry_type
+        # Keywords of the other business types checked for conflicts (precompiled per profile)
+        profile = get_scoring_profile(business=business_type, industry=industry_type)
         
-        if target in all_businesses:
-            other_businesses = [b for b in all_businesses if b != target]
-            
-            # Check for strong indicators of other business types
-            for other_business in other_businesses[:3]:  # Check top 3 most conflicting
-                other_keywords = get_keywords_for_selection(business=other_business) if business_type else get_keywords_for_selection(industry=other_business)
-                
-                # If post has multiple keywords from a different business type, penalize
-                matches = sum(1 for keyword in other_keywords if keyword in post_text)
-                if matches >= 2:  # 2+ keywords from different business type
-                    penalty += 15
+        # Check for strong indicators of other business types
+        for other_keywords in profile.conflict_keywords:
+            # If post has multiple keywords from a different business type, penalize
+            matches = sum(1 for keyword in other_keywords if keyword in post_text)
+            if matches >= 2:  # 2+ keywords from different business type
+                penalty += 15
         
         return penalty
 
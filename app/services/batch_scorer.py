@@ -0,0 +1,107 @@
+"""
+Vectorized batch scoring engine (NumPy)
+Turns a whole batch of post texts into a sparse post x term hit matrix in one
+matching pass (KeywordMatcher), then computes every per-category score as a
+matrix-vector product with that category's weight vector. The filters combine
+those score vectors with array arithmetic, so the per-post Python work is
+limited to the matches themselves.
+"""
+
+import logging
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Iterable, Optional
+import numpy as np
+from app.services.keyword_matcher import KeywordMatcher
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class HitMatrix:
+    """Sparse boolean post x term matrix in coordinate form"""
+    n_posts: int
+    n_terms: int
+    rows: np.ndarray  # post index of every hit
+    columns: np.ndarray  # term index of every hit
+    starts: np.ndarray  # offset of every post in the corpus
+    corpus: str  # NUL-joined texts (for regex features)
+
+    def dot(self, term_weights: np.ndarray) -> np.ndarray:
+        """Matrix-vector product: per-post sum of the weights of the terms it contains"""
+        if not len(self.rows):
+            return np.zeros(self.n_posts)
+        return np.bincount(self.rows, weights=term_weights[self.columns], minlength=self.n_posts)
+
+    def regex_mask(self, pattern: "re.Pattern") -> np.ndarray:
+        """Per-post flag: does the regex match anywhere in the post (matches must not need the separator)"""
+        positions = [match.start() for match in pattern.finditer(self.corpus)]
+        mask = np.zeros(self.n_posts, dtype=bool)
+        if positions:
+            mask[np.searchsorted(self.starts, positions, side="right") - 1] = True
+        return mask
+
+
+class BatchScorer:
+    """
+    Term groups compiled into one matcher plus one weight vector per group.
+    A term listed several times in a group counts once per listing, exactly like
+    `sum(1 for term in group if term in text)`.
+    """
+
+    def __init__(self, groups: Dict[str, Iterable[str]], lowercase: bool = True):
+        self.matcher = KeywordMatcher(groups, lowercase=lowercase)
+        self.group_sizes: Dict[str, int] = {}
+        self._group_vectors: Dict[str, np.ndarray] = {}
+        for group, terms in self.matcher.categories.items():
+            vector = np.zeros(len(self.matcher.patterns))
+            for term in terms:
+                vector[self.matcher.pattern_index(term)] += 1
+            self._group_vectors[group] = vector
+            self.group_sizes[group] = len(terms)
+
+    def hits(self, texts: List[str]) -> HitMatrix:
+        rows, columns, starts, corpus = self.matcher.find_pairs(texts)
+        return HitMatrix(
+            n_posts=len(texts),
+            n_terms=len(self.matcher.patterns),
+            rows=np.asarray(rows, dtype=np.int64),
+            columns=np.asarray(columns, dtype=np.int64),
+            starts=np.asarray(starts, dtype=np.int64),
+            corpus=corpus
+        )
+
+    def counts(self, hits: HitMatrix, group: str) -> np.ndarray:
+        """How many listings of a group each post contains"""
+        return hits.dot(self._group_vectors[group])
+
+    def weighted(self, hits: HitMatrix, weights: Dict[str, float]) -> np.ndarray:
+        """Per-post sum over groups of weight x listings found"""
+        term_weights = sum(self._group_vectors[group] * weight for group, weight in weights.items())
+        return hits.dot(np.asarray(term_weights, dtype=float))
+
+
+def score_texts(matcher: KeywordMatcher, texts: List[str], hits: Optional[HitMatrix] = None) -> np.ndarray:
+    """Scores of a weighted KeywordMatcher (its pattern weights) for a batch of texts"""
+    if hits is None:
+        rows, columns, _, _ = matcher.find_pairs(texts)
+        rows, columns = np.asarray(rows, dtype=np.int64), np.asarray(columns, dtype=np.int64)
+    else:
+        rows, columns = hits.rows, hits.columns
+    if not len(rows):
+        return np.zeros(len(texts), dtype=np.int64)
+    weights = np.asarray(matcher.pattern_weights, dtype=np.int64)
+    return np.bincount(rows, weights=weights[columns], minlength=len(texts)).astype(np.int64)
+
+
+def percentage_scores(matches: np.ndarray, total: int) -> np.ndarray:
+    """min(100, int(matches / total * 100)) for every post (0 when there is nothing to match)"""
+    if not total:
+        return np.zeros(len(matches), dtype=np.int64)
+    return np.minimum(100, ((matches / total) * 100).astype(np.int64))
+
+
+def threshold_order(scores: np.ndarray, threshold: float) -> np.ndarray:
+    """Indices of the posts scoring >= threshold, highest score first (ties keep input order)"""
+    passing = np.flatnonzero(scores >= threshold)
+    return passing[np.argsort(-scores[passing], kind="stable")]
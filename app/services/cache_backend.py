@@ -0,0 +1,413 @@
+"""
+Storage backends for the result cache
+ResultCache keeps the cache policy (keys, soft/hard TTL, stats); a backend only
+stores entries and counters. MemoryCacheBackend is a per-process LRU dict.
+SQLiteCacheBackend keeps entries in a WAL-mode SQLite file (zlib-compressed
+pickles), so every uvicorn worker on the same disk shares warm results and they
+survive restarts and redeploys; it also holds the per-user tier request counters.
+Entries are evicted (expired first, then least recently used over the entry or
+byte budget) by a periodic background task instead of on the write path.
+Reads only write back their access time when it is more than a minute old, so
+lookups from many workers don't all queue on the SQLite write lock.
+"""
+
+import pickle
+import sqlite3
+import threading
+import time
+import zlib
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# SQLite backend: a read refreshes accessed_at (LRU order) at most this often per entry
+ACCESS_TOUCH_SECONDS = 60
+
+
+def serialize(value: Any) -> bytes:
+    """Compact on-disk form of a cached value"""
+    return zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), 6)
+
+
+def deserialize(data: bytes) -> Any:
+    return pickle.loads(zlib.decompress(data))
+
+
+def estimate_size(value: Any) -> int:
+    """Approximate memory footprint of a cached value (its pickled size)"""
+    try:
+        return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return len(repr(value).encode("utf-8"))
+
+
+class CacheBackend:
+    """Entry and counter storage used by ResultCache"""
+
+    name = "base"
+
+    def get(self, key: str) -> Optional[Tuple[float, Any]]:
+        """(created_at, value) for a key, marking it recently used; None if absent"""
+        raise NotImplementedError
+
+    def get_many(self, keys: List[str]) -> List[Optional[Tuple[float, Any]]]:
+        """get() for several keys at once (backends override it to batch the lookups)"""
+        return [self.get(key) for key in keys]
+
+    def set(self, key: str, value: Any, created_at: float) -> int:
+        """Store (or replace) an entry; returns its stored size in bytes"""
+        raise NotImplementedError
+
+    def set_many(self, entries: List[Tuple[str, Any, float]]) -> int:
+        """Store (key, value, created_at) entries; returns their total stored size in bytes"""
+        return sum(self.set(key, value, created_at) for key, value, created_at in entries)
+
+    def set_unless(self, key: str, value: Any, created_at: float, keep_existing: Callable[[float, Any], bool]) -> int:
+        """
+        Atomic compare-and-set: store the entry unless keep_existing(created_at, value) of the
+        current entry says to keep it. Returns the stored size, or 0 when the entry was kept.
+        """
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def evict(self, max_entries: int, max_bytes: int, max_age_seconds: float) -> int:
+        """Drop expired entries, then least recently used ones until both budgets hold; returns how many"""
+        raise NotImplementedError
+
+    def get_counter(self, name: str) -> int:
+        raise NotImplementedError
+
+    def increment_counter(self, name: str) -> int:
+        """Atomically add one to a counter and return the new value"""
+        raise NotImplementedError
+
+    def reset_counter(self, name: str) -> int:
+        """Delete a counter; returns its old value"""
+        raise NotImplementedError
+
+    def get_stats(self) -> Dict[str, Any]:
+        """entries, bytes and the oldest/newest created_at"""
+        raise NotImplementedError
+
+
+class MemoryCacheBackend(CacheBackend):
+    """In-process LRU (not shared between workers, lost on restart)"""
+
+    name = "memory"
+
+    def __init__(self, max_entries: Optional[int] = None, max_bytes: Optional[int] = None):
+        # LRU order: least recently used first; key -> (created_at, value, size_bytes)
+        self._entries: "OrderedDict[str, Tuple[float, Any, int]]" = OrderedDict()
+        self._counters: Dict[str, int] = {}
+        self._lock = threading.RLock()  # Reentrant: set_unless calls set (and evict) while holding it
+        self.max_entries = max_entries or settings.result_cache_max_entries
+        self.max_bytes = max_bytes or settings.result_cache_max_bytes
+        self.total_bytes = 0
+
+    def _remove(self, key: str):
+        _, _, size_bytes = self._entries.pop(key)
+        self.total_bytes -= size_bytes
+
+    def get(self, key: str) -> Optional[Tuple[float, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0], entry[1]
+
+    def set(self, key: str, value: Any, created_at: float) -> int:
+        size_bytes = estimate_size(value)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (created_at, value, size_bytes)
+            self.total_bytes += size_bytes
+        # Cheap here, so the budgets also hold between background passes
+        self.evict(self.max_entries, self.max_bytes, float("inf"))
+        return size_bytes
+
+    def set_unless(self, key: str, value: Any, created_at: float, keep_existing: Callable[[float, Any], bool]) -> int:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and keep_existing(entry[0], entry[1]):
+                return 0
+            return self.set(key, value, created_at)
+
+    def delete(self, key: str):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def evict(self, max_entries: int, max_bytes: int, max_age_seconds: float) -> int:
+        evicted = 0
+        cutoff = time.time() - max_age_seconds
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if entry[0] < cutoff]:
+                self._remove(key)
+                evicted += 1
+            while self._entries and (len(self._entries) > max_entries or self.total_bytes > max_bytes):
+                self._remove(next(iter(self._entries)))
+                evicted += 1
+        return evicted
+
+    def get_counter(self, name: str) -> int:
+        return self._counters.get(name, 0)
+
+    def increment_counter(self, name: str) -> int:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + 1
+            return self._counters[name]
+
+    def reset_counter(self, name: str) -> int:
+        with self._lock:
+            return self._counters.pop(name, 0)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            created = [entry[0] for entry in self._entries.values()]
+            return {
+                "backend": self.name,
+                "entries": len(self._entries),
+                "bytes": self.total_bytes,
+                "oldest_created_at": min(created) if created else None,
+                "newest_created_at": max(created) if created else None
+            }
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """WAL-mode SQLite file shared by every worker on the same disk"""
+
+    name = "sqlite"
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._init_schema()
+
+    def _connect(self) -> sqlite3.Connection:
+        """One connection per thread, opened lazily"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        conn = self._connect()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                key TEXT PRIMARY KEY,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                size_bytes INTEGER NOT NULL,
+                data BLOB NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_cache_entries_accessed ON cache_entries (accessed_at);
+
+            CREATE TABLE IF NOT EXISTS counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+        """)
+        conn.commit()
+
+    def get(self, key: str) -> Optional[Tuple[float, Any]]:
+        conn = self._connect()
+        row = conn.execute("SELECT created_at, accessed_at, data FROM cache_entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        try:
+            value = deserialize(row[2])
+        except Exception as e:
+            logger.warning(f"⚠️ CACHE BACKEND: Dropping unreadable entry {key}: {e}")
+            self.delete(key)
+            return None
+        now = time.time()
+        if now - row[1] >= ACCESS_TOUCH_SECONDS:
+            conn.execute("UPDATE cache_entries SET accessed_at = ? WHERE key = ?", (now, key))
+            conn.commit()
+        return row[0], value
+
+    def get_many(self, keys: List[str]) -> List[Optional[Tuple[float, Any]]]:
+        conn = self._connect()
+        rows = {}
+        now = time.time()
+        touched = []
+        for start in range(0, len(keys), 500):  # Stay under SQLite's bound-parameter limit
+            chunk = keys[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            for key, created_at, accessed_at, data in conn.execute(
+                f"SELECT key, created_at, accessed_at, data FROM cache_entries WHERE key IN ({placeholders})", chunk
+            ):
+                try:
+                    rows[key] = (created_at, deserialize(data))
+                except Exception as e:
+                    logger.warning(f"⚠️ CACHE BACKEND: Skipping unreadable entry {key}: {e}")
+                    continue
+                if now - accessed_at >= ACCESS_TOUCH_SECONDS:
+                    touched.append((now, key))
+        if touched:
+            conn.executemany("UPDATE cache_entries SET accessed_at = ? WHERE key = ?", touched)
+            conn.commit()
+        return [rows.get(key) for key in keys]
+
+    def set(self, key: str, value: Any, created_at: float) -> int:
+        data = serialize(value)
+        conn = self._connect()
+        conn.execute(
+            """INSERT INTO cache_entries (key, created_at, accessed_at, size_bytes, data) VALUES (?, ?, ?, ?, ?)
+               ON CONFLICT(key) DO UPDATE SET created_at = excluded.created_at, accessed_at = excluded.accessed_at,
+               size_bytes = excluded.size_bytes, data = excluded.data""",
+            (key, created_at, time.time(), len(data), data)
+        )
+        conn.commit()
+        return len(data)
+
+    def set_many(self, entries: List[Tuple[str, Any, float]]) -> int:
+        # One transaction (one commit) for the whole batch
+        now = time.time()
+        rows = []
+        for key, value, created_at in entries:
+            data = serialize(value)
+            rows.append((key, created_at, now, len(data), data))
+        conn = self._connect()
+        conn.executemany(
+            """INSERT INTO cache_entries (key, created_at, accessed_at, size_bytes, data) VALUES (?, ?, ?, ?, ?)
+               ON CONFLICT(key) DO UPDATE SET created_at = excluded.created_at, accessed_at = excluded.accessed_at,
+               size_bytes = excluded.size_bytes, data = excluded.data""",
+            rows
+        )
+        conn.commit()
+        return sum(row[3] for row in rows)
+
+    def set_unless(self, key: str, value: Any, created_at: float, keep_existing: Callable[[float, Any], bool]) -> int:
+        data = serialize(value)
+        conn = self._connect()
+        if conn.in_transaction:
+            conn.commit()
+        # IMMEDIATE takes the write lock first, so no other worker can write between the check and the upsert
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT created_at, data FROM cache_entries WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                try:
+                    keep = keep_existing(row[0], deserialize(row[1]))
+                except Exception:
+                    keep = False  # Unreadable entry: replace it
+                if keep:
+                    conn.rollback()
+                    return 0
+            conn.execute(
+                """INSERT INTO cache_entries (key, created_at, accessed_at, size_bytes, data) VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT(key) DO UPDATE SET created_at = excluded.created_at, accessed_at = excluded.accessed_at,
+                   size_bytes = excluded.size_bytes, data = excluded.data""",
+                (key, created_at, time.time(), len(data), data)
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return len(data)
+
+    def delete(self, key: str):
+        conn = self._connect()
+        conn.execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+        conn.commit()
+
+    def clear(self):
+        conn = self._connect()
+        conn.execute("DELETE FROM cache_entries")
+        conn.commit()
+
+    def evict(self, max_entries: int, max_bytes: int, max_age_seconds: float) -> int:
+        conn = self._connect()
+        evicted = conn.execute("DELETE FROM cache_entries WHERE created_at < ?", (time.time() - max_age_seconds,)).rowcount
+
+        # Keep the most recently used entries that fit both budgets
+        rows: List[Tuple[str, int]] = conn.execute(
+            "SELECT key, size_bytes FROM cache_entries ORDER BY accessed_at DESC"
+        ).fetchall()
+        kept_bytes = 0
+        doomed = []
+        for position, (key, size_bytes) in enumerate(rows):
+            if position >= max_entries or kept_bytes + size_bytes > max_bytes:
+                doomed.append((key,))
+            else:
+                kept_bytes += size_bytes
+        if doomed:
+            conn.executemany("DELETE FROM cache_entries WHERE key = ?", doomed)
+            evicted += len(doomed)
+        conn.commit()
+        return evicted
+
+    def get_counter(self, name: str) -> int:
+        row = self._connect().execute("SELECT value FROM counters WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else 0
+
+    def increment_counter(self, name: str) -> int:
+        conn = self._connect()
+        # The upsert takes the write lock, so the read below sees this worker's increment only
+        conn.execute(
+            "INSERT INTO counters (name, value) VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET value = value + 1", (name,)
+        )
+        value = conn.execute("SELECT value FROM counters WHERE name = ?", (name,)).fetchone()[0]
+        conn.commit()
+        return value
+
+    def reset_counter(self, name: str) -> int:
+        conn = self._connect()
+        old_value = self.get_counter(name)
+        conn.execute("DELETE FROM counters WHERE name = ?", (name,))
+        conn.commit()
+        return old_value
+
+    def get_stats(self) -> Dict[str, Any]:
+        row = self._connect().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size_bytes), 0), MIN(created_at), MAX(created_at) FROM cache_entries"
+        ).fetchone()
+        return {
+            "backend": self.name,
+            "path": self.db_path,
+            "entries": row[0],
+            "bytes": row[1],
+            "oldest_created_at": row[2],
+            "newest_created_at": row[3]
+        }
+
+
+# Global backend shared by the result cache and the tier request counters
+_cache_backend: Optional[CacheBackend] = None
+_cache_backend_lock = threading.Lock()
+
+
+def get_cache_backend() -> CacheBackend:
+    """Get the configured backend (settings.result_cache_backend), creating it on first use"""
+    global _cache_backend
+    with _cache_backend_lock:
+        if _cache_backend is None:
+            if settings.result_cache_backend == "sqlite":
+                try:
+                    _cache_backend = SQLiteCacheBackend(settings.result_cache_path)
+                    logger.info(f"💾 CACHE BACKEND: Using {settings.result_cache_path}")
+                except sqlite3.Error as e:
+                    logger.error(f"❌ CACHE BACKEND: Cannot open {settings.result_cache_path} ({e}), falling back to memory")
+            if _cache_backend is None:
+                _cache_backend = MemoryCacheBackend()
+                logger.info("💾 CACHE BACKEND: Using in-process memory")
+        return _cache_backend
@@ -14,55 +14,15 @@ from app.models.lead import Lead
 from app.services.ai_enhancer import AIEnhancer, EnhancedQuery
 from app.services.summary_service import SummaryService
 from app.core.ai_config import get_ai_config
-from app.services.business_mapping_hyperfocus import BUSINESS_MAPPINGS, INDUSTRY_MAPPINGS
+from app.services.scoring_profiles import (
+    BUSINESS_THRESHOLDS, DEFAULT_THRESHOLDS, STRUGGLE_INDICATORS, RULE_WEIGHTS,
+    get_scoring_profile, get_rule_matcher
+)
+from app.services.batch_scorer import score_texts, threshold_order
+from app.services import scoring_pool
 
 logger = logging.getLogger(__name__)
 
-# Business-Specific Threshold Configuration
-# Each business/industry can have different quality thresholds per tier
-BUSINESS_THRESHOLDS = {
-    "SaaS Companies": {
-        1: 13,  # Tier 1: High quality cutoff
-        2: 16,  # Tier 2: Even stricter quality
-        3: 13,  # Tier 3: Higher to reduce noise
-        4: 14   # Tier 4: High threshold for noisy subreddits
-    },
-    "App Developers": {
-        1: 13,
-        2: 16,
-        3: 13,
-        4: 14
-    },
-    "E-commerce Stores": {
-        1: 13,
-        2: 16,
-        3: 13,
-        4: 14
-    },
-    "Jobs and Hiring": {
-        1: 9,   # Tier 1 tuned per testing feedback
-        2: 8,   # Tier 2 tuned per testing feedback
-        3: 10,  # Tier 3 threshold increased for better quality
-        4: 10   # Tier 4 threshold increased to minimum 10
-    },
-    # Industry types
-    "SaaS / Tech": {
-        1: 13,
-        2: 16,
-        3: 13,
-        4: 14
-    },
-    "E-commerce": {
-        1: 13,
-        2: 16,
-        3: 13,
-        4: 14
-    }
-}
-
-# Default thresholds if business type not found
-DEFAULT_THRESHOLDS = {1: 13, 2: 16, 3: 13, 4: 14}
-
 class FastLeadFilter:
     def __init__(self):
         self.ai_config = get_ai_config()
@@ -87,13 +47,12 @@ class FastLeadFilter:
         tier = ((request_number - 1) % 4) + 1
         
         # Get business-specific threshold (with fallback to defaults)
-        business_thresholds = BUSINESS_THRESHOLDS.get(business_type, DEFAULT_THRESHOLDS)
-        dynamic_threshold = business_thresholds.get(tier, 13)
+        dynamic_threshold = get_scoring_profile(business=business_type).threshold_for(tier)
         
         logger.info(f"🚀 Fast filtering: {len(posts)} posts for '{problem_description}' (Tier {request_number}, threshold={dynamic_threshold})")
         
-        # Reset metrics
-        self._last_metrics = {
+        # Metrics for this call (local: one filter instance serves concurrent searches)
+        metrics = {
             "posts_analyzed": len(posts),
             "posts_filtered": 0,
             "summaries_generated": 0,
@@ -117,99 +76,69 @@ class FastLeadFilter:
                 leads = self._add_simple_summaries(leads, problem_description)
             
             # Update metrics
-            self._last_metrics.update({
+            metrics.update({
                 "posts_filtered": len(filtered_posts),
                 "results_returned": len(leads)
             })
+            self._last_metrics = metrics
             
             logger.info(f"🎯 Fast filtering complete: {len(leads)} quality leads")
-            return leads, self._last_metrics
+            return leads, metrics
             
         except Exception as e:
             logger.error(f"❌ Error in fast filtering: {e}")
+            self._last_metrics = metrics
             # Return empty results on error
-            return [], self._last_metrics or {}
+            return [], metrics
 
     def _rule_based_filter(self, posts: List[Dict[str, Any]], problem_description: str, 
                           business_type: str, industry_type: Optional[str] = None, threshold: int = 5) -> List[Dict[str, Any]]:
         """
 Rule-based filtering - the proven system that worked before.
         """
-        # Get business/industry keywords
-        business_keywords = BUSINESS_MAPPINGS.get(business_type, {}).get("keywords", [])
-        if industry_type:
-            industry_keywords = INDUSTRY_MAPPINGS.get(industry_type, {}).get("keywords", [])
-            business_keywords.extend(industry_keywords)
-        
         # Enhanced query processing
         enhanced_query = self.ai_enhancer.enhance_query(problem_description, business_type)
         enhanced_keywords = enhanced_query.keywords
         
-        # Combine all keywords
-        all_keywords = business_keywords + enhanced_keywords
+        # All keyword categories compiled into one matcher (cached per business/industry/problem)
+        matcher = get_rule_matcher(business_type, industry_type, problem_description, tuple(enhanced_keywords))
         
-        logger.info(f"🔍 Keywords for '{business_type}': {all_keywords[:10]}...")  # Show first 10 keywords
-        
-        # Struggle indicators
-        struggle_indicators = [
-            "struggling", "help", "can't", "cannot", "can not", "trouble", "problem", "issue", 
-            "stuck", "frustrated", "overwhelmed", "desperate", "urgent", "failing", "lost", 
-            "losing", "declining", "first client", "first customer", "no customers", "no clients",
-            "getting clients", "customer acquisition", "lead generation", "need help", 
-            "looking for", "how to", "what should", "any advice"
-        ]
-        
-        filtered_posts = []
+        logger.info(f"🔍 Keywords for '{business_type}': {matcher.patterns[:10]}...")  # Show first 10 keywords
         
         logger.info(f"🔍 Processing {len(posts)} posts for filtering...")
         
         for i, post in enumerate(posts[:5]):  # Log first 5 posts for debugging
             logger.info(f"📝 Post {i+1}: {post.get('title', '')[:50]}...")
         
+        texts = []
         for post in posts:
             title = post.get("title", "").lower()
             content = post.get("content", "").lower()
-            text = f"{title} {content}"
-            
-            # Calculate relevance score
-            score = 0
-            
-            # Business keyword matching
-            for keyword in all_keywords:
-                if keyword.lower() in text:
-                    score += 3
-            
-            # Struggle indicator matching
-            for indicator in struggle_indicators:
-                if indicator in text:
-                    score += 2
-            
-            # Enhanced keyword matching (higher weight)
-            for keyword in enhanced_keywords:
-                if keyword.lower() in text:
-                    score += 4
-            
-            # Bonus for exact problem match
-            problem_words = problem_description.lower().split()
-            for word in problem_words:
-                if len(word) > 3 and word in text:
-                    score += 1
-            
-            # Assign score to post (for debugging)
+            texts.append(f"{title} {content}")
+        
+        # Calculate relevance scores (sparse post x keyword hits times the keyword weight vector)
+        scores = None
+        if scoring_pool.should_use_process_pool(len(texts)):
+            try:
+                scores = scoring_pool.score_rule_texts(
+                    business_type, industry_type, problem_description, tuple(enhanced_keywords), texts
+                )
+            except Exception as e:
+                logger.warning(f"⚠️ Process-pool scoring failed, scoring in-process: {e}")
+        if scores is None:
+            scores = score_texts(matcher, texts)
+        
+        # Assign score to post (for debugging)
+        for post, score in zip(posts, scores.tolist()):
             post["relevance_score"] = score
-            
-            # Apply threshold
-            if score >= threshold:
-                filtered_posts.append(post)
         
-        # Sort by relevance score (highest first)
-        filtered_posts.sort(key=lambda x: x.get("relevance_score", 0), reverse=True)
+        # Apply threshold and sort by relevance score (highest first)
+        filtered_posts = [posts[i] for i in threshold_order(scores, threshold)]
         
         # Debug: Show score distribution
-        all_scores = [post.get("relevance_score", 0) for post in posts]
-        max_score = max(all_scores) if all_scores else 0
-        min_score = min(all_scores) if all_scores else 0
-        avg_score = sum(all_scores) / len(all_scores) if all_scores else 0
+        max_score = int(scores.max()) if len(scores) else 0
+        min_score = int(scores.min()) if len(scores) else 0
+        avg_score = float(scores.mean()) if len(scores) else 0
         
         logger.info(f"📊 Score distribution: min={min_score}, max={max_score}, avg={avg_score:.1f}")
         logger.info(f"📊 Filtered posts: {len(filtered_posts)} out of {len(posts)} (threshold={self.ai_config['threshold']})")
@@ -0,0 +1,131 @@
+"""
+Compiled multi-category keyword matcher
+Built once per keyword set: patterns are lowercased and de-duplicated up front
+and each keeps the summed weight of every category list it appears in, so a post
+is scored from its set of matched patterns. A batch of posts is matched as one
+NUL-joined corpus, scanning it once per distinct pattern with str.find and only
+touching Python code for actual hits. Semantics are plain substring containment
+on lowercased text, the same as `keyword.lower() in text`.
+"""
+
+import logging
+from bisect import bisect_right
+from typing import Dict, List, Set, Tuple, Optional, Iterable
+
+logger = logging.getLogger(__name__)
+
+# Joins posts into one corpus; keywords never contain it, so no match can span two posts
+_SEPARATOR = "\x00"
+
+
+class KeywordMatcher:
+    """
+    Matcher compiled from {category: [keywords]}.
+    A keyword listed several times (or in several categories) counts once per
+    listing when scoring, exactly like looping over the lists would.
+    """
+
+    def __init__(self, categories: Dict[str, Iterable[str]], weights: Optional[Dict[str, int]] = None, lowercase: bool = True):
+        weights = weights or {}
+        self.lowercase = lowercase  # False keeps keywords as listed (an uppercase keyword never matches lowercased text)
+        self.categories: Dict[str, Tuple[str, ...]] = {category: tuple(keywords) for category, keywords in categories.items()}
+        self.weights: Dict[str, int] = dict(weights)
+        self.patterns: List[str] = []
+        self._pattern_index: Dict[str, int] = {}
+        self._categories: List[Set[str]] = []  # pattern index -> categories it belongs to
+        self.pattern_weights: List[int] = []  # pattern index -> summed weight of every listing
+
+        for category, keywords in self.categories.items():
+            for keyword in keywords:
+                pattern = keyword.lower() if lowercase else keyword
+                index = self._pattern_index.get(pattern)
+                if index is None:
+                    index = self._pattern_index[pattern] = len(self.patterns)
+                    self.patterns.append(pattern)
+                    self._categories.append(set())
+                    self.pattern_weights.append(0)
+                self._categories[index].add(category)
+                self.pattern_weights[index] += weights.get(category, 0)
+
+        self.category_names = list(categories)
+        logger.debug(f"🔤 KEYWORD MATCHER: {len(self.patterns)} distinct patterns from {len(self.category_names)} categories")
+
+    def with_categories(self, extra: Dict[str, Iterable[str]]) -> "KeywordMatcher":
+        """New matcher with more keywords appended to existing (or new) categories, same weights"""
+        categories = dict(self.categories)
+        for category, keywords in extra.items():
+            categories[category] = categories.get(category, ()) + tuple(keywords)
+        return KeywordMatcher(categories, self.weights, self.lowercase)
+
+    def pattern_index(self, keyword: str) -> int:
+        """Index of a listed keyword in self.patterns"""
+        return self._pattern_index[keyword.lower() if self.lowercase else keyword]
+
+    def find_pairs(self, texts: List[str]) -> Tuple[List[int], List[int], List[int], str]:
+        """
+        Sparse hit list for a batch: (rows, pattern indices, text start offsets, corpus).
+        Every (text, pattern) pair that occurs is reported exactly once.
+        """
+        rows: List[int] = []
+        columns: List[int] = []
+        starts = []
+        offset = 0
+        for text in texts:
+            starts.append(offset)
+            offset += len(text) + 1
+        corpus = _SEPARATOR.join(texts)
+        if not texts:
+            return rows, columns, starts, corpus
+        last_row = len(texts) - 1
+
+        for index, pattern in enumerate(self.patterns):
+            if not pattern:  # "" is in every text
+                rows.extend(range(len(texts)))
+                columns.extend([index] * len(texts))
+                continue
+            position = corpus.find(pattern)
+            while position != -1:
+                row = bisect_right(starts, position) - 1
+                rows.append(row)
+                columns.append(index)
+                if row == last_row:
+                    break
+                # Presence is all that counts, continue from the next post
+                position = corpus.find(pattern, starts[row + 1])
+        return rows, columns, starts, corpus
+
+    def find_many(self, texts: List[str]) -> List[Set[int]]:
+        """Indices of the patterns occurring in each (already lowercased) text"""
+        hits: List[Set[int]] = [set() for _ in texts]
+        rows, columns, _, _ = self.find_pairs(texts)
+        for row, index in zip(rows, columns):
+            hits[row].add(index)
+        return hits
+
+    def find(self, text: str) -> Set[int]:
+        """Indices of the patterns occurring in one (already lowercased) text"""
+        return self.find_many([text])[0]
+
+    def hit_sets(self, found: Set[int]) -> Dict[str, Set[str]]:
+        """Hit set per category for a result of find(): {category: {matched keywords}}"""
+        hits: Dict[str, Set[str]] = {category: set() for category in self.category_names}
+        for index in found:
+            for category in self._categories[index]:
+                hits[category].add(self.patterns[index])
+        return hits
+
+    def match(self, text: str) -> Dict[str, Set[str]]:
+        """Hit set per category for one text"""
+        return self.hit_sets(self.find(text))
+
+    def score_found(self, found: Set[int]) -> int:
+        """Sum of category weights over every keyword listing in a result of find()"""
+        weights = self.pattern_weights
+        return sum(weights[index] for index in found)
+
+    def score_many(self, texts: List[str]) -> List[int]:
+        """Score a batch of texts in one pass per pattern"""
+        return [self.score_found(found) for found in self.find_many(texts)]
+
+    def score(self, text: str) -> int:
+        return self.score_found(self.find(text))
@@ -1,13 +1,15 @@
 import re
+import hashlib
 import logging
 import random
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Set, Tuple
 from datetime import datetime, timedelta
 from app.models.lead import Lead
 from app.services.ai_enhancer import AIEnhancer, EnhancedQuery
 from app.services.openai_service import OpenAIService, AIAnalysisResult
 from app.services.simple_lead_filter import SimpleLeadFilter
 from app.core.ai_config import get_ai_config
+from app.services import scoring_pool
 from app.services.business_mapping_hyperfocus import BUSINESS_MAPPINGS, INDUSTRY_MAPPINGS
 
 logger = logging.getLogger(__name__)
@@ -25,6 +27,12 @@ class LeadFilter:
         self.use_improved_ai = ai_config["use_improved_scoring"]
         # Use the configured threshold
         self.ai_threshold = ai_config["threshold"]
+        # Cascade: rule-based pre-screen before OpenAI
+        self.use_cascade = ai_config["use_cascade"]
+        self.cascade_top_k = ai_config["cascade_top_k"]
+        self.cascade_candidates_per_result = ai_config["cascade_candidates_per_result"]
+        self.cascade_min_score = ai_config["cascade_min_score"]
+        self.cascade_audit_sample = ai_config["cascade_audit_sample"]
         
         # Initialize AI services
         self.ai_enhancer = AIEnhancer(use_improved_scoring=self.use_improved_ai)
@@ -120,8 +128,12 @@ class LeadFilter:
         logger.info(f"Keyword match for text (first 100 chars): {text[:100]}... - Keywords: {keywords}, Matched: {matched_keywords}, Result: {has_match}")
         return has_match
     
-    def filter_posts(self, posts: List[Dict[str, Any]], user_input: str, business_type: Optional[str] = None, time_range: str = "all_time") -> List[Lead]:
-        """Filter posts using AI-enhanced analysis for better relevance with time-based filtering"""
+    def filter_posts(self, posts: List[Dict[str, Any]], user_input: str, business_type: Optional[str] = None, time_range: str = "all_time",
+                     result_count: Optional[int] = None) -> List[Lead]:
+        """
+        Filter posts using AI-enhanced analysis for better relevance with time-based filtering.
+        result_count (leads the search asked for) sizes the OpenAI cascade so it can't cap the results.
+        """
         try:
             # DEBUG: Log current configuration
             logger.info(f"🔧 FILTER DEBUG: use_openai={self.use_openai}, use_improved_ai={self.use_improved_ai}, threshold={self.ai_threshold}")
@@ -138,7 +150,7 @@ class LeadFilter:
             if self.use_openai and self.openai_service:
                 logger.info("🚀 USING: OpenAI service for intelligent analysis")
                 logger.info(f"🔍 DEBUG: About to call OpenAI with {len(time_filtered_posts)} posts")
-                result, metrics = self._filter_posts_with_openai(time_filtered_posts, user_input, business_type)
+                result, metrics = self._filter_posts_with_openai(time_filtered_posts, user_input, business_type, result_count)
                 logger.info(f"🔍 DEBUG: OpenAI returned {len(result)} leads")
                 logger.info(f"💰 OPENAI METRICS: {metrics}")
                 # Store metrics for later retrieval
@@ -191,8 +203,10 @@ class LeadFilter:
         """Get metrics from the last filtering operation"""
         return self._last_metrics
     
-    def _filter_posts_with_openai(self, posts: List[Dict[str, Any]], user_input: str, business_type: Optional[str] = None) -> tuple[List[Lead], Dict[str, Any]]:
+    def _filter_posts_with_openai(self, posts: List[Dict[str, Any]], user_input: str, business_type: Optional[str] = None,
+                                  result_count: Optional[int] = None) -> tuple[List[Lead], Dict[str, Any]]:
         """Filter posts using OpenAI service and return leads with metrics"""
+        all_posts = posts  # posts is narrowed to the cascade candidates below
         try:
             # Reset metrics for this operation
             self.openai_service.reset_metrics()
@@ -200,12 +214,18 @@ class LeadFilter:
             # Enhance query with OpenAI
             enhanced_query = self.openai_service.enhance_query(user_input, business_type or "General Business")
             
+            # Cascade: only posts the rule-based scorer ranks well (plus an audit sample) reach OpenAI
+            cascade_metrics = None
+            audit_ids = set()
+            if self.use_cascade:
+                posts, audit_ids, cascade_metrics = self._prescreen_posts(posts, user_input, business_type, result_count)
+            
             # Analyze posts with OpenAI (batch processing for efficiency)
             analysis_results = self.openai_service.batch_analyze_posts(posts, user_input, business_type or "General Business")
             
             filtered_leads = []
-            total_tokens = 0
-            total_cost = 0.0
+            candidates_passed = 0
+            audit_passed = 0
             
             for i, post in enumerate(posts):
                 if i >= len(analysis_results):
@@ -217,6 +237,10 @@ class LeadFilter:
                 
                 # Only include posts with high relevance and struggle indicators
                 if analysis.relevance_score >= self.ai_threshold and analysis.is_struggle_post:
+                    if id(post) in audit_ids:
+                        audit_passed += 1  # A lead the pre-screen would have dropped
+                    else:
+                        candidates_passed += 1
                     # Generate AI summary
                     ai_summary = self.openai_service.generate_lead_summary(post, analysis)
                     
@@ -257,17 +281,30 @@ class LeadFilter:
             metrics = {
                 "tokens_used": openai_metrics["tokens_used"],
                 "cost": openai_metrics["cost"],
+                "llm_cache_hits": openai_metrics["llm_cache_hits"],
+                "tokens_saved": openai_metrics["tokens_saved"],
+                "cost_saved": openai_metrics["cost_saved"],
                 "model_used": openai_metrics["model_used"],
-                "posts_analyzed": len(posts),
+                "posts_analyzed": len(all_posts),
                 "results_returned": len(filtered_leads)
             }
+            if cascade_metrics is not None:
+                cascade_metrics["candidates_passed"] = candidates_passed
+                cascade_metrics["removed_by_openai"] = cascade_metrics["candidates_sent"] - candidates_passed
+                cascade_metrics["audit_passed"] = audit_passed
+                # Leads the pre-screen is estimated to lose: the audit pass rate over the posts it dropped
+                audited = cascade_metrics["audit_sampled"]
+                cascade_metrics["estimated_missed_leads"] = round(audit_passed / audited * cascade_metrics["removed_by_prescreen"], 1) if audited else 0.0
+                metrics["cascade"] = cascade_metrics
+                logger.info(f"🪜 CASCADE: {cascade_metrics}")
             
-            logger.info(f"OpenAI filtering: {len(posts)} posts down to {len(filtered_leads)} high-relevance leads ({self.ai_threshold}+ threshold)")
+            logger.info(f"OpenAI filtering: {len(all_posts)} posts down to {len(filtered_leads)} high-relevance leads ({self.ai_threshold}+ threshold)")
             return filtered_leads, metrics
             
         except Exception as e:
             logger.error(f"OpenAI filtering failed: {e}")
             # Fallback to rule-based AI
+            posts = all_posts
             fallback_result = self._filter_posts_with_rule_based_ai(posts, user_input, business_type)
             fallback_metrics = {
                 "tokens_used": 0,
@@ -279,70 +316,116 @@ class LeadFilter:
             self._last_metrics = fallback_metrics
             return fallback_result, fallback_metrics
     
-    def _filter_posts_with_rule_based_ai(self, posts: List[Dict[str, Any]], user_input: str, business_type: Optional[str] = None) -> List[Lead]:
-        """Filter posts using rule-based AI enhancer (fallback)"""
-        # Use AI to enhance the query
-        enhanced_query = self.ai_enhancer.enhance_query(user_input, business_type or "General Business")
+    def _prescreen_posts(self, posts: List[Dict[str, Any]], user_input: str, business_type: Optional[str] = None,
+                         result_count: Optional[int] = None) -> Tuple[List[Dict[str, Any]], Set[int], Dict[str, Any]]:
+        """
+        Cascade stage 1: rank posts with the rule-based scorer and keep the top
+        cascade_top_k (or cascade_candidates_per_result per requested lead, if more)
+        at or above cascade_min_score. A random sample of the rest
+        (cascade_audit_sample, seeded by the search so reruns audit the same posts) is
+        kept too, so the recall of this stage stays measurable.
+        Returns (posts for OpenAI in their original order, id()s of the audit posts, stage metrics).
+        """
+        _, relevance_scores = self._rule_based_scores(posts, user_input, business_type)
+        ranked = sorted(range(len(posts)), key=lambda i: -relevance_scores[i].overall_score)
+        top_k = max(self.cascade_top_k, self.cascade_candidates_per_result * (result_count or 0))
+        chosen = [i for i in ranked if relevance_scores[i].overall_score >= self.cascade_min_score][:top_k]
+        chosen_set = set(chosen)
+        rest = [i for i in range(len(posts)) if i not in chosen_set]
+        seed = hashlib.sha256(f"{' '.join(user_input.lower().split())}|{business_type or ''}".encode("utf-8")).hexdigest()
+        audit = random.Random(seed).sample(rest, min(self.cascade_audit_sample, len(rest)))
         
-        filtered_leads = []
-        logger.info(f"Rule-based AI filtering ({'IMPROVED' if self.use_improved_ai else 'ORIGINAL'}): {len(posts)} posts with enhanced query: {enhanced_query.enhanced_problem}")
+        selected = sorted(chosen_set.union(audit))
+        cascade_metrics = {
+            "posts_in": len(posts),
+            "removed_by_prescreen": len(rest) - len(audit),  # Audit posts still reach OpenAI
+            "sent_to_openai": len(selected),
+            "candidates_sent": len(chosen),
+            "audit_sampled": len(audit)
+        }
+        logger.info(f"🪜 CASCADE pre-screen: {len(posts)} posts -> {len(chosen)} candidates + {len(audit)} audit (min score {self.cascade_min_score}, top {top_k})")
+        return [posts[i] for i in selected], {id(posts[i]) for i in audit}, cascade_metrics
+    
+    def _rule_based_scores(self, posts: List[Dict[str, Any]], user_input: str, business_type: Optional[str] = None) -> Tuple[EnhancedQuery, List[Any]]:
+        """Enhanced query and one RelevanceScore per post from the rule-based AI enhancer"""
+        enhanced_query = self.ai_enhancer.enhance_query(user_input, business_type or "General Business")
         
-        for post in posts:
-                # Use AI to analyze post relevance with business/industry context
-                is_business = business_type in BUSINESS_MAPPINGS
-                is_industry = business_type in INDUSTRY_MAPPINGS
-                
-                relevance_score = self.ai_enhancer.analyze_post_relevance(
-                    post, 
-                    enhanced_query.keywords, 
+        # Use AI to analyze post relevance with business/industry context (whole batch at once)
+        is_business = business_type in BUSINESS_MAPPINGS
+        is_industry = business_type in INDUSTRY_MAPPINGS
+        relevance_scores = None
+        if scoring_pool.should_use_process_pool(len(posts)):
+            try:
+                relevance_scores = scoring_pool.analyze_posts_relevance(
+                    self.use_improved_ai,
+                    posts,
+                    enhanced_query.keywords,
                     business_type=business_type if is_business else None,
                     industry_type=business_type if is_industry else None
                 )
-                
+            except Exception as e:
+                logger.warning(f"Process-pool scoring failed, scoring in-process: {e}")
+        if relevance_scores is None:
+            relevance_scores = self.ai_enhancer.analyze_posts_relevance(
+                posts, 
+                enhanced_query.keywords, 
+                business_type=business_type if is_business else None,
+                industry_type=business_type if is_industry else None
+            )
+        return enhanced_query, relevance_scores
+    
+    def _filter_posts_with_rule_based_ai(self, posts: List[Dict[str, Any]], user_input: str, business_type: Optional[str] = None) -> List[Lead]:
+        """Filter posts using rule-based AI enhancer (fallback)"""
+        logger.info(f"Rule-based AI filtering ({'IMPROVED' if self.use_improved_ai else 'ORIGINAL'}): {len(posts)} posts")
+        enhanced_query, relevance_scores = self._rule_based_scores(posts, user_input, business_type)
+        logger.info(f"Rule-based AI enhanced query: {enhanced_query.enhanced_problem}")
+        
+        filtered_leads = []
+        for post, relevance_score in zip(posts, relevance_scores):
             logger.info(f"Rule-based AI Analysis - Post: {post['title'][:50]}... Score: {relevance_score.overall_score}")
-                
-                # Only include posts with high relevance (configurable threshold)
-                if relevance_score.overall_score >= self.ai_threshold:
-                    # Extract business context
-                    business_context = self.ai_enhancer.extract_business_context(post["text"])
-                    
-                    # Create enhanced snippet
-                    snippet = self._create_enhanced_snippet(post["text"], enhanced_query.keywords)
-                    
-                    # Find matched keywords
-                    text_lower = post["text"].lower()
-                    matched_keywords = [keyword for keyword in enhanced_query.keywords if keyword in text_lower]
-                    
-                    # Create enhanced lead with AI insights
-                    lead = Lead(
-                        title=post["title"],
-                        subreddit=post["subreddit"],
-                        snippet=snippet,
-                        permalink=post["permalink"],
-                        author=post["author"],
-                        created_utc=post["created_utc"],
-                        score=post["score"],
-                        matched_keywords=matched_keywords,
-                        # AI-enhanced fields
-                        ai_relevance_score=relevance_score.overall_score,
-                        urgency_level=relevance_score.urgency_level,
-                        business_context=business_context.business_type,
-                        problem_category=business_context.problem_category
-                    )
-                    
-                    filtered_leads.append(lead)
-            
-            # Sort by AI relevance score
-            filtered_leads.sort(key=lambda x: x.ai_relevance_score or 0, reverse=True)
             
-            # Debug: Log score distribution
-            scores = [lead.ai_relevance_score for lead in filtered_leads if lead.ai_relevance_score]
-            if scores:
-                logger.info(f"Rule-based Score distribution: min={min(scores)}, max={max(scores)}, avg={sum(scores)/len(scores):.1f}")
-                logger.info(f"Score ranges: 25-34: {len([s for s in scores if 25 <= s < 35])}, 35-49: {len([s for s in scores if 35 <= s < 50])}, 50+: {len([s for s in scores if s >= 50])}")
-            
-            logger.info(f"Rule-based AI filtering: {len(posts)} posts down to {len(filtered_leads)} high-relevance leads ({self.ai_threshold}+ threshold, {'IMPROVED' if self.use_improved_ai else 'ORIGINAL'} mode)")
-            return filtered_leads
+            # Only include posts with high relevance (configurable threshold)
+            if relevance_score.overall_score >= self.ai_threshold:
+                # Extract business context
+                business_context = self.ai_enhancer.extract_business_context(post["text"])
+                
+                # Create enhanced snippet
+                snippet = self._create_enhanced_snippet(post["text"], enhanced_query.keywords)
+                
+                # Find matched keywords
+                text_lower = post["text"].lower()
+                matched_keywords = [keyword for keyword in enhanced_query.keywords if keyword in text_lower]
+                
+                # Create enhanced lead with AI insights
+                lead = Lead(
+                    title=post["title"],
+                    subreddit=post["subreddit"],
+                    snippet=snippet,
+                    permalink=post["permalink"],
+                    author=post["author"],
+                    created_utc=post["created_utc"],
+                    score=post["score"],
+                    matched_keywords=matched_keywords,
+                    # AI-enhanced fields
+                    ai_relevance_score=relevance_score.overall_score,
+                    urgency_level=relevance_score.urgency_level,
+                    business_context=business_context.business_type,
+                    problem_category=business_context.problem_category
+                )
+                
+                filtered_leads.append(lead)
+        
+        # Sort by AI relevance score
+        filtered_leads.sort(key=lambda x: x.ai_relevance_score or 0, reverse=True)
+        
+        # Debug: Log score distribution
+        scores = [lead.ai_relevance_score for lead in filtered_leads if lead.ai_relevance_score]
+        if scores:
+            logger.info(f"Rule-based Score distribution: min={min(scores)}, max={max(scores)}, avg={sum(scores)/len(scores):.1f}")
+            logger.info(f"Score ranges: 25-34: {len([s for s in scores if 25 <= s < 35])}, 35-49: {len([s for s in scores if 35 <= s < 50])}, 50+: {len([s for s in scores if s >= 50])}")
+        
+        logger.info(f"Rule-based AI filtering: {len(posts)} posts down to {len(filtered_leads)} high-relevance leads ({self.ai_threshold}+ threshold, {'IMPROVED' if self.use_improved_ai else 'ORIGINAL'} mode)")
+        return filtered_leads
     
     def _basic_filter_posts(self, posts: List[Dict[str, Any]], user_input: str) -> List[Lead]:
         """Original filtering method as fallback"""
@@ -0,0 +1,201 @@
+"""
+Content-addressed LLM response cache
+OpenAI analyses and summaries are keyed by a hash of (model, prompt template, its
+version and the settings that shape it, post id + content hash, normalized problem,
+business type), so the same popular post analyzed for the same problem is paid for
+once. Entries live in
+their own cache backend file (the SQLite backend of the result cache), expire after
+settings.llm_cache_ttl_hours and are evicted by size from a background task.
+Each entry remembers the tokens and cost it took, so hits report what they saved.
+"""
+
+import asyncio
+import hashlib
+import threading
+import time
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.services.cache_backend import CacheBackend, MemoryCacheBackend, SQLiteCacheBackend
+
+logger = logging.getLogger(__name__)
+
+# Bump a template's version whenever its prompt changes, so old answers are not reused
+PROMPT_VERSIONS = {
+    "post_analysis": 1,
+    "batch_analysis": 2,  # v2: bodies cut to a token budget around the problem's keywords (prompt_packer)
+    "lead_summary": 1,
+    "batch_summary": 1,
+}
+
+
+def _normalize(text: Optional[str]) -> str:
+    return " ".join(str(text or "").lower().split())
+
+
+def post_fingerprint(post: Dict[str, Any]) -> str:
+    """Post id plus a hash of its content (an edited post gets a new fingerprint)"""
+    content = f"{post.get('title', '')}\n{post.get('text') or post.get('content') or ''}"
+    return f"{post.get('id', '')}:{hashlib.sha256(content.encode('utf-8')).hexdigest()[:24]}"
+
+
+class LLMResponseCache:
+    """Persistent cache of per-post LLM answers with token/cost savings counters"""
+
+    def __init__(self, backend: Optional[CacheBackend] = None):
+        self._backend = backend
+        self._lock = threading.Lock()
+        self._eviction_task: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+        self.tokens_saved = 0
+        self.cost_saved = 0.0
+
+    @property
+    def backend(self) -> CacheBackend:
+        with self._lock:
+            if self._backend is None:
+                try:
+                    self._backend = SQLiteCacheBackend(settings.llm_cache_path)
+                    logger.info(f"💾 LLM CACHE: Using {settings.llm_cache_path}")
+                except Exception as e:
+                    logger.error(f"❌ LLM CACHE: Cannot open {settings.llm_cache_path} ({e}), falling back to memory")
+                    self._backend = MemoryCacheBackend(settings.llm_cache_max_entries, settings.llm_cache_max_bytes)
+            return self._backend
+
+    def make_key(self, template: str, model: str, post: Dict[str, Any], problem: str = "", business_type: str = "",
+                 variant: str = "") -> str:
+        """variant: any setting that changes the rendered prompt (e.g. the per-post body budget)"""
+        parts = [model, f"{template}:v{PROMPT_VERSIONS[template]}", post_fingerprint(post), _normalize(problem), _normalize(business_type), variant]
+        return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Tuple[Any, int, float]]:
+        """(value, tokens, cost) of a cached answer within the TTL, else None"""
+        if not settings.llm_cache_enabled:
+            return None
+        try:
+            entry = self.backend.get(key)
+        except Exception as e:
+            logger.warning(f"⚠️ LLM CACHE read failed: {e}")
+            entry = None
+        if entry is not None:
+            created_at, stored = entry
+            if time.time() - created_at <= settings.llm_cache_ttl_hours * 3600:
+                with self._lock:
+                    self.hits += 1
+                    self.tokens_saved += stored["tokens"]
+                    self.cost_saved += stored["cost"]
+                return stored["value"], stored["tokens"], stored["cost"]
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def get_many(self, keys: List[str]) -> List[Optional[Tuple[Any, int, float]]]:
+        """Cached answer (value, tokens, cost) or None for each key, in one backend round-trip"""
+        if not settings.llm_cache_enabled or not keys:
+            return [None] * len(keys)
+        try:
+            entries = self.backend.get_many(keys)
+        except Exception as e:
+            logger.warning(f"⚠️ LLM CACHE read failed: {e}")
+            entries = [None] * len(keys)
+        cutoff = time.time() - settings.llm_cache_ttl_hours * 3600
+        found = [entry[1] if entry is not None and entry[0] >= cutoff else None for entry in entries]
+        with self._lock:
+            for stored in found:
+                if stored is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+                    self.tokens_saved += stored["tokens"]
+                    self.cost_saved += stored["cost"]
+        return [(stored["value"], stored["tokens"], stored["cost"]) if stored else None for stored in found]
+
+    def get_all(self, keys: List[str]) -> Optional[List[Tuple[Any, int, float]]]:
+        """Cached answers for every key, or None (counted as one miss) if any is missing or expired"""
+        if not settings.llm_cache_enabled or not keys:
+            return None
+        found = []
+        try:
+            for key in keys:
+                entry = self.backend.get(key)
+                if entry is None or time.time() - entry[0] > settings.llm_cache_ttl_hours * 3600:
+                    break
+                found.append(entry[1])
+        except Exception as e:
+            logger.warning(f"⚠️ LLM CACHE read failed: {e}")
+        with self._lock:
+            if len(found) < len(keys):
+                self.misses += 1
+                return None
+            self.hits += len(found)
+            self.tokens_saved += sum(stored["tokens"] for stored in found)
+            self.cost_saved += sum(stored["cost"] for stored in found)
+        return [(stored["value"], stored["tokens"], stored["cost"]) for stored in found]
+
+    def set(self, key: str, value: Any, tokens: int = 0, cost: float = 0.0):
+        """Store an answer with what it cost (its share of the call for batched prompts)"""
+        if not settings.llm_cache_enabled:
+            return
+        try:
+            self.backend.set(key, {"value": value, "tokens": tokens, "cost": cost}, time.time())
+        except Exception as e:
+            logger.warning(f"⚠️ LLM CACHE write failed: {e}")
+
+    def set_many(self, entries: List[Tuple[str, Any, int, float]]):
+        """Store (key, value, tokens, cost) answers in one backend write (e.g. one analyzed batch)"""
+        if not settings.llm_cache_enabled or not entries:
+            return
+        now = time.time()
+        try:
+            self.backend.set_many([(key, {"value": value, "tokens": tokens, "cost": cost}, now) for key, value, tokens, cost in entries])
+        except Exception as e:
+            logger.warning(f"⚠️ LLM CACHE write failed: {e}")
+
+    def evict(self) -> int:
+        evicted = self.backend.evict(settings.llm_cache_max_entries, settings.llm_cache_max_bytes, settings.llm_cache_ttl_hours * 3600)
+        if evicted:
+            logger.info(f"🗑️ LLM CACHE EVICT: Removed {evicted} entries")
+        return evicted
+
+    def start_background_eviction(self):
+        """Run evict() every settings.llm_cache_eviction_interval_seconds (FastAPI startup hook)"""
+        if self._eviction_task and not self._eviction_task.done():
+            return
+        self._eviction_task = asyncio.create_task(self._eviction_loop())
+
+    async def _eviction_loop(self):
+        while True:
+            if settings.llm_cache_enabled:
+                try:
+                    await asyncio.to_thread(self.evict)
+                except Exception as e:
+                    logger.warning(f"⚠️ LLM CACHE EVICT failed: {e}")
+            await asyncio.sleep(settings.llm_cache_eviction_interval_seconds)
+
+    async def stop_background_eviction(self):
+        if self._eviction_task and not self._eviction_task.done():
+            self._eviction_task.cancel()
+            try:
+                await self._eviction_task
+            except asyncio.CancelledError:
+                pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        storage = self.backend.get_stats()
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": settings.llm_cache_enabled,
+                "entries": storage["entries"],
+                "bytes": storage["bytes"],
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+                "tokens_saved": self.tokens_saved,
+                "cost_saved": round(self.cost_saved, 4)
+            }
+
+
+# Global LLM response cache shared by OpenAIService and SummaryService
+llm_cache = LLMResponseCache()
@@ -3,12 +3,16 @@ OpenAI Service for intelligent lead analysis and filtering
 Replaces rule-based AI with actual OpenAI API integration
 """
 
+import asyncio
 import logging
-from typing import List, Dict, Any, Optional
-from dataclasses import dataclass
+import time
+from typing import List, Dict, Any, Optional, Tuple
+from dataclasses import dataclass, asdict
 import json
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 from app.core.config import settings
+from app.services.llm_cache import llm_cache
+from app.services.prompt_packer import PromptBatch, pack_batches
 
 logger = logging.getLogger(__name__)
 
@@ -33,6 +37,67 @@ class EnhancedQuery:
     business_context: str
     target_audience: str
 
+
+def _result_from_dict(result: Dict[str, Any]) -> AIAnalysisResult:
+    return AIAnalysisResult(
+        relevance_score=result.get("relevance_score", 0),
+        is_struggle_post=result.get("is_struggle_post", False),
+        urgency_level=result.get("urgency_level", "Low"),
+        business_type=result.get("business_type", "Unknown"),
+        problem_category=result.get("problem_category", "General"),
+        key_insights=result.get("key_insights", []),
+        confidence=result.get("confidence", 0.0),
+        reasoning=result.get("reasoning", "No reasoning provided")
+    )
+
+
+def _fallback_result(business_type: str) -> AIAnalysisResult:
+    """Medium-relevance placeholder when a batch response could not be read"""
+    return AIAnalysisResult(
+        relevance_score=50,
+        is_struggle_post=True,
+        urgency_level="Medium",
+        business_type=business_type or "Unknown",
+        problem_category="General",
+        key_insights=["Batch analysis failed - using fallback"],
+        confidence=0.3,
+        reasoning="JSON parsing failed - fallback analysis"
+    )
+
+
+def _salvage_json_array(content: str) -> List[Any]:
+    """Complete elements of a JSON array that was cut off (max_tokens) or wrapped in prose/fences"""
+    start = content.find("[")
+    if start < 0:
+        return []
+    decoder = json.JSONDecoder()
+    items = []
+    position = start + 1
+    while True:
+        while position < len(content) and content[position] in " \t\r\n,":
+            position += 1
+        if position >= len(content) or content[position] == "]":
+            return items
+        try:
+            item, position = decoder.raw_decode(content, position)
+        except json.JSONDecodeError:
+            return items  # The truncated tail
+        items.append(item)
+
+
+def _error_result(reason: str) -> AIAnalysisResult:
+    """Zero-relevance result for posts whose batch request failed"""
+    return AIAnalysisResult(
+        relevance_score=0,
+        is_struggle_post=False,
+        urgency_level="Low",
+        business_type="Unknown",
+        problem_category="General",
+        key_insights=[],
+        confidence=0.0,
+        reasoning=reason
+    )
+
 class OpenAIService:
     """
     OpenAI-powered service for intelligent lead finding and analysis.
@@ -74,20 +139,35 @@ class OpenAIService:
         # Initialize metrics tracking
         self._total_tokens = 0
         self._total_cost = 0.0
-    
+        self._cache_hits = 0
+        self._tokens_saved = 0
+        self._cost_saved = 0.0
+        self.last_batch_stats: Dict[str, Any] = {}
+
     def reset_metrics(self):
         """Reset token and cost tracking"""
         self._total_tokens = 0
         self._total_cost = 0.0
-    
+        self._cache_hits = 0
+        self._tokens_saved = 0
+        self._cost_saved = 0.0
+
     def get_metrics(self) -> Dict[str, Any]:
-        """Get current token and cost metrics"""
+        """Get current token and cost metrics (plus what the LLM response cache saved)"""
         return {
             "tokens_used": self._total_tokens,
             "cost": self._total_cost,
-            "model_used": self.model
+            "model_used": self.model,
+            "llm_cache_hits": self._cache_hits,
+            "tokens_saved": self._tokens_saved,
+            "cost_saved": self._cost_saved
         }
-    
+
+    def _record_cache_hit(self, tokens: int, cost: float, count: int = 1):
+        self._cache_hits += count
+        self._tokens_saved += tokens
+        self._cost_saved += cost
+
     def _calculate_cost(self, tokens_used: int) -> float:
         """Calculate cost based on model and token usage"""
         # gpt-3.5-turbo pricing: $0.0015 per 1K input tokens, $0.002 per 1K output tokens
@@ -196,6 +276,12 @@ Respond in JSON format:
         """
         Analyze a Reddit post using OpenAI to determine its relevance and extract insights.
         """
+        cache_key = llm_cache.make_key("post_analysis", self.model, post, user_problem, business_type)
+        cached = llm_cache.get(cache_key)
+        if cached:
+            value, tokens, cost = cached
+            self._record_cache_hit(tokens, cost)
+            return AIAnalysisResult(**value)
         try:
             logger.info(f"🔍 OPENAI DEBUG: Analyzing post: '{post.get('title', '')[:50]}...' for problem: '{user_problem}'")
             post_text = f"Title: {post.get('title', '')}\n\nContent: {post.get('text', '')}"
@@ -258,7 +344,9 @@ Focus on finding people who are ACTIVELY STRUGGLING, not those sharing success s
             try:
                 content = response.choices[0].message.content
                 result = json.loads(content)
+                parsed = True
             except json.JSONDecodeError as e:
+                parsed = False
                 logger.error(f"JSON parsing error in post analysis: {e}")
                 logger.error(f"Raw content: {content}")
                 # Return fallback result
@@ -272,18 +360,12 @@ Focus on finding people who are ACTIVELY STRUGGLING, not those sharing success s
                     "confidence": 0.3,
                     "reasoning": "JSON parsing failed - fallback analysis"
                 }
-            
-            return AIAnalysisResult(
-                relevance_score=result.get("relevance_score", 0),
-                is_struggle_post=result.get("is_struggle_post", False),
-                urgency_level=result.get("urgency_level", "Low"),
-                business_type=result.get("business_type", "Unknown"),
-                problem_category=result.get("problem_category", "General"),
-                key_insights=result.get("key_insights", []),
-                confidence=result.get("confidence", 0.0),
-                reasoning=result.get("reasoning", "No reasoning provided")
-            )
-            
+
+            analysis = _result_from_dict(result)
+            if parsed:
+                llm_cache.set(cache_key, asdict(analysis), tokens_used, cost)
+            return analysis
+
         except Exception as e:
             logger.error(f"Error analyzing post with OpenAI: {e}")
             # Fallback analysis
@@ -301,33 +383,158 @@ Focus on finding people who are ACTIVELY STRUGGLING, not those sharing success s
     def batch_analyze_posts(self, posts: List[Dict[str, Any]], user_problem: str, business_type: str) -> List[AIAnalysisResult]:
         """
         Analyze multiple posts efficiently using multiple batches for large datasets.
+        Posts that already have a cached analysis are answered from the LLM cache; only
+        the others are packed into batches (so the batches stay full). Batches are packed
+        by prompt_packer (long bodies cut around the problem's keywords, requests filled
+        up to a target input size) and sent concurrently (at most
+        settings.openai_batch_concurrency in flight) with the async client; results come
+        back in post order, one per post, and a failed batch only affects its own posts.
         """
+        logger.info(f"🔍 OPENAI DEBUG: Starting batch analysis of {len(posts)} posts for problem: '{user_problem}'")
+        if not posts:
+            return []
         try:
-            logger.info(f"🔍 OPENAI DEBUG: Starting batch analysis of {len(posts)} posts for problem: '{user_problem}'")
-            if not posts:
-                return []
-            
-            all_results = []
-            batch_size = 20  # Process 20 posts per batch for better efficiency
-            total_batches = (len(posts) + batch_size - 1) // batch_size
-            
-            logger.info(f"📊 Processing {len(posts)} posts in {total_batches} batches of {batch_size}")
-            
-            for batch_num in range(total_batches):
-                start_idx = batch_num * batch_size
-                end_idx = min(start_idx + batch_size, len(posts))
-                batch_posts = posts[start_idx:end_idx]
-                
-                logger.info(f"🔄 Processing batch {batch_num + 1}/{total_batches} (posts {start_idx + 1}-{end_idx})")
-                
-                # Prepare batch analysis prompt
-                posts_text = ""
-                for i, post in enumerate(batch_posts):
-                    posts_text += f"\n--- POST {start_idx + i + 1} ---\n"
-                    posts_text += f"Title: {post.get('title', '')}\n"
-                    posts_text += f"Content: {post.get('text', '')}\n"
-                
-                prompt = f"""
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # Normal case: a synchronous caller (LeadFilter in OpenAI mode) with no loop of its own in this thread
+            return asyncio.run(self.abatch_analyze_posts(posts, user_problem, business_type))
+        # Called on an event loop thread: blocking anyway, so send the batches one after another
+        logger.warning("⚠️ OPENAI: batch_analyze_posts called inside an event loop, analyzing batches sequentially")
+        results, pending = self._split_cached(posts, user_problem, business_type)
+        pending_posts = [posts[i] for i in pending]
+        batches = pack_batches(pending_posts, user_problem)
+        self._init_batch_stats(len(posts), len(pending), batches, concurrency=1)
+        analyzed: List[AIAnalysisResult] = []
+        for batch_num, batch in enumerate(batches):
+            analyzed.extend(self._analyze_batch_sync(batch_num, len(batches), batch, user_problem, business_type))
+        for i, analysis in zip(pending, analyzed):
+            results[i] = analysis
+        return results
+
+    def _init_batch_stats(self, posts: int, pending: int, batches: List[PromptBatch], concurrency: int):
+        self.last_batch_stats = {
+            "posts_cached": posts - pending, "posts_sent": pending,
+            "posts_truncated": sum(batch.truncated for batch in batches),
+            "estimated_input_tokens": sum(batch.input_tokens for batch in batches),
+            "batches": len(batches), "failed_batches": 0, "retried_batches": 0, "concurrency": concurrency
+        }
+
+    def _batch_attempt_failed(self, batch_num: int, attempt: int, error: Exception):
+        """Bookkeeping for a failed batch attempt (the first failure is retried once)"""
+        if attempt == 0:
+            self.last_batch_stats["retried_batches"] += 1
+            logger.warning(f"⚠️ OPENAI: batch {batch_num + 1} failed ({error}), retrying once")
+        else:
+            self.last_batch_stats["failed_batches"] += 1
+            logger.error(f"❌ OPENAI: batch {batch_num + 1} failed twice, skipping its posts: {error}")
+
+    def _split_cached(self, posts: List[Dict[str, Any]], user_problem: str, business_type: str) -> Tuple[List[Optional[AIAnalysisResult]], List[int]]:
+        """Results list with cached analyses filled in, and the indices of the posts still to analyze"""
+        cached = llm_cache.get_many(self._batch_cache_keys(posts, user_problem, business_type))
+        results: List[Optional[AIAnalysisResult]] = [None] * len(posts)
+        pending = []
+        hits = tokens = 0
+        cost = 0.0
+        for i, entry in enumerate(cached):
+            if entry is None:
+                pending.append(i)
+                continue
+            value, entry_tokens, entry_cost = entry
+            results[i] = AIAnalysisResult(**value)
+            hits, tokens, cost = hits + 1, tokens + entry_tokens, cost + entry_cost
+        if hits:
+            self._record_cache_hit(tokens, cost, hits)
+            logger.info(f"💾 LLM CACHE: {hits}/{len(posts)} posts already analyzed, sending {len(pending)}")
+        return results, pending
+
+    async def abatch_analyze_posts(self, posts: List[Dict[str, Any]], user_problem: str, business_type: str) -> List[AIAnalysisResult]:
+        """Async batch analysis: cached posts first, the rest in concurrent batches under a semaphore, results in post order"""
+        # LLM cache reads and writes are SQLite I/O: keep them off the event loop the batches share
+        results, pending = await asyncio.to_thread(self._split_cached, posts, user_problem, business_type)
+        pending_posts = [posts[i] for i in pending]
+        batches = pack_batches(pending_posts, user_problem)
+        concurrency = max(1, settings.openai_batch_concurrency)
+        self._init_batch_stats(len(posts), len(pending), batches, concurrency)
+        if not batches:
+            return results
+        logger.info(f"📊 Processing {len(pending_posts)} posts in {len(batches)} batches ({concurrency} concurrent)")
+        started = time.perf_counter()
+
+        import httpx
+        client = AsyncOpenAI(
+            api_key=settings.openai_api_key,
+            http_client=httpx.AsyncClient(
+                timeout=30.0,
+                limits=httpx.Limits(max_keepalive_connections=concurrency, max_connections=concurrency)
+            )
+        )
+        semaphore = asyncio.Semaphore(concurrency)
+        try:
+            batch_results = await asyncio.gather(*(
+                self._analyze_batch_async(client, semaphore, batch_num, len(batches), batch, user_problem, business_type)
+                for batch_num, batch in enumerate(batches)
+            ))
+        finally:
+            await client.close()
+
+        # Merge back: the j-th analyzed post is posts[pending[j]]
+        analyzed = [result for batch in batch_results for result in batch]
+        for i, analysis in zip(pending, analyzed):
+            results[i] = analysis
+        self.last_batch_stats["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        logger.info(f"✅ Completed batch analysis: {len(results)} total results for {len(posts)} posts ({self.last_batch_stats})")
+        return results
+
+    async def _analyze_batch_async(self, client: "AsyncOpenAI", semaphore: asyncio.Semaphore, batch_num: int, total_batches: int,
+                                   batch: PromptBatch, user_problem: str, business_type: str) -> List[AIAnalysisResult]:
+        """One batch with one retry; on failure only this batch gets fallback results"""
+        batch_posts = batch.posts
+        last_error = None
+        for attempt in range(2):
+            try:
+                async with semaphore:
+                    logger.info(f"🔄 Processing batch {batch_num + 1}/{total_batches} ({len(batch_posts)} posts, ~{batch.input_tokens} tokens)")
+                    response = await client.chat.completions.create(**self._batch_request(batch, user_problem, business_type))
+                batch_results, cache_entries = self._parse_batch_response(response, batch_posts, user_problem, business_type, batch_num)
+            except Exception as e:
+                last_error = e
+                self._batch_attempt_failed(batch_num, attempt, e)
+                continue
+            await asyncio.to_thread(llm_cache.set_many, cache_entries)
+            return batch_results
+        return [_error_result(f"Error in analysis: {last_error}") for _ in batch_posts]
+
+    def _analyze_batch_sync(self, batch_num: int, total_batches: int, batch: PromptBatch, user_problem: str,
+                            business_type: str) -> List[AIAnalysisResult]:
+        """Blocking twin of _analyze_batch_async: same single retry, same fallback"""
+        last_error = None
+        for attempt in range(2):
+            try:
+                logger.info(f"🔄 Processing batch {batch_num + 1}/{total_batches} ({len(batch.posts)} posts, ~{batch.input_tokens} tokens)")
+                response = self.client.chat.completions.create(**self._batch_request(batch, user_problem, business_type))
+                batch_results, cache_entries = self._parse_batch_response(response, batch.posts, user_problem, business_type, batch_num)
+            except Exception as e:
+                last_error = e
+                self._batch_attempt_failed(batch_num, attempt, e)
+                continue
+            llm_cache.set_many(cache_entries)
+            return batch_results
+        return [_error_result(f"Error in analysis: {last_error}") for _ in batch.posts]
+
+    def _batch_cache_keys(self, batch_posts: List[Dict[str, Any]], user_problem: str, business_type: str) -> List[str]:
+        # The body budget changes what the prompt shows of each post, so it is part of the key
+        variant = f"body{settings.openai_batch_post_tokens}"
+        return [llm_cache.make_key("batch_analysis", self.model, post, user_problem, business_type, variant) for post in batch_posts]
+
+    def _batch_request(self, batch: PromptBatch, user_problem: str, business_type: str) -> Dict[str, Any]:
+        """chat.completions.create arguments for one packed batch"""
+        posts_text = ""
+        for i, (post, body) in enumerate(zip(batch.posts, batch.bodies)):
+            posts_text += f"\n--- POST {i} ---\n"
+            posts_text += f"Title: {post.get('title', '')}\n"
+            posts_text += f"Content: {body}\n"
+
+        prompt = f"""
 You are analyzing multiple Reddit posts to find businesses that need help with specific problems.
 
 USER'S PROBLEM: "{user_problem}"
@@ -344,7 +551,7 @@ For EACH post, analyze and determine:
 5. Problem category
 6. Key insights (list of 2-3 items)
 
-Respond in JSON format with an array of results:
+Respond in JSON format with an array of results (post_index is the number after POST):
 [
     {{
         "post_index": 0,
@@ -362,78 +569,70 @@ Respond in JSON format with an array of results:
 
 Focus on finding people who are ACTIVELY STRUGGLING, not those sharing success stories.
 """
+        return {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": "You are an expert at analyzing business posts to find genuine struggles and needs. You excel at batch analysis and distinguishing between people asking for help vs. those sharing success stories."},
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": self.temperature,
+            # Room for one JSON result per post (the packer keeps this within openai_batch_output_tokens)
+            "max_tokens": batch.output_tokens
+        }
+
+    def _parse_batch_response(self, response, batch_posts: List[Dict[str, Any]], user_problem: str, business_type: str,
+                              batch_num: int = 0) -> Tuple[List[AIAnalysisResult], List[Tuple[str, Any, int, float]]]:
+        """
+        Track usage and map the JSON array back onto the batch's posts (one result per post, in order).
+        Also returns the LLM cache entries for the answered posts; the caller stores them (off the loop when async).
+        """
+        tokens_used = response.usage.total_tokens
+        cost = self._calculate_cost(tokens_used)
+        logger.info(f"💰 TOKEN USAGE: {tokens_used} tokens, ${cost:.4f} cost (batch {batch_num + 1} of {len(batch_posts)} posts)")
+        self._total_tokens += tokens_used
+        self._total_cost += cost
+
+        # Parse JSON response with error handling
+        content = response.choices[0].message.content
+        try:
+            results = json.loads(content)
+        except json.JSONDecodeError as e:
+            # Keep every complete result object; only the posts after the cut get the fallback
+            results = _salvage_json_array(content or "")
+            finish_reason = getattr(response.choices[0], "finish_reason", None)
+            logger.error(f"JSON parsing error in batch analysis ({e}, finish_reason={finish_reason}), salvaged {len(results)} results")
+            logger.debug(f"Raw content: {content}")
+
+        by_index: Dict[int, AIAnalysisResult] = {}
+        for position, result in enumerate(results if isinstance(results, list) else []):
+            if not isinstance(result, dict):
+                continue
+            index = result.get("post_index", position)
+            if isinstance(index, int) and 0 <= index < len(batch_posts):
+                by_index.setdefault(index, _result_from_dict(result))
+        # Cache what the model actually answered, each post carrying its share of the call
+        keys = self._batch_cache_keys(batch_posts, user_problem, business_type)
+        cache_entries = [
+            (keys[index], asdict(analysis), tokens_used // len(batch_posts) + (1 if index < tokens_used % len(batch_posts) else 0), cost / len(batch_posts))
+            for index, analysis in by_index.items()
+        ]
+        if len(by_index) < len(batch_posts):
+            logger.warning(f"⚠️ OPENAI: batch {batch_num + 1} returned {len(by_index)}/{len(batch_posts)} results, using fallback for the rest")
+        # Fallback (medium relevance) for posts the model skipped or when the JSON was unreadable
+        return [by_index.get(i) or _fallback_result(business_type) for i in range(len(batch_posts))], cache_entries
 
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[
-                        {"role": "system", "content": "You are an expert at analyzing business posts to find genuine struggles and needs. You excel at batch analysis and distinguishing between people asking for help vs. those sharing success stories."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    temperature=self.temperature,
-                    max_tokens=self.max_tokens * 2  # More tokens for batch analysis
-                )
-                
-                # Track token usage and cost for this batch
-                tokens_used = response.usage.total_tokens
-                cost = self._calculate_cost(tokens_used)
-                logger.info(f"💰 TOKEN USAGE: {tokens_used} tokens, ${cost:.4f} cost (batch {batch_num + 1} of {len(batch_posts)} posts)")
-                
-                # Add to total metrics
-                if not hasattr(self, '_total_tokens'):
-                    self._total_tokens = 0
-                    self._total_cost = 0.0
-                self._total_tokens += tokens_used
-                self._total_cost += cost
-                
-                # Parse JSON response with error handling
-                try:
-                    content = response.choices[0].message.content
-                    results = json.loads(content)
-                except json.JSONDecodeError as e:
-                    logger.error(f"JSON parsing error in batch analysis: {e}")
-                    logger.error(f"Raw content: {content}")
-                    # Return fallback results for this batch
-                    results = []
-                    for i in range(len(batch_posts)):
-                        results.append({
-                            "post_index": i,
-                            "relevance_score": 50,  # Medium relevance as fallback
-                            "is_struggle_post": True,
-                            "urgency_level": "Medium",
-                            "business_type": business_type or "Unknown",
-                            "problem_category": "General",
-                            "key_insights": ["Batch analysis failed - using fallback"],
-                            "confidence": 0.3,
-                            "reasoning": "JSON parsing failed - fallback analysis"
-                        })
-                
-                # Convert to AIAnalysisResult objects and add to all_results
-                for result in results:
-                    # Map the post_index back to the actual post index
-                    actual_post_index = start_idx + result.get("post_index", 0)
-                    all_results.append(AIAnalysisResult(
-                        relevance_score=result.get("relevance_score", 0),
-                        is_struggle_post=result.get("is_struggle_post", False),
-                        urgency_level=result.get("urgency_level", "Low"),
-                        business_type=result.get("business_type", "Unknown"),
-                        problem_category=result.get("problem_category", "General"),
-                        key_insights=result.get("key_insights", []),
-                        confidence=result.get("confidence", 0.0),
-                        reasoning=result.get("reasoning", "No reasoning provided")
-                    ))
-            
-            logger.info(f"✅ Completed batch analysis: {len(all_results)} total results for {len(posts)} posts")
-            return all_results
-            
-        except Exception as e:
-            logger.error(f"Error in batch analysis with OpenAI: {e}")
-            # Fallback: analyze posts individually
-            return [self.analyze_post_relevance(post, user_problem, business_type) for post in posts]
-    
     def generate_lead_summary(self, lead: Dict[str, Any], analysis: AIAnalysisResult) -> str:
         """
         Generate a concise summary of the lead and their situation.
         """
+        # The prompt depends on the post and on these analysis fields
+        analysis_context = f"{analysis.business_type}|{analysis.problem_category}|{analysis.urgency_level}|{'|'.join(analysis.key_insights)}"
+        cache_key = llm_cache.make_key("lead_summary", self.model, lead, analysis_context)
+        cached = llm_cache.get(cache_key)
+        if cached:
+            summary, tokens, cost = cached
+            self._record_cache_hit(tokens, cost)
+            return summary
         try:
             prompt = f"""
 Generate a concise, professional summary of this business lead for a service provider.
@@ -463,8 +662,11 @@ Keep it professional and focused on the business opportunity.
                 temperature=self.temperature,
                 max_tokens=200
             )
-            
-            return response.choices[0].message.content.strip()
+
+            summary = response.choices[0].message.content.strip()
+            tokens_used = response.usage.total_tokens
+            llm_cache.set(cache_key, summary, tokens_used, self._calculate_cost(tokens_used))
+            return summary
             
         except Exception as e:
             logger.error(f"Error generating lead summary: {e}")
@@ -0,0 +1,126 @@
+"""
+Ordered, id-indexed post collection used throughout Reddit ingestion
+Replaces the `any(p['id'] == ... for p in all_posts)` scans with O(1) lookups,
+also catches the same post cross-posted to several subreddits, merges metadata
+from every source that returned it and counts duplicates per fetch method.
+"""
+
+import logging
+from collections import defaultdict
+from typing import Dict, List, Any, Optional, Tuple, Iterator
+
+logger = logging.getLogger(__name__)
+
+# Fields where a later snapshot of the same post is more up to date
+_COUNTER_FIELDS = ("score", "num_comments")
+
+# Same author + title only counts as a cross-post when posted this close together
+# (recurring threads like "Weekly Feedback Thread" reuse titles week after week)
+CROSSPOST_WINDOW_SECONDS = 3 * 24 * 3600
+
+
+class PostCollection:
+    """Insertion-ordered set of formatted posts keyed by Reddit post id"""
+
+    def __init__(self):
+        self._posts: Dict[str, Dict[str, Any]] = {}
+        self._methods: Dict[str, str] = {}  # post id -> method that first contributed it
+        self._fingerprints: Dict[Tuple[str, str], str] = {}  # (author, title) -> post id
+        self.added_by_method: Dict[str, int] = defaultdict(int)
+        self.duplicates_by_method: Dict[str, int] = defaultdict(int)
+
+    @staticmethod
+    def _fingerprint(post: Dict[str, Any]) -> Optional[Tuple[str, str]]:
+        """Same author + same title = the same post shared in another subreddit"""
+        author = post.get("author")
+        title = " ".join((post.get("title") or "").lower().split())
+        if not author or author == "[deleted]" or not title:
+            return None
+        return (author, title)
+
+    @staticmethod
+    def _merge(existing: Dict[str, Any], incoming: Dict[str, Any]):
+        """Fill gaps in the stored post from another source and keep the freshest counters"""
+        for field, value in incoming.items():
+            if field in _COUNTER_FIELDS:
+                existing[field] = max(existing.get(field) or 0, value or 0)
+            elif value and not existing.get(field):
+                existing[field] = value
+
+    def _find_crosspost(self, post: Dict[str, Any], fingerprint: Optional[Tuple[str, str]]) -> Optional[str]:
+        """Id of an already collected post this one is a cross-post of, if any"""
+        existing_id = self._fingerprints.get(fingerprint) if fingerprint else None
+        if existing_id is None:
+            return None
+        age_gap = abs((self._posts[existing_id].get("created_utc") or 0) - (post.get("created_utc") or 0))
+        return existing_id if age_gap <= CROSSPOST_WINDOW_SECONDS else None
+
+    def add(self, post: Dict[str, Any], method: str = "unknown") -> bool:
+        """Add a post; returns False (and merges metadata) if it is already in the collection"""
+        post_id = post["id"]
+        fingerprint = self._fingerprint(post)
+
+        existing_id = post_id if post_id in self._posts else self._find_crosspost(post, fingerprint)
+        if existing_id is not None:
+            self._merge(self._posts[existing_id], post)
+            self.duplicates_by_method[method] += 1
+            return False
+
+        self._posts[post_id] = post
+        self._methods[post_id] = method
+        if fingerprint:
+            self._fingerprints[fingerprint] = post_id
+        self.added_by_method[method] += 1
+        return True
+
+    def extend(self, posts: List[Dict[str, Any]], method: str = "unknown") -> int:
+        """Add many posts; returns how many were new"""
+        return sum(1 for post in posts if self.add(post, method))
+
+    def merge(self, other: "PostCollection") -> int:
+        """Merge another collection, attributing posts to the method that originally fetched them"""
+        return len(self.merge_new(other))
+
+    def merge_new(self, other: "PostCollection") -> List[Dict[str, Any]]:
+        """Same as merge, but returns the posts that were new to this collection (in order)"""
+        for method, count in other.duplicates_by_method.items():
+            self.duplicates_by_method[method] += count
+        return [post for post_id, post in other._posts.items() if self.add(post, other._methods[post_id])]
+
+    def retain(self, posts: List[Dict[str, Any]]):
+        """Keep only the given posts (e.g. the output of a time filter), preserving order"""
+        keep_ids = {post["id"] for post in posts}
+        for post_id in [post_id for post_id in self._posts if post_id not in keep_ids]:
+            self._discard(post_id)
+
+    def truncate(self, limit: int):
+        """Drop everything after the first `limit` posts"""
+        for post_id in list(self._posts)[limit:]:
+            self._discard(post_id)
+
+    def _discard(self, post_id: str):
+        post = self._posts.pop(post_id)
+        self._methods.pop(post_id, None)
+        fingerprint = self._fingerprint(post)
+        if fingerprint and self._fingerprints.get(fingerprint) == post_id:
+            del self._fingerprints[fingerprint]
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        return list(self._posts.values())
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Unique post count plus new/duplicate counts per fetch method"""
+        return {
+            "unique_posts": len(self._posts),
+            "added_by_method": dict(self.added_by_method),
+            "duplicates_by_method": dict(self.duplicates_by_method)
+        }
+
+    def __len__(self) -> int:
+        return len(self._posts)
+
+    def __contains__(self, post_id: str) -> bool:
+        return post_id in self._posts
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(self._posts.values())
@@ -0,0 +1,331 @@
+"""
+Persistent local Reddit post store
+SQLite file (separate from reddit_lead_finder.db) holding every ingested post keyed
+by id, plus a snapshot of each crawled subreddit listing (new, hot, top:<t>,
+search:<t>:<query>) and when it was last crawled. Ingestion writes through to it;
+searches read listings from it while they are fresh and only go to Reddit when
+a listing is stale or not deep enough. Each crawl also records a watermark
+(newest fullname and created_utc) so time-ordered listings can be re-crawled
+incrementally. Posts not re-fetched for settings.post_store_max_age_days are pruned
+by a background task every settings.post_store_prune_interval_hours. A small lease table lets one
+worker claim background jobs that must not run in every process (pre-warming).
+"""
+
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import logging
+from typing import List, Dict, Any, Optional
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# How long a crawled listing can be served without going back to Reddit (seconds)
+LISTING_FRESHNESS_SECONDS = {
+    "new": 10 * 60,
+    "hot": 15 * 60,
+    "top": 6 * 3600,
+    "search": 60 * 60,
+}
+
+
+def listing_key(sort: str, time_filter: Optional[str] = None, query: Optional[str] = None) -> str:
+    """Build the store key for a listing, e.g. 'new', 'top:all' or 'search:year:<query hash>'"""
+    if sort == "search":
+        query_hash = hashlib.sha1(" ".join((query or "").lower().split()).encode()).hexdigest()[:16]
+        return f"search:{time_filter or 'all'}:{query_hash}"
+    return f"{sort}:{time_filter}" if time_filter else sort
+
+
+def listing_freshness(listing: str) -> int:
+    """Freshness window for a listing key"""
+    return LISTING_FRESHNESS_SECONDS.get(listing.split(":", 1)[0], 15 * 60)
+
+
+class PostStore:
+    """SQLite-backed post store shared by all searches (and all workers on the same disk)"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._init_schema()
+
+    def _connect(self) -> sqlite3.Connection:
+        """One connection per thread, opened lazily"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        conn = self._connect()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS posts (
+                id TEXT PRIMARY KEY,
+                subreddit TEXT NOT NULL,
+                created_utc REAL NOT NULL,
+                fetched_at REAL NOT NULL,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_posts_subreddit_created ON posts (subreddit, created_utc);
+
+            CREATE TABLE IF NOT EXISTS listing_entries (
+                subreddit TEXT NOT NULL,
+                listing TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                post_id TEXT NOT NULL,
+                PRIMARY KEY (subreddit, listing, position)
+            );
+
+            CREATE TABLE IF NOT EXISTS crawls (
+                subreddit TEXT NOT NULL,
+                listing TEXT NOT NULL,
+                last_crawled_at REAL NOT NULL,
+                depth INTEGER NOT NULL,
+                exhausted INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (subreddit, listing)
+            );
+
+            CREATE TABLE IF NOT EXISTS leases (
+                name TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            );
+        """)
+        self._migrate_schema(conn)
+        conn.commit()
+
+    def _migrate_schema(self, conn: sqlite3.Connection):
+        """Add crawl watermark columns to stores created before cursors existed"""
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(crawls)").fetchall()]
+        if "newest_fullname" not in columns:
+            logger.info("🔄 POST STORE MIGRATION: Adding crawl watermark columns")
+            conn.execute("ALTER TABLE crawls ADD COLUMN newest_fullname TEXT")
+            conn.execute("ALTER TABLE crawls ADD COLUMN newest_created_utc REAL")
+
+    def upsert_posts(self, posts: List[Dict[str, Any]]):
+        """Insert or refresh posts by id"""
+        if not posts:
+            return
+        now = time.time()
+        conn = self._connect()
+        conn.executemany(
+            """INSERT INTO posts (id, subreddit, created_utc, fetched_at, data) VALUES (?, ?, ?, ?, ?)
+               ON CONFLICT(id) DO UPDATE SET fetched_at = excluded.fetched_at, data = excluded.data""",
+            [(post["id"], (post.get("subreddit") or "").lower(), post.get("created_utc") or 0, now,
+              json.dumps(post, separators=(",", ":"))) for post in posts]
+        )
+        conn.commit()
+
+    def save_listing(self, subreddit: str, listing: str, posts: List[Dict[str, Any]], requested: int) -> bool:
+        """
+        Write through a freshly crawled listing snapshot and record the crawl. A fresh
+        snapshot that is deeper than this (not exhausted) crawl is kept with its watermark,
+        so a shallow live search can't undo a deep pre-warm; the posts are still upserted.
+        Returns False when the stored snapshot was kept.
+        """
+        subreddit = subreddit.lower()
+        self.upsert_posts(posts)
+        exhausted = len(posts) < requested
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            stored = conn.execute(
+                "SELECT last_crawled_at, depth FROM crawls WHERE subreddit = ? AND listing = ?", (subreddit, listing)
+            ).fetchone()
+            if (stored is not None and not exhausted and stored[1] > len(posts)
+                    and time.time() - stored[0] <= listing_freshness(listing)):
+                conn.rollback()
+                logger.info(f"💾 POST STORE KEEP: r/{subreddit} {listing} snapshot ({stored[1]} posts) is deeper than this crawl ({len(posts)})")
+                return False
+            conn.execute("DELETE FROM listing_entries WHERE subreddit = ? AND listing = ?", (subreddit, listing))
+            conn.executemany(
+                "INSERT INTO listing_entries (subreddit, listing, position, post_id) VALUES (?, ?, ?, ?)",
+                [(subreddit, listing, position, post["id"]) for position, post in enumerate(posts)]
+            )
+            # Watermark: the newest post seen in this listing (used for incremental crawls)
+            newest = max(posts, key=lambda post: post.get("created_utc") or 0, default=None)
+            conn.execute(
+                """INSERT INTO crawls (subreddit, listing, last_crawled_at, depth, exhausted, newest_fullname, newest_created_utc)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(subreddit, listing) DO UPDATE SET last_crawled_at = excluded.last_crawled_at,
+                   depth = excluded.depth, exhausted = excluded.exhausted,
+                   newest_fullname = excluded.newest_fullname, newest_created_utc = excluded.newest_created_utc""",
+                (subreddit, listing, time.time(), len(posts), int(exhausted),
+                 f"t3_{newest['id']}" if newest else None, newest.get("created_utc") if newest else None)
+            )
+            conn.commit()
+            return True
+        except Exception:
+            conn.rollback()
+            raise
+
+    def get_crawl(self, subreddit: str, listing: str) -> Optional[Dict[str, Any]]:
+        """Crawl cursor: when a listing was last crawled, how deep, whether Reddit ran out of posts, and its watermark"""
+        row = self._connect().execute(
+            """SELECT subreddit, listing, last_crawled_at, depth, exhausted, newest_fullname, newest_created_utc
+               FROM crawls WHERE subreddit = ? AND listing = ?""",
+            (subreddit.lower(), listing)
+        ).fetchone()
+        return self._crawl_from_row(row) if row else None
+
+    def list_crawls(self, subreddit: Optional[str] = None) -> List[Dict[str, Any]]:
+        """All crawl cursors, optionally for one subreddit"""
+        query = "SELECT subreddit, listing, last_crawled_at, depth, exhausted, newest_fullname, newest_created_utc FROM crawls"
+        params = ()
+        if subreddit:
+            query += " WHERE subreddit = ?"
+            params = (subreddit.lower(),)
+        return [self._crawl_from_row(row) for row in self._connect().execute(query + " ORDER BY subreddit, listing", params).fetchall()]
+
+    def reset_crawl(self, subreddit: str, listing: Optional[str] = None) -> int:
+        """Forget crawl cursors so the next crawl of the listing(s) is a full one"""
+        conn = self._connect()
+        if listing:
+            deleted = conn.execute("DELETE FROM crawls WHERE subreddit = ? AND listing = ?", (subreddit.lower(), listing)).rowcount
+        else:
+            deleted = conn.execute("DELETE FROM crawls WHERE subreddit = ?", (subreddit.lower(),)).rowcount
+        conn.commit()
+        return deleted
+
+    @staticmethod
+    def _crawl_from_row(row) -> Dict[str, Any]:
+        return {
+            "subreddit": row[0],
+            "listing": row[1],
+            "last_crawled_at": row[2],
+            "depth": row[3],
+            "exhausted": bool(row[4]),
+            "newest_fullname": row[5],
+            "newest_created_utc": row[6]
+        }
+
+    def get_fresh_listing(self, subreddit: str, listing: str, limit: int) -> Optional[List[Dict[str, Any]]]:
+        """Stored listing if it was crawled recently and deep enough for `limit`, else None"""
+        crawl = self.get_crawl(subreddit, listing)
+        if crawl is None or time.time() - crawl["last_crawled_at"] > listing_freshness(listing):
+            return None
+        if crawl["depth"] < limit and not crawl["exhausted"]:
+            return None
+        return self.get_listing(subreddit, listing, limit)
+
+    def get_listing(self, subreddit: str, listing: str, limit: int) -> List[Dict[str, Any]]:
+        """Posts of a stored listing snapshot in listing order"""
+        rows = self._connect().execute(
+            """SELECT p.data FROM listing_entries e JOIN posts p ON p.id = e.post_id
+               WHERE e.subreddit = ? AND e.listing = ? ORDER BY e.position LIMIT ?""",
+            (subreddit.lower(), listing, limit)
+        ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def prune(self, max_age_days: int = 30) -> int:
+        """Delete posts not refreshed for `max_age_days` (and listing entries pointing at them)"""
+        cutoff = time.time() - max_age_days * 86400
+        conn = self._connect()
+        deleted = conn.execute("DELETE FROM posts WHERE fetched_at < ?", (cutoff,)).rowcount
+        conn.execute("DELETE FROM listing_entries WHERE post_id NOT IN (SELECT id FROM posts)")
+        conn.commit()
+        return deleted
+
+    def acquire_lease(self, name: str, owner: str, ttl_seconds: float) -> bool:
+        """Take or renew the named lease for ttl_seconds; False while another owner holds it unexpired"""
+        conn = self._connect()
+        conn.commit()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT owner, expires_at FROM leases WHERE name = ?", (name,)).fetchone()
+            now = time.time()
+            if row is not None and row[0] != owner and row[1] > now:
+                conn.rollback()
+                return False
+            conn.execute(
+                """INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?)
+                   ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at""",
+                (name, owner, now + ttl_seconds)
+            )
+            conn.commit()
+            return True
+        except Exception:
+            conn.rollback()
+            raise
+
+    def release_lease(self, name: str, owner: str):
+        """Give up the named lease if this owner holds it"""
+        conn = self._connect()
+        conn.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner))
+        conn.commit()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Post and listing counts for debugging"""
+        conn = self._connect()
+        return {
+            "posts": conn.execute("SELECT COUNT(*) FROM posts").fetchone()[0],
+            "subreddits": conn.execute("SELECT COUNT(DISTINCT subreddit) FROM posts").fetchone()[0],
+            "listings": conn.execute("SELECT COUNT(*) FROM crawls").fetchone()[0]
+        }
+
+
+# Global post store instance (None when disabled in settings)
+_post_store: Optional[PostStore] = None
+_post_store_lock = threading.Lock()
+
+
+def get_post_store() -> Optional[PostStore]:
+    """Get the shared post store, creating it on first use"""
+    global _post_store
+    if not settings.post_store_enabled:
+        return None
+    with _post_store_lock:
+        if _post_store is None:
+            _post_store = PostStore(settings.post_store_path)
+            logger.info(f"💾 POST STORE: Using {settings.post_store_path}")
+        return _post_store
+
+
+def prune_post_store() -> int:
+    """Drop posts not re-fetched for settings.post_store_max_age_days (no-op when the store is disabled)"""
+    post_store = get_post_store()
+    if post_store is None:
+        return 0
+    deleted = post_store.prune(settings.post_store_max_age_days)
+    if deleted:
+        logger.info(f"🗑️ POST STORE: Pruned {deleted} posts older than {settings.post_store_max_age_days} days")
+    return deleted
+
+
+# Background prune task (started from the FastAPI startup hook)
+_prune_task: Optional[asyncio.Task] = None
+
+
+async def _prune_loop():
+    while True:
+        try:
+            await asyncio.to_thread(prune_post_store)
+        except Exception as e:
+            logger.warning(f"⚠️ POST STORE prune failed: {e}")
+        await asyncio.sleep(settings.post_store_prune_interval_hours * 3600)
+
+
+def start_background_prune():
+    """Run prune_post_store() every settings.post_store_prune_interval_hours (no-op when the store is disabled)"""
+    global _prune_task
+    if not settings.post_store_enabled or (_prune_task and not _prune_task.done()):
+        return
+    _prune_task = asyncio.create_task(_prune_loop())
+
+
+async def stop_background_prune():
+    global _prune_task
+    if _prune_task and not _prune_task.done():
+        _prune_task.cancel()
+        try:
+            await _prune_task
+        except asyncio.CancelledError:
+            pass
+    _prune_task = None
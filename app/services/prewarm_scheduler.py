@@ -0,0 +1,167 @@
+"""
+Background subreddit pre-warming
+Keeps the new/hot/top listings of every subreddit in TIERED_SUBREDDIT_MAPPINGS
+warm in the post store, so search_leads mostly reads from disk instead of paying
+the scrape cost. Runs as an asyncio task started from the FastAPI startup hook;
+tier 1 subreddits are refreshed most often, every refresh is jittered, and it
+only spends the shared Reddit rate budget when live searches leave headroom.
+Every uvicorn worker starts a scheduler, but only the one holding the "prewarm"
+lease in the post store refreshes; the others wait to take over if it goes away.
+"""
+
+import asyncio
+import heapq
+import os
+import random
+import time
+import uuid
+import logging
+from typing import Dict, List, Any, Optional, Tuple
+from app.core.config import settings
+from app.services.tiered_subreddit_mapping import TIERED_SUBREDDIT_MAPPINGS
+
+logger = logging.getLogger(__name__)
+
+# Refresh cadence per tier, as a multiple of settings.prewarm_interval_seconds
+TIER_INTERVAL_MULTIPLIERS = {1: 1, 2: 2, 3: 3, 4: 6}
+
+# Listings kept warm: (sort, time_filter)
+PREWARM_LISTINGS = [("new", None), ("hot", None), ("top", "all")]
+
+# Post store lease that elects the one pre-warming worker
+PREWARM_LEASE = "prewarm"
+
+
+def get_prewarm_targets() -> Dict[str, int]:
+    """Every mapped subreddit (case-insensitive, first spelling wins) with the best tier it appears in"""
+    targets: Dict[str, int] = {}
+    spellings: Dict[str, str] = {}
+    for tiers in TIERED_SUBREDDIT_MAPPINGS.values():
+        for tier, subreddits in tiers.items():
+            for subreddit in subreddits:
+                name = spellings.setdefault(subreddit.lower(), subreddit)
+                targets[name] = min(tier, targets.get(name, tier))
+    return targets
+
+
+class SubredditPrewarmScheduler:
+    """Priority queue of subreddits ordered by next refresh time"""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._queue: List[Tuple[float, int, str]] = []  # (due_at, tier, subreddit)
+        self._ingestor = None
+        self._owner = f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+        self.refreshes = 0
+        self.failures = 0
+        self.last_refreshed: Dict[str, float] = {}
+
+    def _interval(self, tier: int) -> float:
+        """Jittered refresh interval for a tier"""
+        base = settings.prewarm_interval_seconds * TIER_INTERVAL_MULTIPLIERS.get(tier, max(TIER_INTERVAL_MULTIPLIERS.values()))
+        return base * random.uniform(1 - settings.prewarm_jitter, 1 + settings.prewarm_jitter)
+
+    def _build_queue(self):
+        """Initial schedule: tier 1 first, spread out so startup isn't one burst"""
+        now = time.time()
+        self._queue = []
+        for subreddit, tier in get_prewarm_targets().items():
+            stagger = random.uniform(0, settings.prewarm_interval_seconds * settings.prewarm_jitter)
+            heapq.heappush(self._queue, (now + (tier - 1) * 30 + stagger, tier, subreddit))
+
+    def start(self):
+        """Start the background task (no-op when disabled or already running)"""
+        if not settings.prewarm_enabled or not settings.post_store_enabled:
+            logger.info("⏸️ PREWARM: Disabled")
+            return
+        if self._task and not self._task.done():
+            return
+        from app.services.reddit_ingestion import AsyncRedditIngestor
+        # Every page waits for prewarm_min_free_tokens of headroom (see AsyncRedditIngestor._rate_limit)
+        self._ingestor = AsyncRedditIngestor(min_free_tokens=settings.prewarm_min_free_tokens)
+        self._build_queue()
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"🔥 PREWARM: Scheduled {len(self._queue)} subreddits (tier 1 every {settings.prewarm_interval_seconds}s)")
+
+    async def stop(self):
+        """Cancel the background task (called on application shutdown)"""
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        if self.is_leader:
+            self.is_leader = False
+            try:
+                await asyncio.to_thread(self._ingestor.post_store.release_lease, PREWARM_LEASE, self._owner)
+            except Exception as e:
+                logger.warning(f"⚠️ PREWARM: Failed to release the lease: {e}")
+
+    async def _renew_lease(self) -> bool:
+        """Take or renew the prewarm lease (logs leadership changes)"""
+        try:
+            leader = await asyncio.to_thread(
+                self._ingestor.post_store.acquire_lease, PREWARM_LEASE, self._owner, settings.prewarm_lease_seconds
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ PREWARM: Lease check failed: {e}")
+            leader = False
+        if leader != self.is_leader:
+            logger.info(f"🔥 PREWARM: {'This worker is now' if leader else 'Another worker is'} the pre-warming worker")
+        self.is_leader = leader
+        return leader
+
+    async def _wait_until(self, due_at: float):
+        """Sleep until due_at while holding the lease, waiting for it first if another worker has it"""
+        step = max(1.0, settings.prewarm_lease_seconds / 3)
+        while True:
+            if await self._renew_lease():
+                delay = due_at - time.time()
+                if delay <= 0:
+                    return
+                await asyncio.sleep(min(delay, step))
+            else:
+                await asyncio.sleep(step)
+
+    async def refresh_subreddit(self, subreddit: str):
+        """Refresh every warm listing of one subreddit (fresh listings are served from the store at no cost)"""
+        for sort, time_filter in PREWARM_LISTINGS:
+            if not await self._renew_lease():
+                return  # Lost the lease mid-refresh: the new leader takes it from here
+            await self._ingestor.fetch_listing(subreddit, sort, settings.prewarm_listing_depth, time_filter)
+
+    async def _run(self):
+        while True:
+            due_at, tier, subreddit = heapq.heappop(self._queue)
+            await self._wait_until(due_at)
+
+            try:
+                await self.refresh_subreddit(subreddit)
+                self.refreshes += 1
+                self.last_refreshed[subreddit] = time.time()
+                logger.info(f"🔥 PREWARM: Refreshed r/{subreddit} (tier {tier})")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failures += 1
+                logger.warning(f"⚠️ PREWARM: Failed to refresh r/{subreddit}: {e}")
+
+            heapq.heappush(self._queue, (time.time() + self._interval(tier), tier, subreddit))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Scheduler state for debugging"""
+        return {
+            "running": bool(self._task and not self._task.done()),
+            "leader": self.is_leader,
+            "subreddits": len(self._queue),
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "next_due_in_seconds": round(self._queue[0][0] - time.time(), 1) if self._queue else None
+        }
+
+
+# Global scheduler instance
+prewarm_scheduler = SubredditPrewarmScheduler()
@@ -0,0 +1,138 @@
+"""
+Token-budget-aware prompt packer for batch post analysis
+Each post body is cut to a per-post token budget, keeping its opening and the
+passages around the problem's keywords, so one long self-post can no longer push
+the JSON answer past max_tokens. Posts are then packed into a request until the
+target input size (or the output budget for their JSON results) is reached, so
+short posts share calls instead of wasting round-trips.
+Token counts are estimated locally from word and character counts.
+"""
+
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, List, Set
+from app.core.config import settings
+
+PROMPT_OVERHEAD_TOKENS = 400  # Instructions and JSON example of the batch prompt
+POST_HEADER_TOKENS = 10  # "--- POST n ---", "Title:", "Content:"
+# One JSON result object: the prompt's pretty-printed example is ~110 tokens, plus 25% for
+# longer insights/reasoning. Too little and a batch's array is cut off mid-answer.
+OUTPUT_TOKENS_PER_POST = 140
+OUTPUT_MARGIN_TOKENS = 100  # Array brackets and slack for a verbose answer
+
+CHARS_PER_TOKEN = 4
+HIT_CONTEXT_CHARS = 320  # Text kept around each keyword hit
+ELLIPSIS = " ... "
+
+_STOP_WORDS = {
+    "the", "and", "for", "are", "but", "not", "you", "all", "can", "had", "her", "was", "one", "our",
+    "out", "has", "how", "its", "who", "why", "with", "this", "that", "from", "have", "they", "them",
+    "their", "what", "when", "where", "which", "will", "would", "could", "should", "about", "into",
+    "need", "needs", "want", "help", "looking", "find", "people", "some", "any", "more", "very"
+}
+_WORD_RE = re.compile(r"[a-z0-9][a-z0-9'+-]*")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count: about 4 characters or 3/4 of a word per token, whichever is more"""
+    if not text:
+        return 1
+    return max(len(text) // CHARS_PER_TOKEN, len(text.split()) * 4 // 3) + 1
+
+
+def query_terms(user_problem: str) -> Set[str]:
+    """Keywords of the user's problem used to pick which parts of a long post to keep"""
+    return {word for word in _WORD_RE.findall(user_problem.lower()) if len(word) > 2 and word not in _STOP_WORDS}
+
+
+def _snap(text: str, start: int, end: int) -> str:
+    """text[start:end] without a partial word at either cut"""
+    piece = text[start:end]
+    if start > 0 and not text[start - 1].isspace():
+        piece = piece.split(None, 1)[1] if " " in piece else piece
+    if end < len(text) and not text[end].isspace():
+        piece = piece.rsplit(None, 1)[0] if " " in piece else piece
+    return piece.strip()
+
+
+def truncate_body(text: str, terms: Set[str], max_tokens: int) -> str:
+    """
+    Body cut to about max_tokens: the opening third of the budget, then windows
+    around keyword hits in order of appearance; budget the hits leave unused
+    extends the opening. Short bodies are returned unchanged.
+    """
+    if not text or estimate_tokens(text) <= max_tokens:
+        return text or ""
+    char_budget = max_tokens * CHARS_PER_TOKEN
+    lowered = text.lower()
+    hits = sorted(match.start() for term in terms for match in re.finditer(re.escape(term), lowered))
+
+    windows = [[0, char_budget // 3]]
+    remaining = char_budget - windows[0][1]
+    for position in hits:
+        if remaining <= 0:
+            break
+        if position + len(ELLIPSIS) < windows[-1][1]:
+            continue  # Already inside the previous window
+        start = max(windows[-1][1], position - HIT_CONTEXT_CHARS // 4)
+        end = min(len(text), start + min(HIT_CONTEXT_CHARS, remaining))
+        if start - windows[-1][1] <= len(ELLIPSIS):
+            windows[-1][1] = end  # Adjacent: extend instead of adding an ellipsis
+        else:
+            windows.append([start, end])
+        remaining -= end - start
+    if remaining > 0:
+        # Unused budget (few or clustered hits) goes to the opening
+        next_start = windows[1][0] if len(windows) > 1 else len(text)
+        windows[0][1] = min(next_start, windows[0][1] + remaining)
+        if len(windows) > 1 and windows[1][0] - windows[0][1] <= len(ELLIPSIS):
+            windows[0][1] = windows.pop(1)[1]
+
+    pieces = [_snap(text, start, end) for start, end in windows]
+    body = ELLIPSIS.join(piece for piece in pieces if piece)
+    return body + ELLIPSIS.rstrip() if windows[-1][1] < len(text) else body
+
+
+@dataclass
+class PromptBatch:
+    """Posts sent in one request, with the (possibly truncated) body to show for each"""
+    posts: List[Dict[str, Any]]
+    bodies: List[str]
+    input_tokens: int
+    truncated: int
+
+    @property
+    def output_tokens(self) -> int:
+        """max_tokens for the request: room for one JSON result per post"""
+        return OUTPUT_TOKENS_PER_POST * len(self.posts) + OUTPUT_MARGIN_TOKENS
+
+
+def pack_batches(posts: List[Dict[str, Any]], user_problem: str) -> List[PromptBatch]:
+    """
+    Posts (in order) packed into requests of at most settings.openai_batch_prompt_tokens
+    estimated input tokens, settings.openai_batch_max_posts posts and an answer that
+    fits settings.openai_batch_output_tokens; bodies are cut to openai_batch_post_tokens.
+    """
+    terms = query_terms(user_problem)
+    input_budget = max(1, settings.openai_batch_prompt_tokens - PROMPT_OVERHEAD_TOKENS - estimate_tokens(user_problem))
+    output_cap = (settings.openai_batch_output_tokens - OUTPUT_MARGIN_TOKENS) // OUTPUT_TOKENS_PER_POST
+    max_posts = max(1, min(settings.openai_batch_max_posts, output_cap))
+
+    batches: List[PromptBatch] = []
+    current = PromptBatch(posts=[], bodies=[], input_tokens=0, truncated=0)
+    for post in posts:
+        text = post.get("text", "") or ""
+        body = truncate_body(text, terms, settings.openai_batch_post_tokens)
+        tokens = estimate_tokens(post.get("title", "")) + estimate_tokens(body) + POST_HEADER_TOKENS
+        if current.posts and (current.input_tokens + tokens > input_budget or len(current.posts) >= max_posts):
+            batches.append(current)
+            current = PromptBatch(posts=[], bodies=[], input_tokens=0, truncated=0)
+        current.posts.append(post)
+        current.bodies.append(body)
+        current.input_tokens += tokens
+        current.truncated += body != text
+    if current.posts:
+        batches.append(current)
+    for batch in batches:
+        batch.input_tokens += PROMPT_OVERHEAD_TOKENS + estimate_tokens(user_problem)
+    return batches
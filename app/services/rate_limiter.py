@@ -0,0 +1,238 @@
+"""
+Process-wide Reddit rate limiting
+One token bucket per Reddit credential, shared by every RedditService instance,
+the async ingestion engine and (with the SQLite backend) every uvicorn worker.
+Callers reserve tokens in arrival order, so concurrent searches are served FIFO
+instead of racing each other, and the refill rate follows Reddit's
+X-Ratelimit-Remaining / X-Ratelimit-Reset headers.
+"""
+
+import asyncio
+import sqlite3
+import threading
+import time
+import logging
+from typing import Dict, Optional, Mapping
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Lower bound for header-driven refill rate adjustments (requests per second);
+# the upper bound is the configured rate, headers can only slow us down
+MIN_REFILL_RATE = 0.1
+
+
+class TokenBucket:
+    """
+    In-process token bucket with burst capacity and fair (FIFO) queuing.
+    A reservation takes a token immediately, letting the balance go negative;
+    the caller then sleeps until its token has been refilled. Later callers queue
+    behind earlier ones because they see the already-reduced balance.
+    """
+
+    def __init__(self, key: str, capacity: float, refill_rate: float):
+        self.key = key
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.max_refill_rate = refill_rate
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self, tokens: float = 1) -> float:
+        """Take tokens from the bucket and return how long the caller must wait for them"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_rate)
+            self.updated_at = now
+            self.tokens -= tokens
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.refill_rate
+
+    def available_tokens(self) -> float:
+        """Current balance after refill, without reserving anything (negative while callers are queued)"""
+        with self._lock:
+            return min(self.capacity, self.tokens + (time.monotonic() - self.updated_at) * self.refill_rate)
+
+    async def available_tokens_async(self) -> float:
+        """available_tokens for event loop callers"""
+        return self.available_tokens()
+
+    def acquire(self, tokens: float = 1):
+        """Block the current thread until the tokens are available"""
+        wait = self._reserve(tokens)
+        if wait > 0:
+            logger.info(f"Rate limiting ({self.key}): sleeping for {wait:.2f} seconds")
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens: float = 1):
+        """Wait on the event loop until the tokens are available"""
+        wait = self._reserve(tokens)
+        if wait > 0:
+            logger.info(f"Rate limiting ({self.key}): waiting {wait:.2f} seconds")
+            await asyncio.sleep(wait)
+
+    def _apply_headers(self, remaining: float, reset_seconds: float):
+        """Spread the remaining quota evenly over the time left in Reddit's window"""
+        self.refill_rate = max(MIN_REFILL_RATE, min(self.max_refill_rate, remaining / max(reset_seconds, 1.0)))
+        self.tokens = min(self.tokens, remaining)
+
+    def update_from_headers(self, headers: Mapping[str, str]):
+        """Adjust the refill rate from Reddit's rate limit response headers (ignored if absent)"""
+        remaining, reset_seconds = parse_rate_limit_headers(headers)
+        if remaining is None or reset_seconds is None:
+            return
+        with self._lock:
+            self._apply_headers(remaining, reset_seconds)
+        logger.debug(f"Rate limit ({self.key}): {remaining:.0f} remaining, reset in {reset_seconds:.0f}s -> {self.refill_rate:.2f} req/s")
+
+    async def update_from_headers_async(self, headers: Mapping[str, str]):
+        """update_from_headers for event loop callers (in-process update, no I/O)"""
+        self.update_from_headers(headers)
+
+    def update_from_praw(self, reddit):
+        """Adjust the refill rate from the rate limit state PRAW tracked on its last request"""
+        try:
+            praw_limiter = reddit._core._rate_limiter
+            remaining = praw_limiter.remaining
+            reset_timestamp = praw_limiter.reset_timestamp
+        except AttributeError:
+            return
+        if remaining is None or reset_timestamp is None:
+            return
+        self.update_from_headers({
+            "x-ratelimit-remaining": str(remaining),
+            "x-ratelimit-reset": str(max(0.0, reset_timestamp - time.time()))
+        })
+
+
+class SQLiteTokenBucket(TokenBucket):
+    """
+    Token bucket whose state lives in a shared SQLite file so several uvicorn
+    workers split one Reddit budget. Each reservation is a short IMMEDIATE
+    transaction, which serializes reservations across processes.
+    """
+
+    def __init__(self, key: str, capacity: float, refill_rate: float, db_path: str):
+        super().__init__(key, capacity, refill_rate)
+        self.db_path = db_path
+        conn = self._connect()
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+                    key TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    refill_rate REAL NOT NULL
+                )
+            """)
+            conn.execute(
+                "INSERT OR IGNORE INTO rate_limit_buckets (key, tokens, updated_at, refill_rate) VALUES (?, ?, ?, ?)",
+                (key, capacity, time.time(), refill_rate)
+            )
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=10.0, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _transaction(self, apply):
+        """Run apply(tokens, refill_rate) -> (tokens, refill_rate, result) on the refilled row atomically"""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            tokens, updated_at, refill_rate = conn.execute(
+                "SELECT tokens, updated_at, refill_rate FROM rate_limit_buckets WHERE key = ?", (self.key,)
+            ).fetchone()
+            now = time.time()
+            tokens = min(self.capacity, tokens + max(0.0, now - updated_at) * refill_rate)
+            tokens, refill_rate, result = apply(tokens, refill_rate)
+            conn.execute(
+                "UPDATE rate_limit_buckets SET tokens = ?, updated_at = ?, refill_rate = ? WHERE key = ?",
+                (tokens, now, refill_rate, self.key)
+            )
+            conn.execute("COMMIT")
+            self.tokens, self.refill_rate = tokens, refill_rate
+            return result
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def _reserve(self, tokens: float = 1) -> float:
+        def apply(balance, refill_rate):
+            balance -= tokens
+            return balance, refill_rate, (0.0 if balance >= 0 else -balance / refill_rate)
+        with self._lock:
+            return self._transaction(apply)
+
+    def available_tokens(self) -> float:
+        def apply(balance, refill_rate):
+            return balance, refill_rate, balance
+        with self._lock:
+            return self._transaction(apply)
+
+    async def available_tokens_async(self) -> float:
+        # Reading the balance is a write transaction too (the refill is stored)
+        return await asyncio.to_thread(self.available_tokens)
+
+    async def acquire_async(self, tokens: float = 1):
+        # The reservation touches the database file, so keep it off the event loop
+        wait = await asyncio.to_thread(self._reserve, tokens)
+        if wait > 0:
+            logger.info(f"Rate limiting ({self.key}): waiting {wait:.2f} seconds")
+            await asyncio.sleep(wait)
+
+    def update_from_headers(self, headers: Mapping[str, str]):
+        remaining, reset_seconds = parse_rate_limit_headers(headers)
+        if remaining is None or reset_seconds is None:
+            return
+
+        def apply(balance, refill_rate):
+            refill_rate = max(MIN_REFILL_RATE, min(self.max_refill_rate, remaining / max(reset_seconds, 1.0)))
+            return min(balance, remaining), refill_rate, None
+        with self._lock:
+            self._transaction(apply)
+
+    async def update_from_headers_async(self, headers: Mapping[str, str]):
+        # A write transaction on the shared file (up to the busy timeout), so keep it off the event loop
+        await asyncio.to_thread(self.update_from_headers, headers)
+
+
+def parse_rate_limit_headers(headers: Mapping[str, str]):
+    """Read (remaining, reset_seconds) from Reddit response headers, or (None, None)"""
+    try:
+        remaining = headers.get("x-ratelimit-remaining") or headers.get("X-Ratelimit-Remaining")
+        reset_seconds = headers.get("x-ratelimit-reset") or headers.get("X-Ratelimit-Reset")
+        if remaining is None or reset_seconds is None:
+            return None, None
+        return float(remaining), float(reset_seconds)
+    except (TypeError, ValueError):
+        return None, None
+
+
+# Global registry: one bucket per credential
+_buckets: Dict[str, TokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+
+def get_rate_limiter(credential: Optional[str] = None) -> TokenBucket:
+    """Get the shared token bucket for a Reddit credential (defaults to the configured client id)"""
+    key = credential or settings.reddit_client_id
+    with _buckets_lock:
+        bucket = _buckets.get(key)
+        if bucket is None:
+            if settings.reddit_rate_limit_backend == "sqlite":
+                bucket = SQLiteTokenBucket(
+                    key, settings.reddit_rate_limit_burst, settings.reddit_rate_limit_per_second,
+                    settings.reddit_rate_limit_db_path
+                )
+            else:
+                bucket = TokenBucket(key, settings.reddit_rate_limit_burst, settings.reddit_rate_limit_per_second)
+            _buckets[key] = bucket
+            logger.info(f"🪣 RATE LIMITER: Created {settings.reddit_rate_limit_backend} bucket "
+                        f"(burst={settings.reddit_rate_limit_burst}, rate={settings.reddit_rate_limit_per_second}/s)")
+        return bucket
@@ -0,0 +1,418 @@
+"""
+Async Reddit ingestion engine
+Fetches listing and search pages for many subreddits concurrently over one shared
+async HTTP client (Reddit OAuth API), producing the same post dicts as
+RedditService._format_post so the lead filters see no difference. Pages are
+retried with backoff on 429/5xx, and the client keeps latency/byte counters.
+"""
+
+import asyncio
+import itertools
+import time
+import logging
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator
+import httpx
+from app.core.config import settings
+from app.services.rate_limiter import TokenBucket, get_rate_limiter
+from app.services.post_collection import PostCollection
+from app.services.post_store import PostStore, get_post_store, listing_key
+
+logger = logging.getLogger(__name__)
+
+REDDIT_TOKEN_URL = "https://www.reddit.com/api/v1/access_token"
+REDDIT_OAUTH_BASE_URL = "https://oauth.reddit.com"
+MAX_PAGE_SIZE = 100  # Reddit returns at most 100 posts per page
+MAX_LISTING_SIZE = 1000  # Reddit stops paginating listings after ~1000 posts
+
+# Listings ordered by creation time, which can be crawled incrementally from a watermark
+INCREMENTAL_LISTINGS = {"new"}
+
+# Responses worth retrying (rate limited or a transient server error)
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRY_DELAY = 60.0
+
+# Shared async HTTP client and app-only OAuth token (one per process)
+_client: Optional[httpx.AsyncClient] = None
+_access_token: Optional[str] = None
+_token_expires_at = 0.0
+_token_lock: Optional[asyncio.Lock] = None
+
+# Counters of the OAuth API client in this process (only touched from the event loop)
+_http_stats = {"requests": 0, "errors": 0, "retries": 0, "bytes_received": 0, "bytes_decoded": 0, "total_ms": 0.0}
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Get the process-wide async HTTP client, creating it on first use"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(10.0, pool=None),  # Waiting for a free pooled connection is not an error
+            headers={"User-Agent": settings.reddit_user_agent},
+            limits=httpx.Limits(
+                max_keepalive_connections=settings.reddit_http_max_connections,
+                max_connections=settings.reddit_http_max_connections
+            )
+        )
+    return _client
+
+
+async def close_async_client():
+    """Close the shared async HTTP client (called on application shutdown)"""
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
+
+
+def _record_request(started: float, response: Optional[httpx.Response]):
+    """Count one OAuth API request: latency, and wire (compressed) vs decoded body size"""
+    _http_stats["requests"] += 1
+    _http_stats["errors"] += int(response is None or response.status_code >= 400)
+    _http_stats["total_ms"] += (time.perf_counter() - started) * 1000
+    if response is not None:
+        _http_stats["bytes_received"] += response.num_bytes_downloaded or int(response.headers.get("content-length") or len(response.content))
+        _http_stats["bytes_decoded"] += len(response.content)
+
+
+def _retry_delay(response: Optional[httpx.Response], attempt: int) -> float:
+    """Retry-After when Reddit sends one, else exponential backoff"""
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    try:
+        delay = float(retry_after)
+    except (TypeError, ValueError):
+        delay = settings.reddit_http_backoff_factor * (2 ** attempt)
+    return min(max(delay, 0.0), MAX_RETRY_DELAY)
+
+
+def get_http_stats() -> Dict[str, Any]:
+    """OAuth API client counters (per-request latency, retries, compressed vs decoded bytes)"""
+    stats = dict(_http_stats)
+    stats["total_ms"] = round(stats["total_ms"], 1)
+    stats["avg_ms"] = round(stats["total_ms"] / stats["requests"], 1) if stats["requests"] else 0.0
+    stats["compression_ratio"] = round(stats["bytes_decoded"] / stats["bytes_received"], 2) if stats["bytes_received"] else 0.0
+    stats["max_connections"] = settings.reddit_http_max_connections
+    return stats
+
+
+async def _get_access_token() -> str:
+    """Get an application-only OAuth token, refreshing it shortly before it expires"""
+    global _access_token, _token_expires_at, _token_lock
+    if _token_lock is None:
+        _token_lock = asyncio.Lock()
+
+    async with _token_lock:
+        if _access_token and time.time() < _token_expires_at - 60:
+            return _access_token
+
+        response = await get_async_client().post(
+            REDDIT_TOKEN_URL,
+            data={"grant_type": "client_credentials"},
+            auth=(settings.reddit_client_id, settings.reddit_client_secret)
+        )
+        response.raise_for_status()
+        data = response.json()
+        _access_token = data["access_token"]
+        _token_expires_at = time.time() + data.get("expires_in", 3600)
+        logger.info("🔑 ASYNC INGESTION: Obtained Reddit OAuth token")
+        return _access_token
+
+
+def format_post_data(post_data: Dict[str, Any], subreddit_name: str = "") -> Dict[str, Any]:
+    """Format a raw Reddit JSON post into our standard post format (same shape as _format_post)"""
+    return {
+        'id': post_data['id'],
+        'title': post_data.get('title', ''),
+        'text': post_data.get('selftext') or "",
+        'author': post_data.get('author') or '[deleted]',
+        'score': post_data.get('score', 0),
+        'created_utc': post_data.get('created_utc', 0),
+        'subreddit': post_data.get('subreddit', subreddit_name),
+        'permalink': f"https://www.reddit.com{post_data.get('permalink', '')}",
+        'num_comments': post_data.get('num_comments', 0)
+    }
+
+
+def _is_known_post(post: Dict[str, Any], cursor: Dict[str, Any]) -> bool:
+    """True once a time-ordered listing reaches the crawl watermark"""
+    if f"t3_{post['id']}" == cursor["newest_fullname"]:
+        return True
+    return (post.get("created_utc") or 0) < (cursor["newest_created_utc"] or 0)
+
+
+def post_matches_query(post: Dict[str, Any], query: str) -> bool:
+    """Check if a formatted post matches the search query (dict version of _post_matches_query)"""
+    if not query.strip():
+        return True
+
+    title_lower = post['title'].lower()
+    text_lower = post['text'].lower()
+    return any(word in title_lower or word in text_lower for word in query.lower().split())
+
+
+class AsyncRedditIngestor:
+    """
+    Concurrent Reddit ingestion over the shared async client.
+    Every subreddit is fetched at the same time, and the 'new'/'hot' listings of a
+    subreddit run side by side; only pages of one listing are sequential (cursor based).
+    """
+
+    def __init__(self, rate_limiter: Optional[TokenBucket] = None, post_store: Optional[PostStore] = None,
+                 min_free_tokens: float = 0.0):
+        # Shared per-credential token bucket (same budget as the PRAW code path)
+        self.rate_limiter = rate_limiter or get_rate_limiter(settings.reddit_client_id)
+        # Background ingestion only spends a token when this much budget is left after it
+        self.min_free_tokens = min_free_tokens
+        # Local post store: fresh listings are served from disk instead of Reddit
+        self.post_store = post_store or get_post_store()
+        self.last_dedup_stats: Dict[str, Any] = {}
+        self.store_hits = 0
+        self.store_misses = 0
+
+    async def _rate_limit(self):
+        """Wait for a token from the shared bucket without blocking the event loop"""
+        # Checked before every page, so a deep listing can't drain the headroom live searches need
+        while self.min_free_tokens > 0 and await self.rate_limiter.available_tokens_async() < self.min_free_tokens + 1:
+            await asyncio.sleep(1.0)
+        await self.rate_limiter.acquire_async()
+
+    async def _get_page(self, path: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Fetch a single JSON page from the Reddit OAuth API, retrying 429/5xx and connection
+        errors up to settings.reddit_http_retries times; every attempt spends a token.
+        """
+        attempt = 0
+        while True:
+            await self._rate_limit()
+            token = await _get_access_token()
+            started = time.perf_counter()
+            try:
+                response = await get_async_client().get(
+                    f"{REDDIT_OAUTH_BASE_URL}{path}",
+                    params={**params, "raw_json": 1},
+                    headers={"Authorization": f"bearer {token}"}
+                )
+            except httpx.TransportError as e:
+                _record_request(started, None)
+                if attempt >= settings.reddit_http_retries:
+                    raise
+                response, reason = None, type(e).__name__
+            else:
+                _record_request(started, response)
+                await self.rate_limiter.update_from_headers_async(response.headers)
+                if response.status_code not in RETRY_STATUSES or attempt >= settings.reddit_http_retries:
+                    response.raise_for_status()
+                    return response.json()
+                reason = f"HTTP {response.status_code}"
+
+            delay = _retry_delay(response, attempt)
+            attempt += 1
+            _http_stats["retries"] += 1
+            logger.warning(f"🔁 ASYNC INGESTION: {reason} on {path}, retry {attempt}/{settings.reddit_http_retries} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    async def _paginate(self, path: str, params: Dict[str, Any], subreddit_name: str, limit: int, cursor: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Follow 'after' cursors until the limit is reached or the listing runs out.
+        With a crawl cursor (time-ordered listings only) stop at the first known post.
+        """
+        posts = []
+        after = None
+        max_posts = min(limit, MAX_LISTING_SIZE)
+
+        while len(posts) < max_posts:
+            page_params = {**params, "limit": min(MAX_PAGE_SIZE, max_posts - len(posts))}
+            if after:
+                page_params["after"] = after
+
+            data = await self._get_page(path, page_params)
+            children = data.get("data", {}).get("children", [])
+            if not children:
+                break
+
+            page_posts = [format_post_data(child["data"], subreddit_name) for child in children]
+            if cursor:
+                new_posts = list(itertools.takewhile(lambda post: not _is_known_post(post, cursor), page_posts))
+                posts.extend(new_posts)
+                if len(new_posts) < len(page_posts):
+                    break
+            else:
+                posts.extend(page_posts)
+
+            after = data["data"].get("after")
+            if not after:
+                break
+
+        return posts[:max_posts]
+
+    async def _fetch_through_store(self, subreddit_name: str, listing: str, limit: int, fetch, incremental: bool = False) -> List[Dict[str, Any]]:
+        """
+        Serve a listing from the post store while fresh, otherwise crawl it and write it through.
+        Incremental listings with a deep enough crawl cursor only fetch posts newer than the
+        watermark and splice them onto the stored snapshot.
+        """
+        max_posts = min(limit, MAX_LISTING_SIZE)
+        cursor = None
+        if self.post_store:
+            try:
+                stored = await asyncio.to_thread(self.post_store.get_fresh_listing, subreddit_name, listing, limit)
+                if stored is not None:
+                    self.store_hits += 1
+                    logger.info(f"💾 POST STORE HIT: r/{subreddit_name} {listing} ({len(stored)} posts)")
+                    return stored
+                if incremental:
+                    crawl = await asyncio.to_thread(self.post_store.get_crawl, subreddit_name, listing)
+                    if crawl and crawl["newest_fullname"] and (crawl["depth"] >= max_posts or crawl["exhausted"]):
+                        cursor = crawl
+            except Exception as e:
+                logger.warning(f"⚠️ POST STORE read failed for r/{subreddit_name} {listing}: {e}")
+            self.store_misses += 1
+
+        posts = await fetch(cursor)
+
+        if cursor:
+            try:
+                stored = await asyncio.to_thread(self.post_store.get_listing, subreddit_name, listing, max_posts)
+                merged = PostCollection()
+                merged.extend(posts, "delta")
+                merged.extend(stored, "stored")
+                merged.truncate(max_posts)
+                logger.info(f"⏩ INCREMENTAL CRAWL: r/{subreddit_name} {listing} +{len(posts)} new posts since {cursor['newest_fullname']}")
+                posts = merged.to_list()
+            except Exception as e:
+                logger.warning(f"⚠️ POST STORE read failed for r/{subreddit_name} {listing}, doing a full crawl: {e}")
+                posts = await fetch(None)
+
+        if self.post_store:
+            try:
+                await asyncio.to_thread(self.post_store.save_listing, subreddit_name, listing, posts, max_posts)
+            except Exception as e:
+                logger.warning(f"⚠️ POST STORE write failed for r/{subreddit_name} {listing}: {e}")
+        return posts
+
+    async def fetch_listing(self, subreddit_name: str, sort: str, limit: int, time_filter: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Fetch a 'new', 'hot' or 'top' listing for a subreddit ('new' is crawled incrementally)"""
+        params = {"t": time_filter} if time_filter else {}
+        return await self._fetch_through_store(
+            subreddit_name, listing_key(sort, time_filter), limit,
+            lambda cursor: self._paginate(f"/r/{subreddit_name}/{sort}", params, subreddit_name, limit, cursor),
+            incremental=sort in INCREMENTAL_LISTINGS
+        )
+
+    async def fetch_search(self, subreddit_name: str, query: str, limit: int, time_filter: str = "year") -> List[Dict[str, Any]]:
+        """Fetch posts from Reddit's search API restricted to the subreddit"""
+        params = {"q": query, "sort": "relevance", "restrict_sr": "1", "t": time_filter}
+        return await self._fetch_through_store(
+            subreddit_name, listing_key("search", time_filter, query), limit,
+            lambda cursor: self._paginate(f"/r/{subreddit_name}/search", params, subreddit_name, limit)
+        )
+
+    async def collect_posts_with_multiple_methods(self, subreddit_name: str, query: str, limit: int = 1000, time_range: str = "today", time_filter_fn=None) -> PostCollection:
+        """Async counterpart of RedditService.fetch_posts_with_multiple_methods (same methods, same limits)"""
+        logger.info(f"🔍 ASYNC METHODS: Fetching from r/{subreddit_name} with query '{query}' (time_range: {time_range})")
+
+        posts = PostCollection()
+        posts_per_method = max(1, min(limit, 1000) // 2)
+
+        try:
+            if time_range == "today":
+                today_posts_per_method = min(limit * 2, 1000)
+                results = await asyncio.gather(
+                    self.fetch_listing(subreddit_name, "new", today_posts_per_method),
+                    self.fetch_listing(subreddit_name, "hot", today_posts_per_method),
+                    return_exceptions=True
+                )
+                for method, result in zip(("new", "hot"), results):
+                    if isinstance(result, Exception):
+                        logger.warning(f"❌ ASYNC {method.upper()} method failed: {result}")
+                        continue
+                    posts.extend(result, method)
+                    logger.info(f"✅ ASYNC {method.upper()} method (today): Found {len(result)} posts")
+
+            elif time_range in ("last_week", "last_month", "year", "all_time"):
+                time_filter = {"last_week": "week", "last_month": "month", "year": "year", "all_time": "all"}[time_range]
+                top_limit = min(limit * 2, 1000) if time_range == "year" else posts_per_method
+                try:
+                    top_posts = await self.fetch_listing(subreddit_name, "top", top_limit, time_filter)
+                    matching = [post for post in top_posts if post_matches_query(post, query)]
+                    posts.extend(matching, "top")
+                    logger.info(f"✅ ASYNC TOP method ({time_filter}): Found {len(matching)} matching posts")
+                except Exception as e:
+                    logger.warning(f"❌ ASYNC TOP method ({time_filter}) failed: {e}")
+
+            # If we don't have enough posts, top up from the search API with the original query
+            if len(posts) < limit and query.strip():
+                try:
+                    search_posts = await self.fetch_search(subreddit_name, query, limit - len(posts))
+                    if time_range != "all_time" and time_filter_fn:
+                        search_posts = time_filter_fn(search_posts, time_range)
+                    new_count = posts.extend(search_posts, "search")
+                    logger.info(f"✅ ASYNC SEARCH API with original query: Found {new_count} new posts")
+                except Exception as e:
+                    logger.warning(f"❌ ASYNC SEARCH API failed: {e}")
+
+            if time_range == "year" and time_filter_fn:
+                posts.retain(time_filter_fn(posts.to_list(), "year"))
+
+            posts.truncate(limit)
+            logger.info(f"🎯 ASYNC METHODS RESULT: {len(posts)} total unique posts from r/{subreddit_name} (time_range: {time_range}, duplicates: {dict(posts.duplicates_by_method)})")
+            return posts
+
+        except Exception as e:
+            logger.error(f"❌ ASYNC METHODS failed for r/{subreddit_name}: {e}")
+            return PostCollection()
+
+    async def fetch_posts_with_multiple_methods(self, subreddit_name: str, query: str, limit: int = 1000, time_range: str = "today", time_filter_fn=None) -> List[Dict[str, Any]]:
+        """Fetch one subreddit with every method and return the de-duplicated posts"""
+        posts = await self.collect_posts_with_multiple_methods(subreddit_name, query, limit, time_range, time_filter_fn)
+        return posts.to_list()
+
+    async def fetch_posts_from_multiple_subreddits(self, subreddit_names: List[str], query: str = "", limit_per_sub: int = 1000, time_range: str = "today", time_filter_fn=None) -> List[Dict[str, Any]]:
+        """Fetch every subreddit concurrently and merge the results in subreddit order, de-duplicated across subreddits"""
+        logger.info(f"🚀 ASYNC SCRAPING: Starting concurrent fetch from {len(subreddit_names)} subreddits")
+        start_time = time.time()
+
+        results = await asyncio.gather(
+            *(self.collect_posts_with_multiple_methods(name, query, limit_per_sub, time_range, time_filter_fn) for name in subreddit_names),
+            return_exceptions=True
+        )
+
+        all_posts = PostCollection()
+        for subreddit_name, result in zip(subreddit_names, results):
+            if isinstance(result, Exception):
+                logger.error(f"❌ ASYNC: Error fetching from r/{subreddit_name}: {result}")
+                continue
+            new_count = all_posts.merge(result)
+            logger.info(f"✅ ASYNC: Fetched {len(result)} posts from r/{subreddit_name} ({len(result) - new_count} already seen in other subreddits)")
+
+        self.last_dedup_stats = all_posts.get_stats()
+        logger.info(f"🎯 ASYNC COMPLETE: Total {len(all_posts)} unique posts from {len(subreddit_names)} subreddits in {time.time() - start_time:.2f}s (post store: {self.store_hits} hits, {self.store_misses} misses)")
+        logger.info(f"🧹 DEDUP STATS: {self.last_dedup_stats}")
+        return all_posts.to_list()
+
+    async def iter_subreddit_batches(self, subreddit_names: List[str], query: str = "", limit_per_sub: int = 1000, time_range: str = "today", time_filter_fn=None) -> AsyncIterator[Tuple[str, List[Dict[str, Any]]]]:
+        """
+        Streaming variant of fetch_posts_from_multiple_subreddits: yields (subreddit, new posts)
+        as soon as each subreddit finishes, fastest first. Posts already yielded for another
+        subreddit are dropped, so a cross-post belongs to whichever subreddit finished first.
+        """
+        logger.info(f"🚀 ASYNC STREAMING: Starting concurrent fetch from {len(subreddit_names)} subreddits")
+        start_time = time.time()
+
+        async def collect(name: str) -> Tuple[str, PostCollection]:
+            return name, await self.collect_posts_with_multiple_methods(name, query, limit_per_sub, time_range, time_filter_fn)
+
+        tasks = [asyncio.create_task(collect(name)) for name in subreddit_names]
+        all_posts = PostCollection()
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                subreddit_name, result = await next_done
+                new_posts = all_posts.merge_new(result)
+                logger.info(f"✅ ASYNC STREAM: r/{subreddit_name} done after {time.time() - start_time:.2f}s ({len(new_posts)} new posts, {len(result) - len(new_posts)} already seen)")
+                yield subreddit_name, new_posts
+        finally:
+            # Client went away (or the consumer stopped early): stop scraping the rest
+            for task in tasks:
+                task.cancel()
+
+        self.last_dedup_stats = all_posts.get_stats()
+        logger.info(f"🎯 ASYNC STREAM COMPLETE: {len(all_posts)} unique posts from {len(subreddit_names)} subreddits in {time.time() - start_time:.2f}s")
@@ -2,10 +2,15 @@ import praw
 import time
 import logging
 import random
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator
 from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing
 from app.core.config import settings
 from app.services.business_mapping_hyperfocus import get_subreddits_for_business, get_subreddits_for_industry
+from app.services.reddit_ingestion import AsyncRedditIngestor
+from app.services.rate_limiter import get_rate_limiter
+from app.services.post_collection import PostCollection
+from app.services.post_store import listing_key
 
 logger = logging.getLogger(__name__)
 
@@ -16,18 +21,16 @@ class RedditService:
             client_secret=settings.reddit_client_secret,
             user_agent=settings.reddit_user_agent,
         )
-        self.last_request_time = 0
-        self.rate_limit_delay = 0.2  # 0.2 seconds between requests (5x faster)
+        # Shared token bucket for this credential (coordinates all instances and searches)
+        self.rate_limiter = get_rate_limiter(settings.reddit_client_id)
+        self.ingestor = AsyncRedditIngestor(rate_limiter=self.rate_limiter)
+        self.last_dedup_stats: Dict[str, Any] = {}
     
     def _rate_limit(self):
         """Ensure we don't exceed Reddit's rate limits"""
-        current_time = time.time()
-        time_since_last = current_time - self.last_request_time
-        if time_since_last < self.rate_limit_delay:
-            sleep_time = self.rate_limit_delay - time_since_last
-            logger.info(f"Rate limiting: sleeping for {sleep_time:.2f} seconds")
-            time.sleep(sleep_time)
-        self.last_request_time = time.time()
+        # Feed back the quota PRAW saw on its previous request, then wait for our turn
+        self.rate_limiter.update_from_praw(self.reddit)
+        self.rate_limiter.acquire()
     
 # Query variation method removed - using original query only for consistent quality
     
@@ -59,7 +62,7 @@ class RedditService:
     def fetch_posts_from_multiple_subreddits(self, subreddit_names: List[str], query: str = "", limit_per_sub: int = 1000, time_range: str = "today") -> List[Dict[str, Any]]:
         """Fetch posts from multiple subreddits in parallel for much faster performance"""
         logger.info(f"🚀 PARALLEL SCRAPING: Starting parallel fetch from {len(subreddit_names)} subreddits")
-        all_posts = []
+        all_posts = PostCollection()  # De-duplicates cross-posts between subreddits
         
         # Use ThreadPoolExecutor to run subreddits in parallel
         with ThreadPoolExecutor(max_workers=3) as executor:
@@ -68,7 +71,7 @@ class RedditService:
             for subreddit_name in subreddit_names:
                 # Use original query for consistent quality
                 future = executor.submit(
-                    self.fetch_posts_with_multiple_methods, 
+                    self.collect_posts_with_multiple_methods, 
                     subreddit_name, query, limit_per_sub, time_range
                 )
                 futures.append((subreddit_name, future))
@@ -77,19 +80,63 @@ class RedditService:
             for subreddit_name, future in futures:
                 try:
                     posts = future.result()
-                    all_posts.extend(posts)
-                    logger.info(f"✅ PARALLEL: Fetched {len(posts)} posts from r/{subreddit_name}")
+                    new_count = all_posts.merge(posts)
+                    logger.info(f"✅ PARALLEL: Fetched {len(posts)} posts from r/{subreddit_name} ({len(posts) - new_count} already seen in other subreddits)")
                 except Exception as e:
                     logger.error(f"❌ PARALLEL: Error fetching from r/{subreddit_name}: {e}")
         
-        logger.info(f"🎯 PARALLEL COMPLETE: Total {len(all_posts)} posts from {len(subreddit_names)} subreddits")
-        return all_posts
+        self.last_dedup_stats = all_posts.get_stats()
+        logger.info(f"🎯 PARALLEL COMPLETE: Total {len(all_posts)} unique posts from {len(subreddit_names)} subreddits")
+        logger.info(f"🧹 DEDUP STATS: {self.last_dedup_stats}")
+        return all_posts.to_list()
     
+    async def fetch_posts_from_multiple_subreddits_async(self, subreddit_names: List[str], query: str = "", limit_per_sub: int = 1000, time_range: str = "today") -> List[Dict[str, Any]]:
+        """Fetch posts from multiple subreddits concurrently on the event loop (async ingestion engine)"""
+        posts = await self.ingestor.fetch_posts_from_multiple_subreddits(
+            subreddit_names, query, limit_per_sub, time_range, time_filter_fn=self._filter_posts_by_time
+        )
+        self.last_dedup_stats = self.ingestor.last_dedup_stats
+        return posts
+
+    async def stream_posts_from_multiple_subreddits(self, subreddit_names: List[str], query: str = "", limit_per_sub: int = 1000, time_range: str = "today") -> AsyncIterator[Tuple[str, List[Dict[str, Any]]]]:
+        """Yield (subreddit, new posts) as each subreddit finishes (streaming search)"""
+        batches = self.ingestor.iter_subreddit_batches(
+            subreddit_names, query, limit_per_sub, time_range, time_filter_fn=self._filter_posts_by_time
+        )
+        async with aclosing(batches):
+            async for subreddit_name, posts in batches:
+                yield subreddit_name, posts
+
+    def get_crawl_cursor(self, subreddit_name: str, sort: str = "new", time_filter: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Crawl watermark (newest fullname + created_utc) for one subreddit listing, if it was crawled"""
+        if not self.ingestor.post_store:
+            return None
+        return self.ingestor.post_store.get_crawl(subreddit_name, listing_key(sort, time_filter))
+
+    def get_crawl_cursors(self, subreddit_name: Optional[str] = None) -> List[Dict[str, Any]]:
+        """All crawl watermarks, optionally for one subreddit"""
+        if not self.ingestor.post_store:
+            return []
+        return self.ingestor.post_store.list_crawls(subreddit_name)
+
+    def reset_crawl_cursor(self, subreddit_name: str, sort: Optional[str] = None, time_filter: Optional[str] = None) -> int:
+        """Drop crawl watermarks so the next crawl is a full one (all listings of the subreddit if no sort)"""
+        if not self.ingestor.post_store:
+            return 0
+        listing = listing_key(sort, time_filter) if sort else None
+        deleted = self.ingestor.post_store.reset_crawl(subreddit_name, listing)
+        logger.info(f"⏮️ CRAWL CURSOR RESET: r/{subreddit_name} {listing or 'all listings'} ({deleted} cursors)")
+        return deleted
+
     def fetch_posts_with_multiple_methods(self, subreddit_name: str, query: str, limit: int = 1000, time_range: str = "today") -> List[Dict[str, Any]]:
         """Fetch posts using multiple sorting methods and search variations for maximum diversity"""
+        return self.collect_posts_with_multiple_methods(subreddit_name, query, limit, time_range).to_list()
+    
+    def collect_posts_with_multiple_methods(self, subreddit_name: str, query: str, limit: int = 1000, time_range: str = "today") -> PostCollection:
+        """Same as fetch_posts_with_multiple_methods, but keeps the id-indexed collection (with per-method stats)"""
         logger.info(f"🔍 MULTIPLE METHODS: Fetching from r/{subreddit_name} with query '{query}' (time_range: {time_range})")
         
-        all_posts = []
+        all_posts = PostCollection()
         posts_per_method = max(1, min(limit, 1000) // 2)  # Split limit between methods, max 1000 per method
         
         try:
@@ -106,7 +153,7 @@ class RedditService:
                     new_posts = list(subreddit.new(limit=today_posts_per_method))
                     # Add all posts without filtering - let AND-logic handle filtering later
                     for post in new_posts:
-                        all_posts.append(self._format_post(post))
+                        all_posts.add(self._format_post(post), "new")
                     logger.info(f"✅ NEW method (today): Found {len(new_posts)} posts (increased limit)")
                 except Exception as e:
                     logger.warning(f"❌ NEW method failed: {e}")
@@ -114,10 +161,9 @@ class RedditService:
                 try:
                     self._rate_limit()
                     hot_posts = list(subreddit.hot(limit=today_posts_per_method))
-                    # Add all posts without filtering - only check for duplicates
+                    # Add all posts without filtering - the collection drops duplicates in O(1)
                     for post in hot_posts:
-                        if not any(p['id'] == post.id for p in all_posts):
-                            all_posts.append(self._format_post(post))
+                        all_posts.add(self._format_post(post), "hot")
                     logger.info(f"✅ HOT method (today): Found {len(hot_posts)} posts (increased limit)")
                 except Exception as e:
                     logger.warning(f"❌ HOT method failed: {e}")
@@ -129,7 +175,7 @@ class RedditService:
                     top_posts = list(subreddit.top(time_filter="week", limit=posts_per_method))
                     for post in top_posts:
                         if self._post_matches_query(post, query):
-                            all_posts.append(self._format_post(post))
+                            all_posts.add(self._format_post(post), "top")
                     logger.info(f"✅ TOP method (week): Found {len([p for p in top_posts if self._post_matches_query(p, query)])} matching posts")
                 except Exception as e:
                     logger.warning(f"❌ TOP method (week) failed: {e}")
@@ -141,7 +187,7 @@ class RedditService:
                     top_posts = list(subreddit.top(time_filter="month", limit=posts_per_method))
                     for post in top_posts:
                         if self._post_matches_query(post, query):
-                            all_posts.append(self._format_post(post))
+                            all_posts.add(self._format_post(post), "top")
                     logger.info(f"✅ TOP method (month): Found {len([p for p in top_posts if self._post_matches_query(p, query)])} matching posts")
                 except Exception as e:
                     logger.warning(f"❌ TOP method (month) failed: {e}")
@@ -155,7 +201,7 @@ class RedditService:
                     top_posts = list(subreddit.top(time_filter="year", limit=year_posts_per_method))
                     for post in top_posts:
                         if self._post_matches_query(post, query):
-                            all_posts.append(self._format_post(post))
+                            all_posts.add(self._format_post(post), "top")
                     logger.info(f"✅ TOP method (year): Found {len([p for p in top_posts if self._post_matches_query(p, query)])} matching posts")
                 except Exception as e:
                     logger.warning(f"❌ TOP method (year) failed: {e}")
@@ -167,7 +213,7 @@ class RedditService:
                     top_posts = list(subreddit.top(time_filter="all", limit=posts_per_method))
                     for post in top_posts:
                         if self._post_matches_query(post, query):
-                            all_posts.append(self._format_post(post))
+                            all_posts.add(self._format_post(post), "top")
                     logger.info(f"✅ TOP method (all): Found {len([p for p in top_posts if self._post_matches_query(p, query)])} matching posts")
                 except Exception as e:
                     logger.warning(f"❌ TOP method (all) failed: {e}")
@@ -176,27 +222,24 @@ class RedditService:
             if len(all_posts) < limit and query.strip():
                 try:
                     self._rate_limit()
-                    # Set current time range for search API to use
-                    self._current_time_range = time_range
-                    search_posts = self.fetch_posts_search_api(subreddit_name, query, limit - len(all_posts))
-                    for post in search_posts:
-                        if not any(p['id'] == post['id'] for p in all_posts):
-                            all_posts.append(post)
-                    logger.info(f"✅ SEARCH API with original query: Found {len(search_posts)} new posts")
+                    search_posts = self.fetch_posts_search_api(subreddit_name, query, limit - len(all_posts), time_range=time_range)
+                    new_count = all_posts.extend(search_posts, "search")
+                    logger.info(f"✅ SEARCH API with original query: Found {new_count} new posts ({len(search_posts) - new_count} duplicates)")
                 except Exception as e:
                     logger.warning(f"❌ SEARCH API failed: {e}")
             
             # Apply year filtering to Reddit API results
             if time_range == "year":
-                all_posts = self._filter_posts_by_time(all_posts, "year")
+                all_posts.retain(self._filter_posts_by_time(all_posts.to_list(), "year"))
                 logger.info(f"🕒 YEAR FILTER APPLIED: {len(all_posts)} posts remaining after year filter")
             
-            logger.info(f"🎯 MULTIPLE METHODS RESULT: {len(all_posts)} total unique posts from r/{subreddit_name} (time_range: {time_range})")
-            return all_posts[:limit]
+            all_posts.truncate(limit)
+            logger.info(f"🎯 MULTIPLE METHODS RESULT: {len(all_posts)} total unique posts from r/{subreddit_name} (time_range: {time_range}, duplicates: {dict(all_posts.duplicates_by_method)})")
+            return all_posts
             
         except Exception as e:
             logger.error(f"❌ MULTIPLE METHODS failed for r/{subreddit_name}: {e}")
-            return []
+            return PostCollection()
     
 # Search variations method removed - using original query only for consistent quality
     
@@ -213,7 +256,7 @@ class RedditService:
         query_words = query_lower.split()
         return any(word in title_lower or word in selftext_lower for word in query_words)
     
-    def fetch_posts_search_api(self, subreddit_name: str, query: str, limit: int = 1000) -> List[Dict[str, Any]]:
+    def fetch_posts_search_api(self, subreddit_name: str, query: str, limit: int = 1000, time_range: Optional[str] = None) -> List[Dict[str, Any]]:
         """Fetch posts using Reddit's search API with pagination up to 1,000 posts"""
         try:
             import requests
@@ -241,7 +284,11 @@ class RedditService:
                 if after:
                     params['after'] = after
                 
+                if after:
+                    self._rate_limit()  # Every extra page costs a request too
                 response = requests.get(url, params=params, headers=headers, timeout=10)
+                # No rate limit headers from here: www.reddit.com has its own (per-IP) limits,
+                # and its headers would overwrite the OAuth credential's budget
                 response.raise_for_status()
                 
                 data = response.json()
@@ -280,9 +327,10 @@ class RedditService:
             logger.info(f"🔍 SEARCH API: Found {len(all_posts)} posts for query '{query}' in r/{subreddit_name}")
             
             # Apply time filtering if time_range is specified
-            if hasattr(self, '_current_time_range') and self._current_time_range != "all_time":
-                all_posts = self._filter_posts_by_time(all_posts, self._current_time_range)
-                logger.info(f"🕒 TIME FILTERING: Filtered to {len(all_posts)} posts for time_range: {self._current_time_range}")
+            # (passed per call, not stored on the instance: one RedditService serves concurrent searches)
+            if time_range and time_range != "all_time":
+                all_posts = self._filter_posts_by_time(all_posts, time_range)
+                logger.info(f"🕒 TIME FILTERING: Filtered to {len(all_posts)} posts for time_range: {time_range}")
             
             return all_posts[:max_posts]
             
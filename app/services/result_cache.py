@@ -1,80 +1,206 @@
 """
 Result caching service to track when results were last fetched
-and implement automatic refresh mechanism
+and implement automatic refresh mechanism.
+
+Bounded cache of filtered lead lists: entries expire after a TTL, the least
+recently used entry is evicted once the entry count or the byte budget is
+exceeded, and keys are normalized (case, whitespace, hashed problem text) so the
+same search typed slightly differently hits the same entry. Entries live in a
+CacheBackend (app.services.cache_backend): in-process memory, or a shared SQLite
+file so all workers and restarts see the same warm results.
+
+Stale-while-revalidate: entries younger than the soft TTL are fresh; between the
+soft and the hard TTL they are still served but reported stale, so the caller can
+refresh them in the background; past the hard TTL they are gone.
 """
+import asyncio
 import time
+import hashlib
 import logging
+import threading
 from typing import Dict, Optional, Tuple, Any
-from datetime import datetime, timedelta
+from app.core.config import settings
+from app.services.cache_backend import CacheBackend, get_cache_backend, estimate_size
 
 logger = logging.getLogger(__name__)
 
+
+def _normalize(text: Optional[str]) -> str:
+    return " ".join(str(text or "").lower().split())
+
+
 class ResultCache:
-    def __init__(self):
-        # In-memory cache: {cache_key: (timestamp, results)}
-        self.cache: Dict[str, Tuple[float, any]] = {}
-        self.refresh_interval_hours = 24  # Refresh results after 24 hours
-    
-    def _generate_cache_key(self, query: str, business_type: str, time_range: str, user_id: str, result_count: int = None) -> str:
-        """Generate a unique cache key for the search parameters"""
+    def __init__(self, max_entries: Optional[int] = None, max_bytes: Optional[int] = None, ttl_hours: Optional[float] = None,
+                 soft_ttl_hours: Optional[float] = None, backend: Optional[CacheBackend] = None):
+        self._backend = backend
+        self.max_entries = max_entries or settings.result_cache_max_entries
+        self.max_bytes = max_bytes or settings.result_cache_max_bytes
+        self.refresh_interval_hours = ttl_hours or settings.result_cache_ttl_hours  # Hard TTL: never served after this long
+        self.soft_ttl_hours = min(soft_ttl_hours or settings.result_cache_soft_ttl_hours, self.refresh_interval_hours)  # Stale after this long
+        self._lock = threading.Lock()
+        self._eviction_task: Optional[asyncio.Task] = None
+        # Counters of this worker process
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+
+    @property
+    def backend(self) -> CacheBackend:
+        if self._backend is None:
+            self._backend = get_cache_backend()
+        return self._backend
+
+    def _generate_cache_key(self, query: str, business_type: str, time_range: str, user_id: Optional[str] = None,
+                            result_count: Optional[int] = None, tier: Optional[int] = None) -> str:
+        """Normalized cache key: business/time range/count/tier in clear, problem text hashed"""
+        query_hash = hashlib.sha1(_normalize(query).encode("utf-8")).hexdigest()[:16]
+        parts = [_normalize(business_type), _normalize(time_range)]
         if result_count is not None:
-            return f"{query}_{business_type}_{time_range}_{user_id}_{result_count}"
-        return f"{query}_{business_type}_{time_range}_{user_id}"
-    
-    def get_cached_results(self, query: str, business_type: str, time_range: str, user_id: str, result_count: int = None) -> Optional[any]:
-        """Get cached results if they exist and are fresh"""
-        cache_key = self._generate_cache_key(query, business_type, time_range, user_id, result_count)
-        
-        if cache_key not in self.cache:
+            parts.append(f"n{result_count}")
+        if tier is not None:
+            parts.append(f"t{tier}")
+        if user_id:
+            parts.append(f"u{_normalize(user_id)}")
+        parts.append(query_hash)
+        return "|".join(parts)
+
+    def _count(self, **increments: int):
+        with self._lock:
+            for name, amount in increments.items():
+                setattr(self, name, getattr(self, name) + amount)
+
+    def get_cached_results(self, query: str, business_type: str, time_range: str, user_id: Optional[str] = None,
+                           result_count: Optional[int] = None, tier: Optional[int] = None) -> Optional[Tuple[Any, float]]:
+        """Get cached results if they exist and are within the hard TTL: (results, age_hours)"""
+        found = self.lookup(query, business_type, time_range, user_id, result_count, tier)
+        return (found[0], found[1]) if found else None
+
+    def lookup(self, query: str, business_type: str, time_range: str, user_id: Optional[str] = None,
+               result_count: Optional[int] = None, tier: Optional[int] = None) -> Optional[Tuple[Any, float, bool]]:
+        """Cached results within the hard TTL: (results, age_hours, stale)"""
+        cache_key = self._generate_cache_key(query, business_type, time_range, user_id, result_count, tier)
+
+        entry = self.backend.get(cache_key)
+        if entry is None:
+            self._count(misses=1)
             logger.info(f"🔍 CACHE MISS: No cached results for key: {cache_key}")
             return None
-        
-        timestamp, results = self.cache[cache_key]
-        age_hours = (time.time() - timestamp) / 3600
-        
+
+        created_at, value = entry
+        age_hours = (time.time() - created_at) / 3600
         if age_hours > self.refresh_interval_hours:
+            self.backend.delete(cache_key)
+            self._count(expirations=1, misses=1)
             logger.info(f"🔄 CACHE EXPIRED: Results are {age_hours:.1f} hours old, need refresh")
-            del self.cache[cache_key]
             return None
-        
-        logger.info(f"✅ CACHE HIT: Using cached results from {age_hours:.1f} hours ago")
-        return (results, age_hours)
-    
-    def cache_results(self, query: str, business_type: str, time_range: str, user_id: str, results_with_age: Tuple[Any, float], result_count: int = None):
-        """Cache results with current timestamp"""
-        cache_key = self._generate_cache_key(query, business_type, time_range, user_id, result_count)
-        timestamp = time.time()
-        
+
+        stale = age_hours > self.soft_ttl_hours
+        self._count(hits=1, stale_hits=int(stale))
+        logger.info(f"✅ CACHE HIT{' (STALE)' if stale else ''}: Using cached results from {age_hours:.1f} hours ago")
+        return (value, age_hours, stale)
+
+    def cache_results(self, query: str, business_type: str, time_range: str, user_id: Optional[str], results_with_age: Tuple[Any, float],
+                      result_count: Optional[int] = None, tier: Optional[int] = None):
+        """Cache results, backdated by their age (0 for freshly fetched results)"""
         results, age_hours = results_with_age
-        self.cache[cache_key] = (timestamp, results)
-        logger.info(f"💾 CACHED: Stored results for key: {cache_key}")
-    
-    def should_refresh(self, query: str, business_type: str, time_range: str, user_id: str, result_count: int = None) -> bool:
+        self.store_value(query, business_type, time_range, results, age_hours, user_id=user_id, result_count=result_count, tier=tier)
+
+    def store_value(self, query: str, business_type: str, time_range: str, value: Any, age_hours: float = 0.0,
+                    user_id: Optional[str] = None, result_count: Optional[int] = None, tier: Optional[int] = None,
+                    depth: Optional[int] = None):
+        """
+        Cache any value under the search's key, backdated by age_hours (0 for freshly fetched results).
+        With depth (how many results the value covers), an unexpired entry covering more results
+        is kept, so a shallow search finishing after a concurrent deep one can't truncate it.
+        """
+        cache_key = self._generate_cache_key(query, business_type, time_range, user_id, result_count, tier)
+        size_bytes = estimate_size(value)
+        if size_bytes > self.max_bytes:
+            logger.warning(f"⚠️ CACHE SKIP: {size_bytes} bytes exceeds the cache budget ({self.max_bytes} bytes)")
+            return
+
+        created_at = time.time() - (age_hours or 0) * 3600
+        if depth is None:
+            stored_bytes = self.backend.set(cache_key, value, created_at)
+        else:
+            def keep_existing(existing_created_at: float, existing: Any) -> bool:
+                fresh = (time.time() - existing_created_at) / 3600 <= self.refresh_interval_hours
+                return fresh and isinstance(existing, dict) and existing.get("depth", 0) > depth
+            stored_bytes = self.backend.set_unless(cache_key, value, created_at, keep_existing)
+            if not stored_bytes:
+                logger.info(f"💾 CACHE KEEP: Existing entry for key {cache_key} covers more than {depth} results")
+                return
+        logger.info(f"💾 CACHED: Stored results for key: {cache_key} ({stored_bytes} bytes)")
+
+    def should_refresh(self, query: str, business_type: str, time_range: str, user_id: Optional[str] = None,
+                       result_count: Optional[int] = None, tier: Optional[int] = None) -> bool:
         """Check if results should be refreshed"""
-        cache_key = self._generate_cache_key(query, business_type, time_range, user_id, result_count)
-        
-        if cache_key not in self.cache:
-            return True
-        
-        timestamp, _ = self.cache[cache_key]
-        age_hours = (time.time() - timestamp) / 3600
-        
-        return age_hours > self.refresh_interval_hours
-    
-    def get_cache_stats(self) -> Dict[str, any]:
-        """Get cache statistics"""
-        total_entries = len(self.cache)
-        if total_entries == 0:
-            return {"total_entries": 0, "oldest_entry_hours": 0, "newest_entry_hours": 0}
-        
+        cache_key = self._generate_cache_key(query, business_type, time_range, user_id, result_count, tier)
+        entry = self.backend.get(cache_key)
+        return entry is None or (time.time() - entry[0]) / 3600 > self.refresh_interval_hours
+
+    def evict(self) -> int:
+        """One eviction pass: expired entries, then least recently used ones over budget"""
+        evicted = self.backend.evict(self.max_entries, self.max_bytes, self.refresh_interval_hours * 3600)
+        if evicted:
+            self._count(evictions=evicted)
+            logger.info(f"🗑️ CACHE EVICT: Removed {evicted} entries")
+        return evicted
+
+    def start_background_eviction(self):
+        """Run evict() every settings.result_cache_eviction_interval_seconds (FastAPI startup hook)"""
+        if self._eviction_task and not self._eviction_task.done():
+            return
+        self._eviction_task = asyncio.create_task(self._eviction_loop())
+
+    async def _eviction_loop(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.evict)
+            except Exception as e:
+                logger.warning(f"⚠️ CACHE EVICT failed: {e}")
+            await asyncio.sleep(settings.result_cache_eviction_interval_seconds)
+
+    async def stop_background_eviction(self):
+        if self._eviction_task and not self._eviction_task.done():
+            self._eviction_task.cancel()
+            try:
+                await self._eviction_task
+            except asyncio.CancelledError:
+                pass
+
+    def clear(self):
+        self.backend.clear()
+
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Get cache statistics (storage from the backend, hit counters of this worker)"""
+        storage = self.backend.get_stats()
+        with self._lock:
+            lookups = self.hits + self.misses
+            stats = {
+                "backend": storage["backend"],
+                "total_entries": storage["entries"],
+                "total_bytes": storage["bytes"],
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_hours": self.refresh_interval_hours,
+                "soft_ttl_hours": self.soft_ttl_hours,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+                "expirations": self.expirations,
+                "evictions": self.evictions,
+                "oldest_entry_hours": 0,
+                "newest_entry_hours": 0
+            }
         current_time = time.time()
-        ages = [(current_time - timestamp) / 3600 for timestamp, _ in self.cache.values()]
-        
-        return {
-            "total_entries": total_entries,
-            "oldest_entry_hours": max(ages),
-            "newest_entry_hours": min(ages)
-        }
+        if storage["oldest_created_at"] is not None:
+            stats["oldest_entry_hours"] = (current_time - storage["oldest_created_at"]) / 3600
+            stats["newest_entry_hours"] = (current_time - storage["newest_created_at"]) / 3600
+        return stats
 
 # Global cache instance
 result_cache = ResultCache()
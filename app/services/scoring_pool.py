@@ -0,0 +1,138 @@
+"""
+Multi-core scoring pool
+Optional process-pool backend for scoring very large post batches. Each worker
+imports the scoring profiles once (its initializer), so a task only ships a tiny
+profile key plus its chunk of post text: the worker compiles the rule matcher /
+AIEnhancer from its own copy of the profiles and caches it for later chunks.
+Chunks are mapped in order, so merged results line up with the input posts.
+Below the size threshold (or on a single core) scoring stays in-process, where
+it is cheaper than pickling posts to another process.
+"""
+
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
+from app.core.ai_config import get_ai_config
+
+logger = logging.getLogger(__name__)
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+# Worker-side state (one copy per worker process)
+_worker_enhancers: Dict[bool, Any] = {}
+
+
+def _init_worker():
+    """Compile the scoring profiles once per worker"""
+    import app.services.scoring_profiles  # noqa: F401 (profiles are built at import)
+    logging.getLogger("app").setLevel(logging.WARNING)  # Keep per-chunk logging out of the server log
+
+
+def _score_rule_chunk(business_type: str, industry_type: Optional[str], problem_description: str,
+                      enhanced_keywords: Tuple[str, ...], texts: List[str]) -> np.ndarray:
+    """Rule-based scores for one chunk (matcher compiled from the worker's profiles, lru-cached)"""
+    from app.services.scoring_profiles import get_rule_matcher
+    from app.services.batch_scorer import score_texts
+    matcher = get_rule_matcher(business_type, industry_type, problem_description, enhanced_keywords)
+    return score_texts(matcher, texts)
+
+
+def _score_relevance_chunk(use_improved_scoring: bool, keywords: List[str], business_type: Optional[str],
+                           industry_type: Optional[str], posts: List[Dict[str, str]]) -> list:
+    """AIEnhancer relevance scores for one chunk"""
+    enhancer = _worker_enhancers.get(use_improved_scoring)
+    if enhancer is None:
+        from app.services.ai_enhancer import AIEnhancer
+        enhancer = _worker_enhancers[use_improved_scoring] = AIEnhancer(use_improved_scoring=use_improved_scoring)
+    return enhancer.analyze_posts_relevance(posts, keywords, business_type=business_type, industry_type=industry_type)
+
+
+def _worker_count() -> int:
+    configured = get_ai_config()["process_pool_workers"]
+    return configured or min(4, os.cpu_count() or 1)
+
+
+def should_use_process_pool(n_posts: int) -> bool:
+    """Does multi-core scoring pay off for a batch of this size?"""
+    config = get_ai_config()
+    return config["use_process_pool"] and n_posts >= config["process_pool_min_posts"] and _worker_count() > 1
+
+
+def _get_pool() -> Tuple[ProcessPoolExecutor, int]:
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None:
+            _pool_workers = _worker_count()
+            # spawn: forking a server process that already runs threads is not safe
+            _pool = ProcessPoolExecutor(
+                max_workers=_pool_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker
+            )
+            logger.info(f"🧵 SCORING POOL: started {_pool_workers} worker processes")
+        return _pool, _pool_workers
+
+
+def _map_chunks(task, chunks: List[list]) -> list:
+    """Run task over the chunks in the pool, results in chunk order"""
+    pool, _ = _get_pool()
+    try:
+        return list(pool.map(task, chunks))
+    except BrokenProcessPool:
+        # A worker died: drop the pool so the next large batch starts a fresh one
+        shutdown_scoring_pool()
+        raise
+
+
+def _chunks(items: list, n_chunks: int) -> List[list]:
+    """Split into n_chunks contiguous chunks of (almost) equal size, preserving order"""
+    size, extra = divmod(len(items), n_chunks)
+    chunks, start = [], 0
+    for i in range(n_chunks):
+        end = start + size + (1 if i < extra else 0)
+        if end > start:
+            chunks.append(items[start:end])
+        start = end
+    return chunks
+
+
+def score_rule_texts(business_type: str, industry_type: Optional[str], problem_description: str,
+                     enhanced_keywords: Tuple[str, ...], texts: List[str]) -> np.ndarray:
+    """FastLeadFilter rule-based scores computed across the pool, in input order"""
+    chunks = _chunks(texts, _get_pool()[1])
+    task = partial(_score_rule_chunk, business_type, industry_type, problem_description, tuple(enhanced_keywords))
+    results = _map_chunks(task, chunks)
+    scores = np.concatenate(results) if results else np.zeros(0, dtype=np.int64)
+    logger.info(f"🧵 SCORING POOL: {len(texts)} posts scored in {len(chunks)} chunks")
+    return scores
+
+
+def analyze_posts_relevance(use_improved_scoring: bool, posts: List[Dict[str, Any]], keywords: List[str],
+                            business_type: Optional[str] = None, industry_type: Optional[str] = None) -> list:
+    """AIEnhancer.analyze_posts_relevance computed across the pool, in input order"""
+    # Ship only the fields the scorer reads
+    slim_posts = [{"title": post.get("title", ""), "text": post.get("text", "")} for post in posts]
+    chunks = _chunks(slim_posts, _get_pool()[1])
+    task = partial(_score_relevance_chunk, use_improved_scoring, list(keywords), business_type, industry_type)
+    results = _map_chunks(task, chunks)
+    scores = [score for chunk_scores in results for score in chunk_scores]
+    logger.info(f"🧵 SCORING POOL: {len(posts)} posts analyzed in {len(chunks)} chunks")
+    return scores
+
+
+def shutdown_scoring_pool():
+    """Stop the worker processes (app shutdown)"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+            logger.info("🧵 SCORING POOL: stopped")
@@ -0,0 +1,161 @@
+"""
+Precompiled scoring profiles
+One immutable ScoringProfile per business and per industry, built once at import
+from BUSINESS_MAPPINGS / INDUSTRY_MAPPINGS (rule-based keywords), BUSINESS_KEYWORDS /
+INDUSTRY_KEYWORDS (business relevance keywords), BUSINESS_THRESHOLDS and the
+struggle indicators. Filters read profiles instead of looking up and recombining
+the global mappings on every call, and nothing here can grow the global lists.
+"""
+
+import logging
+from dataclasses import dataclass, field
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Dict, Tuple, Mapping, FrozenSet, Optional
+from app.services.business_mapping_hyperfocus import BUSINESS_MAPPINGS, INDUSTRY_MAPPINGS
+from app.services.business_keywords import BUSINESS_KEYWORDS, INDUSTRY_KEYWORDS
+from app.services.keyword_matcher import KeywordMatcher
+
+logger = logging.getLogger(__name__)
+
+# Business-Specific Threshold Configuration
+# Each business/industry can have different quality thresholds per tier
+BUSINESS_THRESHOLDS = {
+    "SaaS Companies": {
+        1: 13,  # Tier 1: High quality cutoff
+        2: 16,  # Tier 2: Even stricter quality
+        3: 13,  # Tier 3: Higher to reduce noise
+        4: 14   # Tier 4: High threshold for noisy subreddits
+    },
+    "App Developers": {
+        1: 13,
+        2: 16,
+        3: 13,
+        4: 14
+    },
+    "E-commerce Stores": {
+        1: 13,
+        2: 16,
+        3: 13,
+        4: 14
+    },
+    "Jobs and Hiring": {
+        1: 9,   # Tier 1 tuned per testing feedback
+        2: 8,   # Tier 2 tuned per testing feedback
+        3: 10,  # Tier 3 threshold increased for better quality
+        4: 10   # Tier 4 threshold increased to minimum 10
+    },
+    # Industry types
+    "SaaS / Tech": {
+        1: 13,
+        2: 16,
+        3: 13,
+        4: 14
+    },
+    "E-commerce": {
+        1: 13,
+        2: 16,
+        3: 13,
+        4: 14
+    }
+}
+
+# Default thresholds if business type not found
+DEFAULT_THRESHOLDS = {1: 13, 2: 16, 3: 13, 4: 14}
+
+# Struggle indicators
+STRUGGLE_INDICATORS = (
+    "struggling", "help", "can't", "cannot", "can not", "trouble", "problem", "issue",
+    "stuck", "frustrated", "overwhelmed", "desperate", "urgent", "failing", "lost",
+    "losing", "declining", "first client", "first customer", "no customers", "no clients",
+    "getting clients", "customer acquisition", "lead generation", "need help",
+    "looking for", "how to", "what should", "any advice"
+)
+
+# Points per keyword category found in a post
+RULE_WEIGHTS = MappingProxyType({
+    "business": 3,  # Business/industry + enhanced keywords
+    "struggle": 2,  # Struggle indicators
+    "enhanced": 4,  # Enhanced keywords again (higher weight)
+    "problem": 1    # Problem description words longer than 3 characters
+})
+
+# How many other businesses/industries the conflict penalty checks
+CONFLICT_CHECK_LIMIT = 3
+
+
+@dataclass(frozen=True)
+class ScoringProfile:
+    """Everything needed to score posts for one business or industry"""
+    name: str
+    kind: str  # "business" or "industry"
+    keywords: Tuple[str, ...]  # Rule-based keywords (hyper-focus mappings), in listing order
+    relevance_keywords: Tuple[str, ...]  # Business relevance keywords (business_keywords.py)
+    conflict_keywords: Tuple[Tuple[str, ...], ...]  # Relevance keywords of the businesses checked for conflicts
+    thresholds: Mapping[int, int]
+    struggle_indicators: Tuple[str, ...] = STRUGGLE_INDICATORS
+    weights: Mapping[str, int] = RULE_WEIGHTS
+    keyword_set: FrozenSet[str] = field(init=False)
+    matcher: KeywordMatcher = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, "keyword_set", frozenset(keyword.lower() for keyword in self.keywords))
+        object.__setattr__(self, "matcher", KeywordMatcher(
+            {"business": self.keywords, "struggle": self.struggle_indicators}, dict(self.weights)
+        ))
+
+    def threshold_for(self, tier: int) -> int:
+        return self.thresholds.get(tier, 13)
+
+
+def _build_profile(kind: str, name: str) -> ScoringProfile:
+    mappings, relevance = (BUSINESS_MAPPINGS, BUSINESS_KEYWORDS) if kind == "business" else (INDUSTRY_MAPPINGS, INDUSTRY_KEYWORDS)
+    conflicts = ()
+    if name in relevance:
+        others = [other for other in relevance if other != name][:CONFLICT_CHECK_LIMIT]
+        conflicts = tuple(tuple(relevance[other]) for other in others)
+    return ScoringProfile(
+        name=name,
+        kind=kind,
+        keywords=tuple(mappings.get(name, {}).get("keywords", [])),
+        relevance_keywords=tuple(relevance.get(name, [])),
+        conflict_keywords=conflicts,
+        thresholds=MappingProxyType(dict(BUSINESS_THRESHOLDS.get(name, DEFAULT_THRESHOLDS)))
+    )
+
+
+def _build_profiles(kind: str) -> Dict[str, ScoringProfile]:
+    mappings, relevance = (BUSINESS_MAPPINGS, BUSINESS_KEYWORDS) if kind == "business" else (INDUSTRY_MAPPINGS, INDUSTRY_KEYWORDS)
+    names = list(dict.fromkeys([*mappings, *relevance, *BUSINESS_THRESHOLDS]))
+    return {name: _build_profile(kind, name) for name in names}
+
+
+# Built once at import and shared by every filter
+BUSINESS_PROFILES: Mapping[str, ScoringProfile] = MappingProxyType(_build_profiles("business"))
+INDUSTRY_PROFILES: Mapping[str, ScoringProfile] = MappingProxyType(_build_profiles("industry"))
+_DEFAULT_PROFILES = {kind: _build_profile(kind, "") for kind in ("business", "industry")}
+
+logger.info(f"🧮 SCORING PROFILES: {len(BUSINESS_PROFILES)} business, {len(INDUSTRY_PROFILES)} industry profiles compiled")
+
+
+def get_scoring_profile(business: Optional[str] = None, industry: Optional[str] = None) -> ScoringProfile:
+    """Profile for a business, else for an industry (same precedence as get_keywords_for_selection)"""
+    if business:
+        return BUSINESS_PROFILES.get(business) or _DEFAULT_PROFILES["business"]
+    if industry:
+        return INDUSTRY_PROFILES.get(industry) or _DEFAULT_PROFILES["industry"]
+    return _DEFAULT_PROFILES["business"]
+
+
+@lru_cache(maxsize=256)
+def get_rule_matcher(business_type: str, industry_type: Optional[str], problem_description: str,
+                     enhanced_keywords: Tuple[str, ...]) -> KeywordMatcher:
+    """Rule-based matcher compiled once per (business, industry, problem) on top of the business profile"""
+    business_keywords = ()
+    if industry_type:
+        business_keywords = get_scoring_profile(industry=industry_type).keywords
+    return get_scoring_profile(business=business_type).matcher.with_categories({
+        "business": business_keywords + enhanced_keywords,
+        "enhanced": enhanced_keywords,
+        "problem": [word for word in problem_description.lower().split() if len(word) > 3]
+    })
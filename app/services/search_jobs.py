@@ -0,0 +1,331 @@
+"""
+Background search jobs
+POST /search-jobs stores a SearchJob row and returns its id at once; the search
+itself runs as a background task (bounded by settings.search_job_workers per
+process) through SearchPipeline.stream_search, writing progress and partial leads
+to the job row after every subreddit. Polls read the row, so any worker can
+answer them. DELETE sets cancel_requested: the worker running the job sees it
+after the current subreddit (immediately when it runs in the same process),
+stops the remaining scrapes and marks the job cancelled without charging quota.
+The flag is checked once more right before quota is charged; after that the job
+completes. Each worker heartbeats its active jobs (updated_at), and active jobs
+whose worker stopped heartbeating (restart, crash) are marked failed.
+"""
+
+import asyncio
+import json
+import os
+import socket
+import uuid
+import logging
+from contextlib import aclosing
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+from app.core.config import settings
+from app.database import SessionLocal, SearchJob
+from app.services.search_pipeline import search_pipeline, load_user_limits, plan_search
+from app.utils.cost_calculator import get_posts_to_scrape
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ("queued", "running")
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+# ---------------------------------------------------------------------------
+# Job rows (blocking, run in the pipeline executor)
+# ---------------------------------------------------------------------------
+
+def _job_to_dict(job: SearchJob, include_leads: bool = True) -> Dict[str, Any]:
+    data = {
+        "job_id": job.id,
+        "status": job.status,
+        "request": json.loads(job.request_json),
+        "tier_info": json.loads(job.tier_info_json) if job.tier_info_json else None,
+        "progress": {
+            "subreddits_done": job.subreddits_done or 0,
+            "subreddits_total": job.subreddits_total or 0,
+            "posts_scanned": job.posts_scanned or 0,
+            "leads_found": job.leads_found or 0
+        },
+        "result": json.loads(job.result_json) if job.result_json else None,
+        "error": job.error,
+        "cancel_requested": bool(job.cancel_requested),
+        "worker_id": job.worker_id,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None
+    }
+    if include_leads:
+        data["leads"] = json.loads(job.leads_json) if job.leads_json else []
+    return data
+
+
+def create_job(request: Dict[str, Any]) -> str:
+    """Insert a queued job (and purge finished jobs past their retention)"""
+    db = SessionLocal()
+    try:
+        cutoff = datetime.utcnow() - timedelta(hours=settings.search_job_retention_hours)
+        db.query(SearchJob).filter(
+            SearchJob.status.notin_(ACTIVE_STATUSES), SearchJob.finished_at < cutoff
+        ).delete(synchronize_session=False)
+
+        job_id = uuid.uuid4().hex
+        db.add(SearchJob(id=job_id, user_id=request.get("user_id"), status="queued", request_json=json.dumps(request)))
+        db.commit()
+        return job_id
+    finally:
+        db.close()
+
+
+def update_job(job_id: str, **fields) -> Optional[bool]:
+    """Update a job row; returns its cancel_requested flag (None if the job is gone)"""
+    db = SessionLocal()
+    try:
+        job = db.query(SearchJob).filter(SearchJob.id == job_id).first()
+        if not job:
+            return None
+        for name, value in fields.items():
+            setattr(job, name, value)
+        db.commit()
+        return bool(job.cancel_requested)
+    finally:
+        db.close()
+
+
+def get_job(job_id: str, include_leads: bool = True) -> Optional[Dict[str, Any]]:
+    db = SessionLocal()
+    try:
+        job = db.query(SearchJob).filter(SearchJob.id == job_id).first()
+        return _job_to_dict(job, include_leads) if job else None
+    finally:
+        db.close()
+
+
+def is_cancel_requested(job_id: str) -> bool:
+    """True if the job was cancelled or deleted"""
+    db = SessionLocal()
+    try:
+        job = db.query(SearchJob).filter(SearchJob.id == job_id).first()
+        return job is None or bool(job.cancel_requested)
+    finally:
+        db.close()
+
+
+def touch_jobs(job_ids: Iterable[str]):
+    """Heartbeat: bump updated_at of jobs this worker is still running (or has queued)"""
+    job_ids = list(job_ids)
+    if not job_ids:
+        return
+    db = SessionLocal()
+    try:
+        db.query(SearchJob).filter(SearchJob.id.in_(job_ids), SearchJob.status.in_(ACTIVE_STATUSES)).update(
+            {SearchJob.updated_at: datetime.utcnow()}, synchronize_session=False
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def expire_stale_jobs() -> int:
+    """Mark active jobs without a heartbeat for settings.search_job_stale_seconds as failed"""
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        cutoff = now - timedelta(seconds=settings.search_job_stale_seconds)
+        expired = db.query(SearchJob).filter(
+            SearchJob.status.in_(ACTIVE_STATUSES), SearchJob.updated_at < cutoff
+        ).update({
+            SearchJob.status: "failed",
+            SearchJob.error: "Search worker stopped (restart or crash)",
+            SearchJob.finished_at: now
+        }, synchronize_session=False)
+        db.commit()
+        return expired
+    finally:
+        db.close()
+
+
+def cancel_or_delete_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """Request cancellation of an active job, or delete a finished one; returns the job as it was left"""
+    db = SessionLocal()
+    try:
+        job = db.query(SearchJob).filter(SearchJob.id == job_id).first()
+        if not job:
+            return None
+        if job.status in ACTIVE_STATUSES:
+            job.cancel_requested = True
+            db.commit()
+            return _job_to_dict(job, include_leads=False)
+        data = _job_to_dict(job, include_leads=False)
+        db.delete(job)
+        db.commit()
+        data["deleted"] = True
+        return data
+    finally:
+        db.close()
+
+
+# ---------------------------------------------------------------------------
+# Runner
+# ---------------------------------------------------------------------------
+
+class SearchJobManager:
+    """Runs search jobs as background tasks in this process (bounded by settings.search_job_workers)"""
+
+    def __init__(self):
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._recording: set = set()  # Jobs past the last cancel check (quota being charged)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.expired = 0
+
+    def start(self):
+        """Start the heartbeat / stale-job expiry loop (FastAPI startup hook)"""
+        if self._heartbeat_task and not self._heartbeat_task.done():
+            return
+        self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
+
+    async def _heartbeat_loop(self):
+        while True:
+            try:
+                await search_pipeline.run_blocking("jobs", touch_jobs, list(self._tasks))
+                expired = await search_pipeline.run_blocking("jobs", expire_stale_jobs)
+                if expired:
+                    self.expired += expired
+                    logger.warning(f"⚠️ SEARCH JOBS: Marked {expired} jobs of stopped workers as failed")
+            except Exception as e:
+                logger.warning(f"⚠️ SEARCH JOBS heartbeat failed: {e}")
+            await asyncio.sleep(settings.search_job_heartbeat_seconds)
+
+    async def submit(self, request: Dict[str, Any], reddit_service: Any, lead_filter: Any) -> str:
+        """Store the job and start it in the background; returns the job id"""
+        job_id = await search_pipeline.run_blocking("jobs", create_job, request)
+        self._tasks[job_id] = asyncio.create_task(self._run(job_id, request, reddit_service, lead_filter))
+        self._tasks[job_id].add_done_callback(lambda _: self._tasks.pop(job_id, None))
+        logger.info(f"📥 SEARCH JOB {job_id}: queued ({len(self._tasks)} jobs in this worker)")
+        return job_id
+
+    def cancel_local(self, job_id: str) -> bool:
+        """Cancel the job right away if this process runs it (other workers poll the flag)"""
+        task = self._tasks.get(job_id)
+        if task and not task.done() and job_id not in self._recording:
+            task.cancel()
+            return True
+        return False
+
+    async def _finish(self, job_id: str, status: str, **fields):
+        await search_pipeline.run_blocking("jobs", update_job, job_id, status=status, finished_at=datetime.utcnow(), **fields)
+        if status == "completed":
+            self.completed += 1
+        elif status == "cancelled":
+            self.cancelled += 1
+        else:
+            self.failed += 1
+        logger.info(f"🏁 SEARCH JOB {job_id}: {status}")
+
+    async def _before_record(self, job_id: str) -> bool:
+        """Last cancel check before quota is charged; past it the job can no longer be cancelled"""
+        if await search_pipeline.run_blocking("jobs", is_cancel_requested, job_id):
+            return False
+        self._recording.add(job_id)
+        return True
+
+    async def _run(self, job_id: str, request: Dict[str, Any], reddit_service: Any, lead_filter: Any):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(settings.search_job_workers)
+        try:
+            async with self._semaphore:
+                cancel_requested = await search_pipeline.run_blocking(
+                    "jobs", update_job, job_id, status="running", started_at=datetime.utcnow(), worker_id=WORKER_ID
+                )
+                if cancel_requested is None:
+                    return  # Deleted while queued
+                if cancel_requested:
+                    await self._finish(job_id, "cancelled")
+                    return
+
+                user_id, result_count = request.get("user_id"), request["result_count"]
+                business_type = request.get("business") or request.get("industry")
+                posts_needed = get_posts_to_scrape(result_count)
+
+                limit_error, results_remaining, posts_remaining = await search_pipeline.run_blocking(
+                    "limits", load_user_limits, user_id, result_count
+                )
+                if limit_error:
+                    await self._finish(job_id, "failed", error=limit_error)
+                    return
+                plan = await search_pipeline.run_blocking(
+                    "plan", plan_search, business_type, user_id, posts_needed, reddit_service, lead_filter
+                )
+
+                leads: List[Dict[str, Any]] = []
+                events = search_pipeline.stream_search(
+                    plan, request["problem_description"], result_count, user_id,
+                    posts_needed, results_remaining, posts_remaining,
+                    before_record=lambda: self._before_record(job_id)
+                )
+                async with aclosing(events):
+                    async for event, data in events:
+                        if event == "started":
+                            await search_pipeline.run_blocking(
+                                "jobs", update_job, job_id,
+                                tier_info_json=json.dumps(data["tier_info"]), subreddits_total=len(data["subreddits"])
+                            )
+                        elif event == "leads":
+                            leads.extend(data["leads"])
+                        elif event == "subreddit_done":
+                            cancel_requested = await search_pipeline.run_blocking(
+                                "jobs", update_job, job_id,
+                                leads_json=json.dumps(leads),
+                                subreddits_done=data["subreddits_done"],
+                                posts_scanned=data["posts_scanned"],
+                                leads_found=data["leads_found"]
+                            )
+                            if cancel_requested is not False:
+                                # Cancelled (or deleted) from another worker: closing the stream stops the scrape
+                                raise asyncio.CancelledError()
+                        elif event == "complete":
+                            by_permalink = {lead["permalink"]: lead for lead in leads}
+                            ranked = [by_permalink[permalink] for permalink in data["ranked_permalinks"] if permalink in by_permalink]
+                            await self._finish(job_id, "completed", leads_json=json.dumps(ranked), result_json=json.dumps(data))
+                        elif event == "error":
+                            await self._finish(job_id, "failed", error=data["detail"])
+        except asyncio.CancelledError:
+            # No "record" stage ran, so the user is not charged for a cancelled search
+            await self._finish(job_id, "cancelled", error="Server shutting down" if self._stopping else None)
+        except Exception as e:
+            logger.error(f"❌ SEARCH JOB {job_id} failed: {e}")
+            await self._finish(job_id, "failed", error=str(e))
+        finally:
+            self._recording.discard(job_id)
+
+    async def stop(self):
+        """Cancel this worker's jobs on application shutdown (they are marked cancelled)"""
+        self._stopping = True
+        if self._heartbeat_task and not self._heartbeat_task.done():
+            self._heartbeat_task.cancel()
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "worker_id": WORKER_ID,
+            "running_here": len(self._tasks),
+            "max_concurrent": settings.search_job_workers,
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "expired": self.expired
+        }
+
+
+# Global job manager for this worker process
+search_job_manager = SearchJobManager()
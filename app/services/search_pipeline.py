@@ -0,0 +1,510 @@
+"""
+Staged lead search pipeline
+search_leads used to run PRAW/requests calls, the scoring loops and synchronous
+SQLAlchemy inline in an async handler, so one slow search froze every request on
+the worker. The search is now a sequence of explicit stages:
+
+    limits -> plan -> fetch -> filter -> record
+
+(stream_search runs fetch -> filter per subreddit as each one arrives.)
+
+Blocking stages run in one bounded thread pool and each stage has its own
+concurrency limit (asyncio semaphore), so a burst of searches queues per stage
+instead of piling onto the event loop. Stages that touch the database open their
+own session. The handler only orchestrates.
+"""
+
+import asyncio
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, aclosing
+from dataclasses import dataclass
+from functools import partial
+from typing import List, Dict, Any, Optional, Tuple, Callable, Awaitable, AsyncIterator
+from app.core.config import settings
+from app.database import SessionLocal, User, SearchMetrics
+from app.utils.cost_calculator import validate_user_limits, get_posts_to_scrape
+from app.services.single_flight import SingleFlight
+from app.services.result_cache import result_cache
+
+logger = logging.getLogger(__name__)
+
+# Defaults for anonymous users
+DEFAULT_RESULTS_REMAINING = 150
+DEFAULT_POSTS_REMAINING = 2250
+
+
+def normalize_search_text(text: Optional[str]) -> str:
+    """Case- and whitespace-insensitive form of a business name or problem description"""
+    return " ".join((text or "").lower().split())
+
+
+def search_key(business_type: str, problem_description: str, tier: int, result_count: int) -> Tuple[str, str, int, int]:
+    """Identity of a search's shared work: identical keys scrape and score the same posts"""
+    return (normalize_search_text(business_type), normalize_search_text(problem_description), tier, result_count)
+
+
+def merge_ranked_leads(cached_leads: list, new_leads: list) -> list:
+    """Merge two ranked lead lists by relevance score (ties keep cached leads first), dropping duplicate permalinks"""
+    merged, seen = [], set()
+    for lead in sorted(cached_leads + new_leads, key=lambda lead: -(lead.ai_relevance_score or 0)):
+        if lead.permalink not in seen:
+            seen.add(lead.permalink)
+            merged.append(lead)
+    return merged
+
+
+@dataclass
+class SearchPlan:
+    """Output of the plan stage: tier selection plus the (shared) services used by later stages"""
+    business_type: str
+    request_number: int
+    tier_info: Dict[str, Any]
+    subreddits: List[str]
+    posts_per_sub: int
+    reddit_service: Any
+    lead_filter: Any
+
+
+@dataclass
+class FilteredSearch:
+    """Output of fetch + filter: the ranked leads and how they were obtained"""
+    leads: list
+    filter_metrics: Dict[str, Any]
+    posts_scraped: int
+    fetched_at: float  # When the posts were fetched from Reddit
+    shared: bool = False  # Joined an identical in-flight search
+    cached: bool = False  # Served from the result cache
+    stale: bool = False  # Cached past the soft TTL (a background refresh was started)
+    reused_posts: int = 0  # Posts whose scores came from a shallower cached search
+
+    @property
+    def age_hours(self) -> float:
+        return max(0.0, (time.time() - self.fetched_at) / 3600)
+
+
+# ---------------------------------------------------------------------------
+# Blocking stages (run in the pipeline executor)
+# ---------------------------------------------------------------------------
+
+def load_user_limits(user_id: Optional[str], result_count: int) -> Tuple[Optional[str], int, int]:
+    """Stage "limits": (error message or None, results remaining, posts remaining)"""
+    results_remaining, posts_remaining = DEFAULT_RESULTS_REMAINING, DEFAULT_POSTS_REMAINING
+    if not user_id:
+        return None, results_remaining, posts_remaining
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.id == int(user_id)).first()
+        if user:
+            # Validate user limits using cost calculator
+            is_valid, error_msg, _, remaining_results, remaining_posts = validate_user_limits(
+                user.results_used, user.posts_analyzed, result_count
+            )
+            if not is_valid:
+                return error_msg, results_remaining, posts_remaining
+            results_remaining, posts_remaining = remaining_results, remaining_posts
+    except (ValueError, TypeError):
+        # Invalid user_id format, continue as anonymous user
+        pass
+    finally:
+        db.close()
+    return None, results_remaining, posts_remaining
+
+
+def plan_search(business_type: str, user_id: Optional[str], posts_needed: int,
+                reddit_service: Any, lead_filter: Any) -> SearchPlan:
+    """Stage "plan": tier switching and subreddit selection (services are the shared container instances)"""
+    from app.services.tiered_subreddit_mapping import increment_user_request_count, get_tier_info
+
+    # Increment user request count for tier switching (business-specific counter)
+    tier_key = f"{user_id or 'anonymous'}_{business_type}"
+    request_number = increment_user_request_count(tier_key)
+    logger.info(f"🚀 SEARCH PLAN: Request #{request_number} for '{business_type}' (key: {tier_key})")
+
+    tier_info = get_tier_info(business_type, request_number)
+    subreddits = tier_info["subreddits"]
+    logger.info(f"Tiered Search: Searching in {len(subreddits)} subreddits: {subreddits} (Tier {tier_info['tier']})")
+
+    return SearchPlan(
+        business_type=business_type,
+        request_number=request_number,
+        tier_info=tier_info,
+        subreddits=subreddits,
+        posts_per_sub=max(1, posts_needed // len(subreddits)),  # Distribute posts across subreddits
+        reddit_service=reddit_service,
+        lead_filter=lead_filter
+    )
+
+
+def record_search(user_id: Optional[str], result_count: int, posts_needed: int, results_remaining: int,
+                  posts_remaining: int, metrics: Dict[str, Any]) -> Tuple[int, int]:
+    """Stage "record": usage deduction and the SearchMetrics row, returns (results remaining, posts remaining)"""
+    db = SessionLocal()
+    try:
+        if user_id:
+            try:
+                user = db.query(User).filter(User.id == int(user_id)).first()
+                if user:
+                    # Deduct what was REQUESTED, not what was returned
+                    user.results_used += result_count
+                    user.posts_analyzed += posts_needed
+                    db.commit()
+
+                    results_remaining = 150 - user.results_used
+                    posts_remaining = 2250 - user.posts_analyzed
+                    logger.info(f"Updated authenticated user {user.id} usage: {user.results_used}/150 results, {user.posts_analyzed}/2250 posts analyzed (deducted {result_count} requested results)")
+                else:
+                    # Anonymous user - frontend handles tracking
+                    logger.info(f"Anonymous user {user_id} - usage tracking handled by frontend")
+                    results_remaining, posts_remaining = DEFAULT_RESULTS_REMAINING, DEFAULT_POSTS_REMAINING
+            except (ValueError, TypeError):
+                logger.info(f"Invalid user ID format {user_id} - treating as anonymous")
+                results_remaining, posts_remaining = DEFAULT_RESULTS_REMAINING, DEFAULT_POSTS_REMAINING
+
+        try:
+            db.add(SearchMetrics(
+                user_id=int(user_id) if user_id and user_id.isdigit() else None,
+                user_session_id=user_id if not (user_id and user_id.isdigit()) else None,
+                **metrics
+            ))
+            db.commit()
+            logger.info(f"📊 Search metrics recorded: {metrics['result_count_returned']} results, {metrics['posts_analyzed']} posts, {metrics['tokens_used']} tokens, ${metrics['cost']:.4f}")
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Failed to record search metrics: {e}")
+            # Don't fail the search if metrics recording fails
+    finally:
+        db.close()
+    return results_remaining, posts_remaining
+
+
+# ---------------------------------------------------------------------------
+# Executor + per-stage limits
+# ---------------------------------------------------------------------------
+
+class SearchPipeline:
+    """Bounded executor for the blocking stages plus a concurrency limit per stage"""
+
+    def __init__(self):
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self.stats: Dict[str, Dict[str, Any]] = {}
+        # Identical concurrent searches share one fetch + filter
+        self.flights = SingleFlight("search coalescing")
+        # Background refreshes of stale cache entries, by search_key (at most one per key)
+        self._refreshes: Dict[Tuple[str, str, int, int], asyncio.Task] = {}
+        self.refreshes_started = 0
+        self.refreshes_skipped = 0
+        self.refreshes_failed = 0
+
+    def stage_limits(self) -> Dict[str, int]:
+        return {
+            "limits": settings.search_db_concurrency,
+            "plan": settings.search_db_concurrency,
+            "fetch": settings.search_fetch_concurrency,
+            "filter": settings.search_filter_concurrency,
+            "record": settings.search_db_concurrency,
+            "jobs": settings.search_db_concurrency,
+            "cache": settings.search_db_concurrency
+        }
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=settings.search_executor_workers, thread_name_prefix="search-stage"
+            )
+        return self._executor
+
+    def _semaphore(self, stage: str) -> asyncio.Semaphore:
+        if stage not in self._semaphores:
+            self._semaphores[stage] = asyncio.Semaphore(self.stage_limits().get(stage, settings.search_executor_workers))
+        return self._semaphores[stage]
+
+    def _stage_stats(self, stage: str) -> Dict[str, Any]:
+        return self.stats.setdefault(stage, {"runs": 0, "failures": 0, "active": 0, "waiting": 0, "total_ms": 0.0})
+
+    @asynccontextmanager
+    async def stage(self, stage: str):
+        """Hold one slot of a stage (for work that is neither a single call nor a coroutine, e.g. a stream)"""
+        stats = self._stage_stats(stage)
+        stats["waiting"] += 1
+        try:
+            await self._semaphore(stage).acquire()
+        finally:
+            stats["waiting"] -= 1
+        stats["active"] += 1
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            stats["failures"] += 1
+            raise
+        finally:
+            self._semaphore(stage).release()
+            stats["active"] -= 1
+            stats["runs"] += 1
+            stats["total_ms"] += (time.perf_counter() - started) * 1000
+
+    async def _run_stage(self, stage: str, run: Callable[[], Any]):
+        async with self.stage(stage):
+            return await run()
+
+    async def run_blocking(self, stage: str, fn: Callable, *args, **kwargs):
+        """Run a blocking stage in the executor (within the stage's concurrency limit)"""
+        loop = asyncio.get_running_loop()
+        return await self._run_stage(stage, lambda: loop.run_in_executor(self._get_executor(), partial(fn, *args, **kwargs)))
+
+    async def run_async(self, stage: str, fn: Callable, *args, **kwargs):
+        """Run an async stage on the event loop (within the stage's concurrency limit)"""
+        return await self._run_stage(stage, lambda: fn(*args, **kwargs))
+
+    async def fetch_and_filter(self, plan: SearchPlan, problem_description: str, result_count: int) -> FilteredSearch:
+        """
+        Stages "fetch" + "filter", served from the result cache when possible and otherwise
+        coalesced: concurrent searches with the same search_key await one computation, whose
+        result is cached. Usage accounting stays per request (record stage).
+
+        The cache holds one ranked lead list per query and tier, computed for some result
+        count (its depth): smaller requests are sliced from it, larger ones scrape at the new
+        depth but only score the posts the cached list has not seen (the deficit).
+
+        Stale-while-revalidate: a hit past the soft TTL is served as-is (with its true age)
+        and refreshes the entry in the background; past the hard TTL the search blocks.
+        """
+        tier = plan.tier_info["tier"]
+        cache_args = (problem_description, plan.business_type, "all_time")
+
+        async def compute(depth: int, reuse: Optional[Dict[str, Any]] = None) -> FilteredSearch:
+            """Scrape for `depth` results; with `reuse` (a cached entry), only score posts it has not seen"""
+            posts_per_sub = plan.posts_per_sub if depth == result_count else max(1, get_posts_to_scrape(depth) // len(plan.subreddits))
+            logger.info(f"🔄 Fetching fresh results from Reddit: {posts_per_sub} posts per sub from {len(plan.subreddits)} subreddits")
+            fetched_at = time.time()
+            posts = await self.run_async(
+                "fetch",
+                plan.reddit_service.fetch_posts_from_multiple_subreddits_async,
+                plan.subreddits,
+                query=problem_description,
+                limit_per_sub=posts_per_sub,  # Dynamic limit based on 15:1 ratio
+                time_range="all_time"  # Fixed time range for beta
+            )
+            logger.info(f"Fetched {len(posts)} total posts from Reddit")
+            scanned_ids = [post.get("id") for post in posts]
+            new_posts = posts
+            if reuse:
+                seen = set(reuse["scanned_ids"])
+                new_posts = [post for post in posts if post.get("id") not in seen]
+                scanned_ids = list(seen.union(scanned_ids))
+                logger.info(f"♻️ DEFICIT: scoring {len(new_posts)} new posts, reusing {len(posts) - len(new_posts)} already scored")
+            leads, filter_metrics = await self.run_blocking(
+                "filter", plan.lead_filter.filter_posts, new_posts, problem_description, plan.business_type,
+                request_number=plan.request_number
+            )
+            if reuse:
+                leads = merge_ranked_leads(reuse["leads"], leads)
+                filter_metrics = {**filter_metrics, "posts_reused": len(posts) - len(new_posts), "results_returned": len(leads)}
+                fetched_at = reuse["fetched_at"]  # Part of the list is as old as the reused entry
+            if settings.result_cache_enabled and leads:
+                value = {
+                    "leads": leads, "filter_metrics": filter_metrics, "posts_scraped": len(posts),
+                    "depth": depth, "scanned_ids": scanned_ids
+                }
+                age_hours = (time.time() - fetched_at) / 3600  # Entry is dated from the fetch, like the response timestamp
+                # Pickle + compress + write: a blocking stage like the others
+                await self.run_blocking("cache", result_cache.store_value, *cache_args, value, age_hours, tier=tier, depth=depth)
+            return FilteredSearch(
+                leads=leads, filter_metrics=filter_metrics, posts_scraped=len(posts), fetched_at=fetched_at,
+                reused_posts=len(posts) - len(new_posts)
+            )
+
+        reuse = None
+        if settings.result_cache_enabled:
+            cached = await self.run_blocking("cache", result_cache.lookup, *cache_args, tier=tier)
+            if cached:
+                value, age_hours, stale = cached
+                depth = value.get("depth", 0)
+                if depth >= result_count:
+                    if stale:
+                        self._start_refresh(search_key(plan.business_type, problem_description, tier, depth), partial(compute, depth))
+                    return FilteredSearch(
+                        leads=value["leads"][:result_count],
+                        filter_metrics={**value["filter_metrics"], "tokens_used": 0, "cost": 0.0,  # Nothing spent on a hit
+                                        "llm_cache_hits": 0, "tokens_saved": 0, "cost_saved": 0.0},
+                        posts_scraped=value["posts_scraped"],
+                        fetched_at=time.time() - age_hours * 3600,
+                        cached=True,
+                        stale=stale
+                    )
+                if not stale:
+                    # Too shallow for this request: only the deficit is scored
+                    reuse = {**value, "fetched_at": time.time() - age_hours * 3600}
+
+        key = search_key(plan.business_type, problem_description, tier, result_count)
+        result, shared = await self.flights.do(key, partial(compute, result_count, reuse))
+        if shared:
+            return FilteredSearch(result.leads, result.filter_metrics, result.posts_scraped, result.fetched_at, shared=True,
+                                  reused_posts=result.reused_posts)
+        return result
+
+    def _start_refresh(self, key: Tuple[str, str, int, int], compute: Callable[[], Any]):
+        """Refresh a stale entry in the background, at most once per key at a time"""
+        if key in self._refreshes or self.flights.in_flight(key):
+            # A refresh (or a blocking search) for this key is already running and will re-cache it
+            self.refreshes_skipped += 1
+            return
+        self.refreshes_started += 1
+        logger.info(f"♻️ STALE RESULTS: refreshing in the background ({len(self._refreshes) + 1} refreshes running)")
+        task = asyncio.create_task(self._refresh(key, compute))
+        self._refreshes[key] = task
+        task.add_done_callback(lambda _: self._refreshes.pop(key, None))
+
+    async def _refresh(self, key: Tuple[str, str, int, int], compute: Callable[[], Any]):
+        try:
+            # Through the single-flight, so a search that misses meanwhile joins this refresh
+            await self.flights.do(key, compute)
+        except Exception as e:
+            self.refreshes_failed += 1
+            logger.warning(f"⚠️ STALE RESULTS: background refresh failed, stale entry kept: {e}")
+
+    async def stream_search(self, plan: SearchPlan, problem_description: str, result_count: int, user_id: Optional[str],
+                            posts_needed: int, results_remaining: int, posts_remaining: int,
+                            before_record: Optional[Callable[[], Awaitable[bool]]] = None) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Fetch -> filter -> record as a stream of (event, data): started, leads (one scored batch
+        per subreddit, as soon as it arrives), subreddit_done (progress), then complete (final
+        ranking + metrics) or error. Shared by the streaming endpoint and background search jobs.
+        before_record is awaited right before quota is charged; if it returns False the search
+        is cancelled (CancelledError) without recording anything.
+        """
+        search_start_time = time.time()
+        posts_scanned = 0
+        subreddits_done = 0
+        all_leads = []
+        filter_totals = {"posts_analyzed": 0, "tokens_used": 0, "cost": 0.0, "model_used": "unknown",
+                         "llm_cache_hits": 0, "tokens_saved": 0, "cost_saved": 0.0}
+
+        yield "started", {"tier_info": plan.tier_info, "subreddits": plan.subreddits, "posts_needed": posts_needed}
+
+        try:
+            batches = plan.reddit_service.stream_posts_from_multiple_subreddits(
+                plan.subreddits,
+                query=problem_description,
+                limit_per_sub=plan.posts_per_sub,
+                time_range="all_time"  # Fixed time range for beta
+            )
+            # aclosing: a consumer that stops early (disconnect, job cancel) stops the remaining scrapes
+            async with aclosing(batches):
+                while True:
+                    # The fetch slot is held only while waiting for the next batch, not while it is
+                    # filtered or yielded, so a slow streaming client can't starve /search of fetch slots
+                    async with self.stage("fetch"):
+                        try:
+                            subreddit, batch = await anext(batches)
+                        except StopAsyncIteration:
+                            break
+                    subreddits_done += 1
+                    posts_scanned += len(batch)
+                    batch_leads = []
+                    if batch:
+                        # Score this subreddit's batch right away (thresholds are per post, so batches score independently)
+                        batch_leads, filter_metrics = await self.run_blocking(
+                            "filter", plan.lead_filter.filter_posts, batch, problem_description, plan.business_type,
+                            request_number=plan.request_number
+                        )
+                        filter_totals["posts_analyzed"] += filter_metrics.get("posts_analyzed", len(batch))
+                        filter_totals["tokens_used"] += filter_metrics.get("tokens_used", 0)
+                        filter_totals["cost"] += filter_metrics.get("cost", 0.0)
+                        for saved in ("llm_cache_hits", "tokens_saved", "cost_saved"):
+                            filter_totals[saved] += filter_metrics.get(saved, 0)
+                        filter_totals["model_used"] = filter_metrics.get("model_used", filter_totals["model_used"])
+                    all_leads.extend(batch_leads)
+
+                    if batch_leads:
+                        yield "leads", {"subreddit": subreddit, "leads": [lead.model_dump() for lead in batch_leads]}
+                    yield "subreddit_done", {
+                        "subreddit": subreddit,
+                        "posts": len(batch),
+                        "posts_scanned": posts_scanned,
+                        "leads_found": len(all_leads),
+                        "subreddits_done": subreddits_done,
+                        "subreddits_total": len(plan.subreddits)
+                    }
+
+            # Final ranking across subreddits, same order and cut as /search
+            ranked_leads = sorted(all_leads, key=lambda lead: -(lead.ai_relevance_score or 0))[:result_count]
+            posts_analyzed = filter_totals["posts_analyzed"] or posts_needed
+            metrics = {
+                "problem_description": problem_description,
+                "business_type": plan.business_type,
+                "result_count_requested": result_count,
+                "result_count_returned": len(ranked_leads),
+                "posts_scraped": posts_scanned,
+                "posts_analyzed": posts_analyzed,
+                "tokens_used": filter_totals["tokens_used"],
+                "cost": filter_totals["cost"],
+                "model_used": filter_totals["model_used"],
+                "search_duration_ms": int((time.time() - search_start_time) * 1000),
+                "llm_cache_hits": filter_totals["llm_cache_hits"],
+                "tokens_saved": filter_totals["tokens_saved"],
+                "cost_saved": filter_totals["cost_saved"]
+            }
+            if before_record is not None and not await before_record():
+                raise asyncio.CancelledError()  # Cancelled after the last progress check: don't charge
+            results_remaining, posts_remaining = await self.run_blocking(
+                "record", record_search, user_id, result_count, posts_needed, results_remaining, posts_remaining, metrics
+            )
+
+            yield "complete", {
+                "total_found": len(ranked_leads),
+                "ranked_permalinks": [lead.permalink for lead in ranked_leads],
+                "message": f"Found {len(ranked_leads)} high-quality leads for '{plan.business_type}' with problem: '{problem_description}' ({plan.tier_info['quality_note']})",
+                "timestamp": time.time(),
+                "tier_info": plan.tier_info,
+                "results_remaining": results_remaining,
+                "posts_remaining": posts_remaining,
+                "posts_analyzed": posts_analyzed,
+                "search_metrics": {
+                    "tokens_used": metrics["tokens_used"],
+                    "cost": round(metrics["cost"], 4),
+                    "model_used": metrics["model_used"],
+                    "search_duration_ms": metrics["search_duration_ms"],
+                    "posts_scraped": posts_scanned,
+                    "posts_analyzed": posts_analyzed
+                }
+            }
+        except Exception as e:
+            logger.error(f"Error in streaming lead search: {e}")
+            yield "error", {"detail": f"Internal server error: {str(e)}"}
+
+    def get_stats(self) -> Dict[str, Any]:
+        stages = {}
+        for stage, stats in self.stats.items():
+            stages[stage] = {
+                **stats,
+                "total_ms": round(stats["total_ms"], 1),
+                "avg_ms": round(stats["total_ms"] / stats["runs"], 1) if stats["runs"] else 0.0,
+                "limit": self.stage_limits().get(stage)
+            }
+        return {
+            "executor_workers": settings.search_executor_workers,
+            "stages": stages,
+            "coalescing": self.flights.get_stats(),
+            "stale_refreshes": {
+                "running": len(self._refreshes),
+                "started": self.refreshes_started,
+                "skipped": self.refreshes_skipped,
+                "failed": self.refreshes_failed
+            }
+        }
+
+    def shutdown(self):
+        """Stop the executor threads and pending background refreshes (app shutdown)"""
+        for task in list(self._refreshes.values()):
+            task.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# Global pipeline shared by all search requests
+search_pipeline = SearchPipeline()
@@ -7,7 +7,9 @@ import re
 import logging
 from typing import List, Dict, Any, Optional
 from app.models.lead import Lead
-from app.services.business_keywords import get_keywords_for_selection, calculate_business_relevance_score
+from app.services.business_keywords import get_keywords_for_selection
+from app.services.batch_scorer import BatchScorer
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
@@ -111,6 +113,27 @@ class SimpleLeadFilter:
         else:
             return "General Problem"
     
+    def calculate_scores(self, texts: List[str], business_keywords: List[str]) -> np.ndarray:
+        """
+        Overall scores for a batch of post texts (vectorized calculate_struggle_score +
+        calculate_business_relevance_score, combined with the original 0.6/0.4 weights)
+        """
+        scorer = BatchScorer({"struggle": self.struggle_indicators, "question": ["?"], "business": business_keywords}, lowercase=False)
+        hits = scorer.hits([text.lower() for text in texts])
+        
+        # 15 points per struggle indicator, 10 for asking a question, capped at 100
+        struggle_scores = np.minimum(100, scorer.weighted(hits, {"struggle": 15, "question": 10}))
+        
+        if business_keywords:
+            matches = scorer.counts(hits, "business")
+            match_percentage = (matches / len(business_keywords)) * 100
+            match_percentage = match_percentage + np.where(matches >= 3, 20, np.where(matches >= 2, 10, 0))
+            business_scores = np.minimum(100, match_percentage.astype(np.int64))
+        else:
+            business_scores = np.full(len(texts), 50)
+        
+        return ((struggle_scores * 0.6) + (business_scores * 0.4)).astype(np.int64)
+    
     def filter_posts(self, posts: List[Dict[str, Any]], user_input: str, business_type: Optional[str] = None, time_range: str = "all_time") -> List[Lead]:
         """
         Filter posts using simple, effective logic
@@ -132,14 +155,10 @@ class SimpleLeadFilter:
             
             filtered_leads = []
             
-            for post in posts:
-                # Calculate scores
-                struggle_score = self.calculate_struggle_score(post["text"])
-                business_score = calculate_business_relevance_score(post["text"], business_keywords) if business_keywords else 50
-                
-                # Combined score (weighted average) - original formula
-                overall_score = int((struggle_score * 0.6) + (business_score * 0.4))
-                
+            # Combined scores for the whole batch (weighted average) - original formula
+            overall_scores = self.calculate_scores([post["text"] for post in posts], business_keywords).tolist()
+            
+            for post, overall_score in zip(posts, overall_scores):
                 # Only include posts that meet the threshold
                 if overall_score >= ai_threshold:
                     logger.info(f"Simple Analysis - Post: {post['title'][:50]}... Score: {overall_score}")
@@ -0,0 +1,58 @@
+"""
+Request coalescing (single-flight)
+Identical searches that arrive while one is already running await that one
+computation instead of scraping and scoring the same posts again. The shared
+work runs as its own task, so a leader whose client disconnects does not cancel
+it for the followers; the entry is dropped as soon as the task finishes, so later
+searches start fresh.
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """At most one in-flight computation per key; concurrent callers share its result (or exception)"""
+
+    def __init__(self, name: str = "single-flight"):
+        self.name = name
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Run fn() once for all concurrent callers with this key; returns (result, shared)"""
+        task = self._inflight.get(key)
+        shared = task is not None
+        if shared:
+            self.followers += 1
+            logger.info(f"🤝 {self.name.upper()}: joined in-flight computation ({len(self._inflight)} in flight)")
+        else:
+            self.leaders += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        # shield: one caller going away must not cancel the computation for the others
+        return await asyncio.shield(task), shared
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._inflight
+
+    def _finished(self, key: Hashable, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled() and task.exception() is not None:
+            # Retrieved here so it is not reported as unhandled when every caller has gone away
+            logger.warning(f"⚠️ {self.name.upper()}: shared computation failed: {task.exception()}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        total = self.leaders + self.followers
+        return {
+            "in_flight": len(self._inflight),
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "coalesced_ratio": round(self.followers / total, 3) if total else 0.0
+        }
@@ -10,6 +10,7 @@ import logging
 from typing import List, Dict, Any
 from openai import OpenAI
 from dotenv import load_dotenv
+from app.services.llm_cache import llm_cache
 
 # Load environment variables
 load_dotenv()
@@ -93,7 +94,13 @@ Keep it under 150 words and focus on the business opportunity.
         """
         if not self.client or not posts:
             return [f"Post about {problem_description.lower()}" for _ in posts]
-        
+
+        cache_keys = [llm_cache.make_key("batch_summary", self.model, post, problem_description) for post in posts[:10]]
+        cached = llm_cache.get_all(cache_keys)
+        if cached is not None:
+            logger.info(f"💾 LLM CACHE: reused {len(cached)} summaries")
+            return [summary for summary, _, _ in cached]
+
         try:
             # Create a single prompt for all posts
             posts_text = ""
@@ -131,6 +138,10 @@ Keep each summary under 100 words and focus on the business opportunity.
                 summaries = json.loads(result)
                 if isinstance(summaries, list) and len(summaries) == len(posts[:10]):
                     logger.info(f"✅ Generated {len(summaries)} summaries in batch")
+                    tokens_used = response.usage.total_tokens if response.usage else 0
+                    for cache_key, summary in zip(cache_keys, summaries):
+                        # Same rate as OpenAIService._calculate_cost
+                        llm_cache.set(cache_key, summary, tokens_used // len(summaries), tokens_used / len(summaries) / 1000 * 0.00175)
                     return summaries
                 else:
                     raise ValueError("Invalid response format")
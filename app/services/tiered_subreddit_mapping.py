@@ -47,8 +47,9 @@ TIERED_SUBREDDIT_MAPPINGS: Dict[str, Dict[int, List[str]]] = {
     }
 }
 
-# In-memory storage for user request counts
-user_request_counts: Dict[str, int] = {}
+# User request counts live in the shared cache backend (persisted across workers and restarts)
+def _request_counter(user_id: str) -> str:
+    return f"requests:{user_id}"
 
 def get_tiered_subreddits(business_type: str, request_number: int) -> List[str]:
     """
@@ -79,23 +80,23 @@ def get_tiered_subreddits(business_type: str, request_number: int) -> List[str]:
 
 def get_user_request_count(user_id: str) -> int:
     """Get the current request count for a user"""
-    count = user_request_counts.get(user_id, 0)
+    from app.services.cache_backend import get_cache_backend
+    count = get_cache_backend().get_counter(_request_counter(user_id))
     logger.info(f"📊 GET COUNT: user_id='{user_id}' → count={count}")
     return count
 
 def increment_user_request_count(user_id: str) -> int:
     """Increment and return the request count for a user"""
-    current_count = user_request_counts.get(user_id, 0)
-    new_count = current_count + 1
-    user_request_counts[user_id] = new_count
+    from app.services.cache_backend import get_cache_backend
+    new_count = get_cache_backend().increment_counter(_request_counter(user_id))
+    current_count = new_count - 1
     logger.info(f"📈 INCREMENT COUNT: user_id='{user_id}' → {current_count} → {new_count}")
     return new_count
 
 def reset_user_request_count(user_id: str):
     """Reset the request count for a user"""
-    old_count = user_request_counts.get(user_id, 0)
-    if user_id in user_request_counts:
-        del user_request_counts[user_id]
+    from app.services.cache_backend import get_cache_backend
+    old_count = get_cache_backend().reset_counter(_request_counter(user_id))
     logger.info(f"🔄 RESET COUNT: user_id='{user_id}' → {old_count} → 0")
 
 def get_tier_info(business_type: str, request_number: int) -> Dict[str, any]: